@@ -1,17 +1,39 @@
-from .base import BaseAIProvider
-from .openai_provider import OpenAIProvider
-from .gemini_provider import GeminiProvider
-from .deepseek_provider import DeepSeekProvider
-from .qwen_provider import QwenProvider
-from .grok_provider import GrokProvider
-from .claude_provider import ClaudeProvider
+import importlib
 import os
 import logging
+from .base import BaseAIProvider
 from utils.settings import load_ai_models
 from utils.constants import DEFAULT_AI_MODEL
 
 logger = logging.getLogger(__name__)
 
+# 提供者名称 -> (模块, 类名)；各提供者的SDK（openai、google.generativeai、anthropic）较重，
+# 只在规则实际使用对应模型时才导入
+PROVIDERS = {
+    "openai": (".openai_provider", "OpenAIProvider"),
+    "gemini": (".gemini_provider", "GeminiProvider"),
+    "deepseek": (".deepseek_provider", "DeepSeekProvider"),
+    "qwen": (".qwen_provider", "QwenProvider"),
+    "grok": (".grok_provider", "GrokProvider"),
+    "claude": (".claude_provider", "ClaudeProvider"),
+}
+
+_PROVIDER_CLASSES = {class_name: (module, class_name) for module, class_name in PROVIDERS.values()}
+
+
+def _load_provider_class(module_name, class_name):
+    return getattr(importlib.import_module(module_name, __name__), class_name)
+
+
+def __getattr__(name):
+    """按需导入提供者类，保持 from ai import OpenAIProvider 等写法可用"""
+    if name in _PROVIDER_CLASSES:
+        provider_class = _load_provider_class(*_PROVIDER_CLASSES[name])
+        globals()[name] = provider_class
+        return provider_class
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 async def get_ai_provider(model=None):
     """获取AI提供者实例"""
     if not model:
@@ -23,18 +45,8 @@ async def get_ai_provider(model=None):
     
     for provider_name, models_list in providers_config.items():
         if model in models_list:
-            if provider_name == "openai":
-                provider = OpenAIProvider()
-            elif provider_name == "gemini":
-                provider = GeminiProvider()
-            elif provider_name == "deepseek":
-                provider = DeepSeekProvider()
-            elif provider_name == "qwen":
-                provider = QwenProvider()
-            elif provider_name == "grok":
-                provider = GrokProvider()
-            elif provider_name == "claude":
-                provider = ClaudeProvider()
+            if provider_name in PROVIDERS:
+                provider = _load_provider_class(*PROVIDERS[provider_name])()
             break
     
     if not provider:
@@ -52,4 +64,4 @@ __all__ = [
     'GrokProvider',
     'ClaudeProvider',
     'get_ai_provider'
-]
\ No newline at end of file
+]
@@ -12,7 +12,9 @@ import base64
 import os
 import io
 import mimetypes
-from .rate_limiter import global_rate_limiter
+from .rate_limiter import global_rate_limiter, DOWNLOAD, HISTORY, BULK
+from utils.media import media_file_exists, is_memory_file, get_media_file_name
+from utils.image_processor import image_processor, get_media_id
 
 logger = logging.getLogger(__name__)
 
@@ -49,22 +51,17 @@ class AIFilter(BaseFilter):
             
             if rule.enable_ai_upload_image:
                 if context.media_files:
+                    media_id = get_media_id(event.message) if len(context.media_files) == 1 else None
                     for file_path in context.media_files:
                         try:
-                            if not os.path.exists(file_path):
+                            if not media_file_exists(file_path):
                                 logger.warning(f"文件不存在: {file_path}")
                                 continue
                                 
-                            with open(file_path, 'rb') as f:
-                                file_content = f.read()
-                                
-                            mime_type = mimetypes.guess_type(file_path)[0] or "image/jpeg"
-                            
-                            image_files.append({
-                                "data": base64.b64encode(file_content).decode('utf-8'),
-                                "mime_type": mime_type
-                            })
-                            logger.info(f"已加载图片到内存，类型: {mime_type}，大小: {len(file_content) // 1024} KB")
+                            source = file_path.getvalue() if is_memory_file(file_path) else file_path
+                            image = await image_processor.prepare(source, name=get_media_file_name(file_path), media_id=media_id)
+                            image_files.append(image)
+                            logger.info(f"已加载图片到内存，类型: {image['mime_type']}，大小: {len(image['data']) * 3 // 4 // 1024} KB")
                         except Exception as e:
                             logger.error(f"读取文件到内存时出错: {str(e)}")
                             
@@ -76,23 +73,9 @@ class AIFilter(BaseFilter):
                     for msg in context.media_group_messages:
                         if msg.photo or (msg.document and hasattr(msg.document, 'mime_type') and msg.document.mime_type.startswith('image/')):
                             try:
-                                buffer = io.BytesIO()
-                                await global_rate_limiter.get_token()
-                                await msg.download_media(file=buffer)
-                                buffer.seek(0)
-                                content = buffer.read()
-                                
-                                mime_type = "image/jpeg"  # 默认类型
-                                if msg.photo:
-                                    mime_type = "image/jpeg"
-                                elif msg.document and hasattr(msg.document, 'mime_type'):
-                                    mime_type = msg.document.mime_type
-                                
-                                image_files.append({
-                                    "data": base64.b64encode(content).decode('utf-8'),
-                                    "mime_type": mime_type
-                                })
-                                logger.info(f"已下载媒体组图片到内存，类型: {mime_type}，大小: {len(content) // 1024} KB")
+                                image = await self._prepare_message_image(msg)
+                                image_files.append(image)
+                                logger.info(f"已下载媒体组图片到内存，类型: {image['mime_type']}，大小: {len(image['data']) * 3 // 4 // 1024} KB")
                             except Exception as e:
                                 logger.error(f"下载媒体组图片到内存时出错: {str(e)}")
                     
@@ -102,24 +85,10 @@ class AIFilter(BaseFilter):
                 elif event.message and event.message.media:
                     logger.info("检测到单条消息有媒体，下载到内存")
                     try:
-                        buffer = io.BytesIO()
-                        await global_rate_limiter.get_token()
-                        await event.message.download_media(file=buffer)
-                        buffer.seek(0)
-                        content = buffer.read()
-                        
-                        mime_type = "image/jpeg"  # 默认类型
-                        if hasattr(event.message.media, 'photo'):
-                            mime_type = "image/jpeg"
-                        elif hasattr(event.message.media, 'document') and hasattr(event.message.media.document, 'mime_type'):
-                            mime_type = event.message.media.document.mime_type
-                        
-                        image_files.append({
-                            "data": base64.b64encode(content).decode('utf-8'),
-                            "mime_type": mime_type
-                        })
+                        image = await self._prepare_message_image(event.message)
+                        image_files.append(image)
                         has_media_to_process = True
-                        logger.info(f"已下载单条消息媒体到内存，类型: {mime_type}，大小: {len(content) // 1024} KB")
+                        logger.info(f"已下载单条消息媒体到内存，类型: {image['mime_type']}，大小: {len(image['data']) * 3 // 4 // 1024} KB")
                     except Exception as e:
                         logger.error(f"下载单条消息媒体到内存时出错: {str(e)}")
             
@@ -147,6 +116,33 @@ class AIFilter(BaseFilter):
         finally:
             pass
 
+    async def _prepare_message_image(self, message):
+        """下载消息中的图片到内存并进行预处理，已处理过的媒体直接使用缓存
+
+        Args:
+            message: 消息对象
+
+        Returns:
+            dict: 包含base64编码数据和mime_type的字典
+        """
+        media_id = get_media_id(message)
+        cached = image_processor.get_cached(media_id)
+        if cached:
+            logger.info(f"使用缓存的图片处理结果: {media_id}")
+            return cached
+
+        buffer = io.BytesIO()
+        await global_rate_limiter.get_token(DOWNLOAD, client=message.client)
+        await message.download_media(file=buffer)
+
+        mime_type = "image/jpeg"  # 默认类型
+        if message.photo:
+            mime_type = "image/jpeg"
+        elif message.document and hasattr(message.document, 'mime_type'):
+            mime_type = message.document.mime_type
+
+        return await image_processor.prepare(buffer.getvalue(), mime_type=mime_type, media_id=media_id)
+
 
 async def _ai_handle(message: str, rule, image_files=None) -> str:
     """使用AI处理消息
@@ -163,21 +159,21 @@ async def _ai_handle(message: str, rule, image_files=None) -> str:
         if not rule.is_ai:
             logger.info("AI处理未开启，返回原始消息")
             return message
+        # 规则快照不可修改，默认值使用局部变量
+        ai_model = rule.ai_model or DEFAULT_AI_MODEL
         if not rule.ai_model:
-            rule.ai_model = DEFAULT_AI_MODEL
-            logger.info(f"使用默认AI模型: {rule.ai_model}")
+            logger.info(f"使用默认AI模型: {ai_model}")
         else:
-            logger.info(f"使用规则配置的AI模型: {rule.ai_model}")
+            logger.info(f"使用规则配置的AI模型: {ai_model}")
             
-        provider = await get_ai_provider(rule.ai_model)
+        provider = await get_ai_provider(ai_model)
         
         if not rule.ai_prompt:
-            rule.ai_prompt = DEFAULT_AI_PROMPT
             logger.info("使用默认AI提示词")
         else:
             logger.info("使用规则配置的AI提示词")
         
-        prompt = rule.ai_prompt
+        prompt = rule.ai_prompt or DEFAULT_AI_PROMPT
         if prompt:
             
             source_context_match = re.search(r'\{source_message_context:(\d+)\}', prompt)
@@ -227,23 +223,10 @@ async def _ai_handle(message: str, rule, image_files=None) -> str:
                 for img_file in image_files:
                     try:
                         logger.info("准备从文件读取图片")
-                        with open(img_file, "rb") as f:
-                            img_bytes = f.read()
-                            encoded_img = base64.b64encode(img_bytes).decode('utf-8')
-                            
-                            mime_type = "image/jpeg"  # 默认类型
-                            if str(img_file).lower().endswith(".png"):
-                                mime_type = "image/png"
-                            elif str(img_file).lower().endswith(".gif"):
-                                mime_type = "image/gif"
-                            elif str(img_file).lower().endswith(".webp"):
-                                mime_type = "image/webp"
-                                
-                            img_data.append({
-                                "data": encoded_img,
-                                "mime_type": mime_type
-                            })
-                            logger.info(f"已读取图片，类型: {mime_type}，大小: {len(img_bytes) // 1024} KB")
+                        source = img_file.getvalue() if is_memory_file(img_file) else img_file
+                        image = await image_processor.prepare(source, name=get_media_file_name(img_file))
+                        img_data.append(image)
+                        logger.info(f"已读取图片，类型: {image['mime_type']}，大小: {len(image['data']) * 3 // 4 // 1024} KB")
                     except Exception as e:
                         logger.error("读取图片文件时出错")
         
@@ -252,7 +235,7 @@ async def _ai_handle(message: str, rule, image_files=None) -> str:
         processed_text = await provider.process_message(
             message=message,
             prompt=prompt,
-            model=rule.ai_model,
+            model=ai_model,
             images=img_data if img_data else None
         )
         logger.info(f"AI处理完成: {processed_text}")
@@ -280,7 +263,7 @@ async def _get_chat_messages(client, chat_id, minutes=None, count=None, delay_se
         messages = []
         limit = count if count else 500  # 设置一个合理的默认值
         processed_count = 0
-        await global_rate_limiter.get_token()
+        await global_rate_limiter.get_token(HISTORY, client=client, priority=BULK)
         if minutes:
             
             end_time = datetime.now()
@@ -8,6 +8,9 @@ class BaseFilter(ABC):
     基础过滤器类，定义过滤器接口
     """
     
+    # 为True时，同一目标聊天的消息需按顺序经过该过滤器（有消息等待重试时排在其后）
+    ordered_delivery = False
+    
     def __init__(self, name=None):
         """
         初始化过滤器
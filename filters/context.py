@@ -38,6 +38,9 @@ class MessageContext:
         
         self.should_forward = True
         
+        # 去重过滤器预留的消息指纹，发送成功后写入数据库
+        self.dedup_fingerprint = None
+        
         self.is_media_group = event.message.grouped_id is not None
         self.media_group_id = event.message.grouped_id
         self.media_group_messages = []
@@ -50,6 +53,11 @@ class MessageContext:
         
         self.comment_link = None
         
+        self.target_peer = None
+        
+        # 发送队列中该消息的记录ID，重试时复用
+        self.outbox_id = None
+        
     def clone(self):
         """创建上下文的副本"""
         return copy.deepcopy(self) 
\ No newline at end of file
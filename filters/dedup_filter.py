@@ -0,0 +1,56 @@
+import logging
+from filters.base_filter import BaseFilter
+from enums.enums import HandleMode
+from managers.dedup_manager import dedup_manager
+
+logger = logging.getLogger(__name__)
+
+
+async def record_dedup(context):
+    """消息已送达，把预留的消息指纹写入数据库"""
+    if context.dedup_fingerprint is not None:
+        await dedup_manager.record(context.rule.target_chat_id, context.dedup_fingerprint)
+        context.dedup_fingerprint = None
+
+
+def release_dedup(context):
+    """消息没有送达，撤销预留的消息指纹"""
+    if context.dedup_fingerprint is not None:
+        dedup_manager.release(context.rule.target_chat_id, context.dedup_fingerprint)
+        context.dedup_fingerprint = None
+
+
+class DedupFilter(BaseFilter):
+    """
+    去重过滤器，丢弃时间窗口内已发往同一目标的重复或近似重复消息
+
+    放在媒体下载和AI处理之前，重复消息不会产生下载、AI调用和发送开销；
+    指纹在此预留，发送成功后才写入数据库，过滤器链未送达消息时撤销
+    """
+
+    async def _process(self, context):
+        """
+        检查消息指纹是否已在目标聊天的索引中
+
+        Args:
+            context: 消息上下文
+
+        Returns:
+            bool: 若消息不重复则返回True，否则返回False
+        """
+        rule = context.rule
+
+        if not rule.enable_dedup or rule.handle_mode == HandleMode.EDIT:
+            return True
+
+        is_duplicate, context.dedup_fingerprint = await dedup_manager.check(
+            rule.target_chat_id,
+            context.event.message,
+            context.original_message_text
+        )
+        if is_duplicate:
+            logger.info(f"[规则ID:{rule.id}] 消息 {context.event.message.id} 与目标聊天近期消息重复，跳过转发")
+            context.should_forward = False
+            return False
+
+        return True
@@ -1,6 +1,11 @@
 import logging
 from filters.base_filter import BaseFilter
 from filters.context import MessageContext
+from managers.temp_file_manager import temp_file_manager
+from managers.retry_queue_manager import retry_queue_manager
+from managers.outbox_manager import outbox_manager
+from filters.dedup_filter import release_dedup
+from telethon.errors import FloodWaitError
 
 logger = logging.getLogger(__name__)
 
@@ -42,16 +47,80 @@ class FilterChain:
         
         logger.info(f"开始过滤器链处理，共 {len(self.filters)} 个过滤器")
         
-        for filter_obj in self.filters:
-            try:
-                should_continue = await filter_obj.process(context)
-                if not should_continue:
-                    logger.info(f"过滤器 {filter_obj.name} 中断了处理链")
+        return await self.run(context)
+
+    async def run(self, context, start=0):
+        """
+        从指定过滤器开始处理消息上下文
+        
+        发送触发FloodWait，或同一目标聊天已有消息在等待重试时，
+        消息会连同剩余的过滤器一起交给重试队列，临时文件引用也随之转交。
+        
+        Args:
+            context: 消息上下文
+            start: 起始过滤器下标
+            
+        Returns:
+            bool: 表示处理是否成功
+        """
+        target_key = context.rule.target_chat_id
+        deferred = False
+        try:
+            for index in range(start, len(self.filters)):
+                filter_obj = self.filters[index]
+                try:
+                    if filter_obj.ordered_delivery and retry_queue_manager.has_pending(target_key, context):
+                        logger.info(f"目标聊天有消息在等待重试，消息排队到其后发送")
+                        deferred = retry_queue_manager.defer(target_key, 0, self, context, index, is_retry=False)
+                        return False
+                    should_continue = await filter_obj.process(context)
+                    if not should_continue:
+                        logger.info(f"过滤器 {filter_obj.name} 中断了处理链")
+                        return False
+                except FloodWaitError as e:
+                    logger.warning(f"过滤器 {filter_obj.name} 触发频率限制，{e.seconds} 秒后重试")
+                    context.errors.append(f"过滤器 {filter_obj.name} 频率限制: {e.seconds} 秒")
+                    deferred = retry_queue_manager.defer(target_key, e.seconds, self, context, index)
+                    if not deferred and context.outbox_id is not None:
+                        # 放弃重试，计入发送队列的失败次数，由后台任务继续补发
+                        await outbox_manager.mark_failed(context.outbox_id, f"FloodWait {e.seconds} 秒")
                     return False
-            except Exception as e:
-                logger.error(f"过滤器 {filter_obj.name} 处理出错: {str(e)}")
-                context.errors.append(f"过滤器 {filter_obj.name} 错误: {str(e)}")
-                return False
+                except Exception as e:
+                    logger.error(f"过滤器 {filter_obj.name} 处理出错: {str(e)}")
+                    context.errors.append(f"过滤器 {filter_obj.name} 错误: {str(e)}")
+                    return False
+            
+            logger.info("过滤器链处理完成")
+            return True
+        finally:
+            # 释放上下文持有的临时文件引用和未送达消息的指纹，进入重试队列时由重试任务继续持有
+            if not deferred:
+                temp_file_manager.release_all(context.media_files)
+                release_dedup(context)
+
+    def abandon(self, context, release_files=True):
+        """
+        丢弃重试队列中的消息，释放临时文件引用和预留的指纹，并放弃对发送队列记录的认领
+        
+        Args:
+            context: 消息上下文
+            release_files: 是否释放临时文件引用
+        """
+        if release_files:
+            temp_file_manager.release_all(context.media_files)
+        release_dedup(context)
+        if context.outbox_id is not None:
+            outbox_manager.forget(context.outbox_id)
+
+    async def resume(self, context, start):
+        """
+        重试时继续处理消息，规则快照不依赖数据库会话，可以直接继续处理
         
-        logger.info("过滤器链处理完成")
-        return True 
\ No newline at end of file
+        Args:
+            context: 消息上下文
+            start: 起始过滤器下标
+            
+        Returns:
+            bool: 表示处理是否成功
+        """
+        return await self.run(context, start)
@@ -6,7 +6,7 @@ from utils.constants import TEMP_DIR
 from utils.media import get_max_media_size
 
 from filters.base_filter import BaseFilter
-from .rate_limiter import global_rate_limiter
+from .rate_limiter import global_rate_limiter, HISTORY
 
 logger = logging.getLogger(__name__)
 
@@ -35,7 +35,7 @@ class InitFilter(BaseFilter):
                 # await asyncio.sleep(1)
                 
                 try:
-                    await global_rate_limiter.get_token()
+                    await global_rate_limiter.get_token(HISTORY, client=event.client)
                     async for message in event.client.iter_messages(
                         event.chat_id,
                         limit=20,
@@ -5,13 +5,12 @@ from utils.media import get_media_size
 from utils.constants import TEMP_DIR
 from filters.base_filter import BaseFilter
 from utils.media import get_max_media_size
+from utils.media import download_media_file, get_media_file_name
 from enums.enums import PreviewMode
-from models.models import MediaTypes
-from models.models import get_session
-from sqlalchemy import text
-from utils.common import get_db_ops
 from enums.enums import AddMode
-from .rate_limiter import global_rate_limiter
+from managers.rule_snapshot_manager import get_media_extension, MEDIA_TYPE_NAMES
+from .rate_limiter import global_rate_limiter, DOWNLOAD, HISTORY
+from managers.temp_file_manager import temp_file_manager
 logger = logging.getLogger(__name__)
 
 class MediaFilter(BaseFilter):
@@ -54,18 +53,12 @@ class MediaFilter(BaseFilter):
         
         await asyncio.sleep(1)
         
-        media_types = None
-        if rule.enable_media_type_filter:
-            session = get_session()
-            try:
-                media_types = session.query(MediaTypes).filter_by(rule_id=rule.id).first()
-            finally:
-                session.close()
+        media_policy = rule.media_policy
         
         total_media_count = 0  # 总媒体数量
         blocked_media_count = 0  # 被屏蔽的媒体数量
         try:
-            await global_rate_limiter.get_token()
+            await global_rate_limiter.get_token(HISTORY, client=event.client)
             async for message in event.client.iter_messages(
                 event.chat_id,
                 limit=20,
@@ -75,14 +68,14 @@ class MediaFilter(BaseFilter):
                 if message.grouped_id == event.message.grouped_id:
                     if message.media:
                         total_media_count += 1
-                        if rule.enable_media_type_filter and media_types and message.media:
-                            if await self._is_media_type_blocked(message.media, media_types):
+                        if rule.enable_media_type_filter and message.media:
+                            if await self._is_media_type_blocked(message.media, media_policy):
                                 logger.info(f'媒体类型被屏蔽，跳过消息 ID={message.id}')
                                 blocked_media_count += 1
                                 continue
                         
                         if rule.enable_extension_filter and message.media:
-                            if not await self._is_media_extension_allowed(rule, message.media):
+                            if not await self._is_media_extension_allowed(rule, message.media, media_policy):
                                 logger.info(f'媒体扩展名被屏蔽，跳过消息 ID={message.id}')
                                 blocked_media_count += 1
                                 continue
@@ -160,23 +153,19 @@ class MediaFilter(BaseFilter):
         )
 
         if has_media:
+            media_policy = rule.media_policy
             if rule.enable_media_type_filter:
-                session = get_session()
-                try:
-                    media_types = session.query(MediaTypes).filter_by(rule_id=rule.id).first()
-                    if media_types and await self._is_media_type_blocked(event.message.media, media_types):
-                        logger.info(f'媒体类型被屏蔽，跳过消息 ID={event.message.id}')
-                        if rule.media_allow_text:
-                            logger.info('媒体被屏蔽但允许文本通过')
-                            context.media_blocked = True  # 标记媒体被屏蔽
-                        else:
-                            context.should_forward = False
-                        return True
-                finally:
-                    session.close()
+                if await self._is_media_type_blocked(event.message.media, media_policy):
+                    logger.info(f'媒体类型被屏蔽，跳过消息 ID={event.message.id}')
+                    if rule.media_allow_text:
+                        logger.info('媒体被屏蔽但允许文本通过')
+                        context.media_blocked = True  # 标记媒体被屏蔽
+                    else:
+                        context.should_forward = False
+                    return True
             
             if rule.enable_extension_filter and event.message.media:
-                if not await self._is_media_extension_allowed(rule, event.message.media):
+                if not await self._is_media_extension_allowed(rule, event.message.media, media_policy):
                     logger.info(f'媒体扩展名被屏蔽，跳过消息 ID={event.message.id}')
                     if rule.media_allow_text:
                         logger.info('媒体被屏蔽但允许文本通过')
@@ -219,11 +208,11 @@ class MediaFilter(BaseFilter):
                 if rule.only_rss:
                     return True
                 try:
-                    await global_rate_limiter.get_token()
-                    file_path = await event.message.download_media(TEMP_DIR)
+                    await global_rate_limiter.get_token(DOWNLOAD, client=event.message.client)
+                    file_path = await download_media_file(event.message, TEMP_DIR)
                     if file_path:
-                        context.media_files.append(file_path)
-                        logger.info(f'媒体文件已下载到: {file_path}')
+                        context.media_files.append(temp_file_manager.track(file_path))
+                        logger.info(f'媒体文件已下载: {get_media_file_name(file_path)}')
                 except Exception as e:
                     logger.error(f'下载媒体文件时出错: {str(e)}')
                     context.errors.append(f"下载媒体文件错误: {str(e)}")
@@ -231,47 +220,31 @@ class MediaFilter(BaseFilter):
             context.is_pure_link_preview = True
             logger.info('这是一条纯链接预览消息')
             
-    async def _is_media_type_blocked(self, media, media_types):
+    async def _is_media_type_blocked(self, media, media_policy):
         """
         检查媒体类型是否被屏蔽
         
         Args:
             media: 媒体对象
-            media_types: MediaTypes对象
+            media_policy: 规则快照中的媒体过滤策略
             
         Returns:
             bool: 如果媒体类型被屏蔽返回True，否则返回False
         """
-        # 检查各种媒体类型
-        if getattr(media, 'photo', None) and media_types.photo:
-            logger.info('媒体类型为图片，已被屏蔽')
-            return True
-        
-        if getattr(media, 'document', None) and media_types.document:
-            logger.info('媒体类型为文档，已被屏蔽')
-            return True
-        
-        if getattr(media, 'video', None) and media_types.video:
-            logger.info('媒体类型为视频，已被屏蔽')
-            return True
-        
-        if getattr(media, 'audio', None) and media_types.audio:
-            logger.info('媒体类型为音频，已被屏蔽')
-            return True
-        
-        if getattr(media, 'voice', None) and media_types.voice:
-            logger.info('媒体类型为语音，已被屏蔽')
+        blocked_type = media_policy.blocked_type_of(media)
+        if blocked_type:
+            logger.info(f'媒体类型为{MEDIA_TYPE_NAMES[blocked_type]}，已被屏蔽')
             return True
-        
-        return False 
+        return False
     
-    async def _is_media_extension_allowed(self, rule, media):
+    async def _is_media_extension_allowed(self, rule, media, media_policy):
         """
         检查媒体扩展名是否被允许
         
         Args:
             rule: 转发规则
             media: 媒体对象
+            media_policy: 规则快照中的媒体过滤策略
             
         Returns:
             bool: 如果扩展名被允许返回True，否则返回False
@@ -279,53 +252,12 @@ class MediaFilter(BaseFilter):
         if not rule.enable_extension_filter:
             return True
             
-        file_name = None
-     
-        for attr in media.document.attributes:
-            if hasattr(attr, 'file_name'):
-                file_name = attr.file_name
-                break
-
-            
-        if not file_name:
+        extension = get_media_extension(media)
+        if extension is None:
             logger.info("无法获取文件名，无法判断扩展名")
             return True
-            
-        _, extension = os.path.splitext(file_name)
-        extension = extension.lstrip('.').lower()  # 移除点号并转为小写
         
-        if not extension:
-            logger.info(f"文件 {file_name} 没有扩展名")
-            extension = "无扩展名"
-        else:
-            logger.info(f"文件 {file_name} 的扩展名: {extension}")
-        
-        db_ops = await get_db_ops()
-        session = get_session()
-        allowed = True
-        try:
-            extensions = await db_ops.get_media_extensions(session, rule.id)
-            extension_list = [ext["extension"].lower() for ext in extensions]
-            
-            if rule.extension_filter_mode == AddMode.BLACKLIST:
-                if extension in extension_list:
-                    logger.info(f"扩展名 {extension} 在黑名单中，不允许")
-                    allowed = False
-                else:
-                    logger.info(f"扩展名 {extension} 不在黑名单中，允许")
-                    allowed = True
-            else:
-                if extension in extension_list:
-                    logger.info(f"扩展名 {extension} 在白名单中，允许")
-                    allowed = True
-                else:
-                    logger.info(f"扩展名 {extension} 不在白名单中，不允许")
-                    allowed = False
-        except Exception as e:
-            logger.error(f"检查媒体扩展名时出错: {str(e)}")
-            allowed = True  # 出错时默认允许
-        finally:
-            session.close()
-            
+        allowed = media_policy.is_extension_allowed(extension)
+        mode_name = "黑名单" if media_policy.extension_filter_mode == AddMode.BLACKLIST else "白名单"
+        logger.info(f"扩展名 {extension} {'允许' if allowed else '不允许'}（{mode_name}模式）")
         return allowed
-
@@ -1,6 +1,7 @@
 import logging
 from filters.filter_chain import FilterChain
 from filters.keyword_filter import KeywordFilter
+from filters.dedup_filter import DedupFilter
 from filters.replace_filter import ReplaceFilter
 from filters.ai_filter import AIFilter
 from filters.info_filter import InfoFilter
@@ -38,6 +39,8 @@ async def process_forward_rule(client, event, chat_id, rule):
     filter_chain.add_filter(DelayFilter())
     
     filter_chain.add_filter(KeywordFilter())
+
+    filter_chain.add_filter(DedupFilter())
     
     filter_chain.add_filter(ReplaceFilter())
 
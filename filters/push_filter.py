@@ -2,14 +2,15 @@ import logging
 import os
 import pytz
 import asyncio
-import apprise
 from datetime import datetime
 import traceback
 
 from filters.base_filter import BaseFilter
-from models.models import get_session, PushConfig
 from enums.enums import PreviewMode
-from .rate_limiter import global_rate_limiter
+from .rate_limiter import global_rate_limiter, DOWNLOAD
+from utils.media import download_media_file, media_file_exists, is_memory_file, get_media_file_name
+from utils.constants import TEMP_DIR
+from managers.temp_file_manager import temp_file_manager
 
 logger = logging.getLogger(__name__)
 
@@ -37,7 +38,6 @@ class PushFilter(BaseFilter):
             return True
         
         rule_id = rule.id
-        session = get_session()
         
  
         logger.info(f"推送过滤器开始处理 - 规则ID: {rule_id}")
@@ -49,10 +49,7 @@ class PushFilter(BaseFilter):
         processed_files = []
         
         try:
-            push_configs = session.query(PushConfig).filter(
-                PushConfig.rule_id == rule_id,
-                PushConfig.enable_push_channel == True
-            ).all()
+            push_configs = [config for config in rule.push_configs if config.enable_push_channel]
             
             if not push_configs:
                 logger.info(f'规则 {rule_id} 没有启用的推送配置，跳过推送')
@@ -74,17 +71,9 @@ class PushFilter(BaseFilter):
             context.errors.append(f"推送错误: {str(e)}")
             return False
         finally:
-            session.close()
-            
             if processed_files:
-                logger.info(f'清理已处理的媒体文件，共 {len(processed_files)} 个')
-                for file_path in processed_files:
-                    try:
-                        if os.path.exists(str(file_path)):
-                            os.remove(file_path)
-                            logger.info(f'删除已处理的媒体文件: {file_path}')
-                    except Exception as e:
-                        logger.error(f'删除媒体文件失败: {str(e)}')
+                # 上下文中的文件由过滤器链结束时统一释放
+                logger.info(f'已推送的媒体文件共 {len(processed_files)} 个')
     
     async def _push_media_group(self, context, push_configs):
         """推送媒体组消息"""
@@ -121,10 +110,10 @@ class PushFilter(BaseFilter):
                 need_cleanup = True
                 for message in context.media_group_messages:
                     if message.media:
-                        await global_rate_limiter.get_token()
-                        file_path = await message.download_media(os.path.join(os.getcwd(), 'temp'))
+                        await global_rate_limiter.get_token(DOWNLOAD, client=message.client)
+                        file_path = await download_media_file(message, TEMP_DIR)
                         if file_path:
-                            files.append(file_path)
+                            files.append(temp_file_manager.track(file_path))
                             logger.info(f'已下载媒体组文件: {file_path}')
             elif context.media_files:
                 logger.info(f'使用SenderFilter已下载的文件: {len(context.media_files)}个')
@@ -134,10 +123,10 @@ class PushFilter(BaseFilter):
                 need_cleanup = True
                 for message in context.media_group_messages:
                     if message.media:
-                        await global_rate_limiter.get_token()
-                        file_path = await message.download_media(os.path.join(os.getcwd(), 'temp'))
+                        await global_rate_limiter.get_token(DOWNLOAD, client=message.client)
+                        file_path = await download_media_file(message, TEMP_DIR)
                         if file_path:
-                            files.append(file_path)
+                            files.append(temp_file_manager.track(file_path))
                             logger.info(f'已下载媒体文件: {file_path}')
             
             if files:
@@ -163,7 +152,7 @@ class PushFilter(BaseFilter):
                 for config in push_configs:
                     send_mode = config.media_send_mode  # "Single" 或 "Multiple"
                     
-                    valid_files = [f for f in files if os.path.exists(str(f))]
+                    valid_files = [f for f in files if media_file_exists(f)]
                     if not valid_files:
                         continue
                     
@@ -201,14 +190,9 @@ class PushFilter(BaseFilter):
         finally:
             if need_cleanup:
                 for file_path in files:
-                    try:
-                        if os.path.exists(str(file_path)):
-                            os.remove(file_path)
-                            logger.info(f'删除临时文件: {file_path}')
-                            if file_path in processed_files:
-                                processed_files.remove(file_path)
-                    except Exception as e:
-                        logger.error(f'删除临时文件失败: {str(e)}')
+                    temp_file_manager.release(file_path)
+                    if file_path in processed_files:
+                        processed_files.remove(file_path)
             
             return processed_files
     
@@ -252,10 +236,10 @@ class PushFilter(BaseFilter):
             elif rule.enable_only_push and event.message and event.message.media:
                 logger.info(f'需要自己下载文件，开始下载单个媒体消息...')
                 need_cleanup = True
-                await global_rate_limiter.get_token()
-                file_path = await event.message.download_media(os.path.join(os.getcwd(), 'temp'))
+                await global_rate_limiter.get_token(DOWNLOAD, client=event.message.client)
+                file_path = await download_media_file(event.message, TEMP_DIR)
                 if file_path:
-                    files.append(file_path)
+                    files.append(temp_file_manager.track(file_path))
                     logger.info(f'已下载媒体文件: {file_path}')
             
             for file_path in files:
@@ -298,14 +282,9 @@ class PushFilter(BaseFilter):
         finally:
             if need_cleanup:
                 for file_path in files:
-                    try:
-                        if os.path.exists(str(file_path)):
-                            os.remove(file_path)
-                            logger.info(f'删除临时文件: {file_path}')
-                            if file_path in processed_files:
-                                processed_files.remove(file_path)
-                    except Exception as e:
-                        logger.error(f'删除临时文件失败: {str(e)}')
+                    temp_file_manager.release(file_path)
+                    if file_path in processed_files:
+                        processed_files.remove(file_path)
     
             return processed_files
     
@@ -336,7 +315,10 @@ class PushFilter(BaseFilter):
         if not body and not attachment and not all_attachments:
             logger.warning('没有内容可推送')
             return
-        
+
+        # apprise导入较慢，只在规则实际推送时导入
+        import apprise
+
         for config in push_configs:
             try:
                 apobj = apprise.Apprise()
@@ -353,14 +335,14 @@ class PushFilter(BaseFilter):
                     send_result = await asyncio.to_thread(
                         apobj.notify,
                         body=body or f"收到{len(all_attachments)}个媒体文件",
-                        attach=all_attachments
+                        attach=[self._to_attachment(f) for f in all_attachments]
                     )
-                elif attachment and os.path.exists(str(attachment)):
-                    logger.info(f'发送带单个附件的推送: {os.path.basename(str(attachment))}')
+                elif attachment and media_file_exists(attachment):
+                    logger.info(f'发送带单个附件的推送: {get_media_file_name(attachment)}')
                     send_result = await asyncio.to_thread(
                         apobj.notify,
                         body=body or " ",
-                        attach=attachment
+                        attach=self._to_attachment(attachment)
                     )
                 else:
                     logger.info('发送纯文本推送')
@@ -376,4 +358,11 @@ class PushFilter(BaseFilter):
                 
             except Exception as e:
                 logger.error(f'发送推送时出错: {str(e)}')
-                logger.error(traceback.format_exc())
\ No newline at end of file
+                logger.error(traceback.format_exc())
+
+    def _to_attachment(self, file):
+        """将媒体文件转换为apprise附件，内存缓冲区使用AttachMemory"""
+        if is_memory_file(file):
+            from apprise.attachment.memory import AttachMemory
+            return AttachMemory(content=file.getvalue(), name=get_media_file_name(file))
+        return file
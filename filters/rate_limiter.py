@@ -1,71 +1,461 @@
 import time
+import heapq
 import asyncio
 import logging
+from typing import Dict, List, Optional, Tuple
+from utils.constants import (
+    RATE_LIMIT_GLOBAL, RATE_LIMIT_CLIENT, RATE_LIMIT_CHAT,
+    RATE_LIMIT_SEND, RATE_LIMIT_DOWNLOAD, RATE_LIMIT_HISTORY, RATE_LIMIT_EDIT, RATE_LIMIT_DELETE
+)
 
 logger = logging.getLogger(__name__)
 
+# ==================== 方法类别 ====================
+SEND = 'send'
+DOWNLOAD = 'download'
+HISTORY = 'history'
+EDIT = 'edit'
+DELETE = 'delete'
+
+# ==================== 优先级 ====================
+# 数值越小越先获得令牌
+INTERACTIVE = 0  # 机器人命令、回调等交互操作
+REALTIME = 1     # 实时转发
+BULK = 2         # 总结、批量读取历史消息等后台任务
+
+PRIORITY_NAMES = {
+    INTERACTIVE: 'interactive',
+    REALTIME: 'realtime',
+    BULK: 'bulk',
+}
+
+# 每个目标聊天的桶数量超过该值时，清理已回满的空闲桶
+MAX_CHAT_BUCKETS = 1024
+
+# 触发FloodWait后速率减半，但不低于初始速率的该比例
+MIN_RATE_FACTOR = 0.1
+# 冻结结束后速率线性恢复，从0恢复到初始速率所需的秒数
+RATE_RECOVERY_SECONDS = 300
+
+# 等待时间直方图的上界（秒），最后一档为超过最大上界的等待
+WAIT_HISTOGRAM_BOUNDS = (0.1, 0.5, 1, 5, 30, 120)
+
+
+def parse_limit(value: str, name: str) -> Tuple[float, float]:
+    """解析 "突发容量,每秒令牌数" 格式的限速配置
+
+    Args:
+        value: 配置值
+        name: 环境变量名，用于错误提示
+
+    Raises:
+        ValueError: 格式错误、速率不大于0或容量小于1
+    """
+    try:
+        capacity, fill_rate = (float(part) for part in str(value).split(','))
+    except ValueError:
+        raise ValueError(f'{name} 格式错误: "{value}"，应为 "突发容量,每秒令牌数"')
+    if capacity < 1:
+        raise ValueError(f'{name} 的突发容量必须不小于1: "{value}"')
+    if fill_rate <= 0:
+        raise ValueError(f'{name} 的每秒令牌数必须大于0: "{value}"')
+    return capacity, fill_rate
+
+
+class WaitHistogram:
+    """获取令牌等待时间的累计直方图"""
+
+    def __init__(self, bounds=WAIT_HISTOGRAM_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        index = len(self.bounds)
+        for i, bound in enumerate(self.bounds):
+            if seconds <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self) -> dict:
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 3) if self.count else 0.0,
+            "max": round(self.max, 3),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
 class TokenBucketRateLimiter:
     """
     一个基于 asyncio 的令牌桶速率限制器实现。
     这个实现是异步安全的 (thread-safe for asyncio tasks)。
     """
-    def __init__(self, capacity: int, fill_rate: float):
+    def __init__(self, capacity: int, fill_rate: float, name: str = ''):
         """
         构造一个令牌桶。
 
         Args:
             capacity (int): 桶容量，即最大允许的突发请求数。
             fill_rate (float): 每秒向桶中填充多少个令牌。
+            name (str): 桶名称，用于统计。
         """
+        self.name = name
         self.capacity = float(capacity)
+        self.base_rate = float(fill_rate)
         self.fill_rate = float(fill_rate)
         self.tokens = float(capacity)  # 初始时桶是满的
-        self.last_fill_time = time.time()
-        self.lock = asyncio.Lock()  # 用于保证令牌操作的原子性
+        self.last_fill_time = time.monotonic()
+        self.frozen_until = 0.0
+        # 统计
+        self.acquired = 0
+        self.waited = 0
+        self.flood_waits = 0
+        self.wait_histogram = WaitHistogram()
 
     def _fill_tokens(self):
         """
         填充令牌。这是一个内部方法，在每次请求令牌时调用。
+        冻结期间不填充令牌，冻结结束后速率线性恢复到初始值（加性增）。
         """
-        now = time.time()
-        elapsed_time = now - self.last_fill_time
-        
+        now = time.monotonic()
+        if now < self.frozen_until:
+            self.last_fill_time = now
+            return
+        elapsed_time = now - max(self.last_fill_time, self.frozen_until)
+
         if elapsed_time > 0:
+            if self.fill_rate < self.base_rate:
+                self.fill_rate = min(self.base_rate, self.fill_rate + self.base_rate * elapsed_time / RATE_RECOVERY_SECONDS)
             new_tokens = elapsed_time * self.fill_rate
             self.tokens = min(self.capacity, self.tokens + new_tokens)
             self.last_fill_time = now
 
+    def wait_time(self) -> float:
+        """
+        填充令牌后返回获取一个令牌还需等待的秒数，0表示可以立即获取。
+        """
+        self._fill_tokens()
+        frozen_for = max(self.frozen_until - time.monotonic(), 0.0)
+        if self.tokens >= 1 and frozen_for <= 0:
+            return 0.0
+        return frozen_for + max(1 - self.tokens, 0.0) / self.fill_rate
+
+    def is_idle(self) -> bool:
+        """桶是否已回满"""
+        self._fill_tokens()
+        return self.tokens >= self.capacity and self.fill_rate >= self.base_rate
+
+    def freeze(self, seconds: float):
+        """
+        触发FloodWait后冻结桶并将速率减半（乘性减）。
+
+        Args:
+            seconds: Telegram要求等待的秒数
+        """
+        self._fill_tokens()
+        self.flood_waits += 1
+        self.frozen_until = max(self.frozen_until, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 0.0)
+        self.fill_rate = max(self.base_rate * MIN_RATE_FACTOR, self.fill_rate / 2)
+
+    def record_acquire(self, waited: float) -> None:
+        """记录一次令牌获取及其等待时间"""
+        self.acquired += 1
+        if waited > 0:
+            self.waited += 1
+        self.wait_histogram.observe(waited)
+
+    def get_stats(self, waiters: int = 0) -> dict:
+        """获取桶的当前状态与统计"""
+        self._fill_tokens()
+        return {
+            "capacity": self.capacity,
+            "fill_rate": round(self.fill_rate, 3),
+            "base_rate": self.base_rate,
+            "tokens": round(self.tokens, 2),
+            "frozen_for": round(max(self.frozen_until - time.monotonic(), 0.0), 1),
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "waiters": waiters,
+            "flood_waits": self.flood_waits,
+            "wait": self.wait_histogram.to_dict(),
+        }
+
     async def get_token(self):
         """
         异步获取一个令牌。如果桶中没有令牌，则会等待直到有令牌为止。
         如果成功获取令牌，则返回 True。
-        此方法是异步安全的。
         """
-        async with self.lock:
-            self._fill_tokens()  # 立即填充一次
-            
-            if self.tokens >= 1:
-                self.tokens -= 1
-                logger.debug("成功获取令牌，无需等待。")
-                return True
-            
-            time_to_wait = (1 - self.tokens) / self.fill_rate
-            wait_ms = time_to_wait + 0.01 
-            
-            logger.warning(f"触发API速率限制，需要等待 {wait_ms:.2f} 秒。")
-            await asyncio.sleep(wait_ms)
-            self._fill_tokens()
-            if self.tokens >= 1:
+        while True:
+            time_to_wait = self.wait_time()
+            if time_to_wait <= 0:
                 self.tokens -= 1
-                logger.debug("等待后成功获取令牌。")
+                self.record_acquire(0.0)
                 return True
-            logger.error("等待后仍然无法获取令牌，可能存在逻辑问题。")
-            return False # 在极罕见情况下，如果等待后仍然没有令牌
+            await asyncio.sleep(time_to_wait + 0.01)
+
+
+class HierarchicalRateLimiter:
+    """
+    分层令牌桶速率限制器。
+
+    每次调用需要同时从以下桶中各取一个令牌：
+    全局桶、客户端桶、客户端的方法类别桶（send/download/history/edit/delete），
+    以及传入chat_id时该客户端对目标聊天的桶。
+    所有桶都有令牌时才一次性扣除，任何一个桶不足都不会消耗其他桶的令牌。
+    """
+
+    def __init__(self, global_limit, client_limit, chat_limit, method_limits: Dict[str, Tuple[float, float]]):
+        """
+        Args:
+            global_limit: 全局桶 (容量, 每秒令牌数)
+            client_limit: 每个客户端的桶 (容量, 每秒令牌数)
+            chat_limit: 每个客户端对每个目标聊天的桶 (容量, 每秒令牌数)
+            method_limits: 方法类别到 (容量, 每秒令牌数) 的映射
+        """
+        self.client_limit = client_limit
+        self.chat_limit = chat_limit
+        self.method_limits = method_limits
+        self.global_bucket = TokenBucketRateLimiter(*global_limit, name='global')
+        self.client_buckets: Dict[str, TokenBucketRateLimiter] = {}
+        self.method_buckets: Dict[Tuple[str, str], TokenBucketRateLimiter] = {}
+        self.chat_buckets: Dict[Tuple[str, str], TokenBucketRateLimiter] = {}
+        self._client_names: Dict[int, str] = {}
+        self._waiters: List[tuple] = []
+        self._seq = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.flood_wait_count = 0
+        self.flood_wait_seconds = 0
+        self.flood_wait_max = 0
+        self.flood_waits_by_method: Dict[str, int] = {}
+        self.last_flood_wait_at: Optional[float] = None
+
+    def register_client(self, client, name: str) -> None:
+        """为客户端登记名称，同一名称的客户端共享客户端级别的桶"""
+        self._client_names[id(client)] = name
+
+    def _client_key(self, client) -> str:
+        if client is None:
+            return 'default'
+        return self._client_names.get(id(client), 'default')
+
+    def _chat_key(self, chat_id) -> str:
+        """统一目标聊天ID的格式，-100前缀与否视为同一个聊天"""
+        chat = str(chat_id)
+        if chat.startswith('-100'):
+            return chat[4:]
+        return chat.lstrip('-')
+
+    def _prune_chat_buckets(self) -> None:
+        idle = [key for key, bucket in self.chat_buckets.items() if bucket.is_idle()]
+        for key in idle:
+            del self.chat_buckets[key]
+
+    def _buckets_for(self, method: Optional[str], client, chat_id) -> List[TokenBucketRateLimiter]:
+        client_key = self._client_key(client)
+        buckets = [self.global_bucket]
+
+        bucket = self.client_buckets.get(client_key)
+        if bucket is None:
+            bucket = self.client_buckets[client_key] = TokenBucketRateLimiter(*self.client_limit, name=client_key)
+        buckets.append(bucket)
+
+        if method in self.method_limits:
+            key = (client_key, method)
+            bucket = self.method_buckets.get(key)
+            if bucket is None:
+                bucket = self.method_buckets[key] = TokenBucketRateLimiter(
+                    *self.method_limits[method], name=f"{client_key}:{method}"
+                )
+            buckets.append(bucket)
+
+        if chat_id is not None:
+            key = (client_key, self._chat_key(chat_id))
+            bucket = self.chat_buckets.get(key)
+            if bucket is None:
+                if len(self.chat_buckets) >= MAX_CHAT_BUCKETS:
+                    self._prune_chat_buckets()
+                bucket = self.chat_buckets[key] = TokenBucketRateLimiter(*self.chat_limit, name=f"{key[0]}:chat:{key[1]}")
+            buckets.append(bucket)
+
+        return buckets
+
+    def _grant(self, buckets: List[TokenBucketRateLimiter], enqueued_at: Optional[float] = None) -> float:
+        """
+        所有桶都有令牌时一次性扣除并返回0，否则不扣除并返回需要等待的秒数。
+
+        enqueued_at为排队开始的时间，用于统计等待时间，None表示未排队。
+        """
+        time_to_wait = max(bucket.wait_time() for bucket in buckets)
+        if time_to_wait <= 0:
+            waited = time.monotonic() - enqueued_at if enqueued_at is not None else 0.0
+            for bucket in buckets:
+                bucket.tokens -= 1
+                bucket.record_acquire(waited)
+        return time_to_wait
+
+    def _refund(self, buckets: List[TokenBucketRateLimiter]) -> None:
+        for bucket in buckets:
+            bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+
+    def _dispatch(self) -> None:
+        """
+        按优先级和到达顺序为等待者分配令牌。
+
+        排在前面但令牌不足的等待者只预留令牌不足的桶，后面的等待者只有在
+        不需要这些桶时才能越过它，这样既不会饿死前面的等待者，
+        也不会让某个目标聊天的限流阻塞其他目标。
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        reserved = set()
+        next_wait = None
+        pending = []
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)
+            priority, seq, buckets, future, enqueued_at = waiter
+            if future.done():
+                continue
+            if reserved.isdisjoint(map(id, buckets)):
+                time_to_wait = self._grant(buckets, enqueued_at)
+                if time_to_wait <= 0:
+                    future.set_result(True)
+                    continue
+                next_wait = time_to_wait if next_wait is None else min(next_wait, time_to_wait)
+                # 只预留令牌不足的桶，共用的全局桶和客户端桶有令牌时不阻塞其他等待者
+                reserved.update(id(bucket) for bucket in buckets if bucket.wait_time() > 0)
+            pending.append(waiter)
+
+        for waiter in pending:
+            heapq.heappush(self._waiters, waiter)
+        if pending and next_wait is not None:
+            self._timer = asyncio.get_running_loop().call_later(next_wait + 0.01, self._dispatch)
+
+    async def get_token(self, method: Optional[str] = None, client=None, chat_id=None, priority: int = REALTIME):
+        """
+        异步获取一次API调用所需的全部令牌，令牌不足时排队等待。
+
+        等待者按优先级排队，同一优先级内先到先得；等待期间不持有任何锁，
+        被取消的等待者会退出队列，已分配但未使用的令牌会退回。
+
+        Args:
+            method: 方法类别，SEND/DOWNLOAD/HISTORY/EDIT/DELETE，None表示只受全局和客户端限制
+            client: 发起调用的客户端
+            chat_id: 写操作的目标聊天ID
+            priority: 优先级，INTERACTIVE/REALTIME/BULK
+
+        Returns:
+            bool: 成功获取令牌返回True
+        """
+        buckets = self._buckets_for(method, client, chat_id)
+        if not self._waiters and self._grant(buckets) <= 0:
+            return True
+
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (priority, self._seq, buckets, future, time.monotonic()))
+        logger.debug(f"触发API速率限制 ({method or 'default'}, {self._client_key(client)}, {chat_id})，排队等待令牌，优先级: {PRIORITY_NAMES.get(priority, priority)}")
+        # 新等待者可能比当前定时器更早满足，立即调度一次
+        self._dispatch()
+
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._refund(buckets)
+            # 让排在后面、被本等待者预留阻塞的等待者重新调度
+            asyncio.get_running_loop().call_soon(self._dispatch)
+            raise
+
+    def report_flood_wait(self, seconds: int, method: Optional[str] = None, client=None, chat_id=None) -> None:
+        """
+        记录一次FloodWaitError，冻结最具体的相关桶并降低其速率。
+
+        传入chat_id时冻结该客户端对目标聊天的桶，否则冻结该客户端的方法类别桶，
+        都没有时冻结客户端桶。
+
+        Args:
+            seconds: FloodWaitError.seconds
+            method: 方法类别
+            client: 发起调用的客户端
+            chat_id: 目标聊天ID
+        """
+        buckets = self._buckets_for(method, client, chat_id)
+        bucket = buckets[-1]
+        bucket.freeze(seconds)
+
+        self.flood_wait_count += 1
+        self.flood_wait_seconds += seconds
+        self.flood_wait_max = max(self.flood_wait_max, seconds)
+        method_key = method or 'default'
+        self.flood_waits_by_method[method_key] = self.flood_waits_by_method.get(method_key, 0) + 1
+        self.last_flood_wait_at = time.time()
+        logger.warning(
+            f"触发FloodWait ({method_key}, {self._client_key(client)}, {chat_id})，冻结 {seconds} 秒，"
+            f"速率降至 {bucket.fill_rate:.2f}/秒"
+        )
+        self._dispatch()
+
+    def get_bucket_stats(self, include_idle_chats: bool = False) -> Dict[str, dict]:
+        """
+        获取每个桶的令牌、等待队列长度、获取次数、等待时间直方图和FloodWait次数。
+
+        Args:
+            include_idle_chats: 是否包含已回满且从未等待过的目标聊天桶
+        """
+        waiters: Dict[int, int] = {}
+        for waiter in self._waiters:
+            if not waiter[3].done():
+                for bucket in waiter[2]:
+                    waiters[id(bucket)] = waiters.get(id(bucket), 0) + 1
+
+        buckets = [self.global_bucket, *self.client_buckets.values(), *self.method_buckets.values()]
+        for bucket in self.chat_buckets.values():
+            if include_idle_chats or id(bucket) in waiters or bucket.waited or bucket.flood_waits or not bucket.is_idle():
+                buckets.append(bucket)
+        return {bucket.name: bucket.get_stats(waiters.get(id(bucket), 0)) for bucket in buckets}
+
+    def get_stats(self) -> dict:
+        """获取FloodWait统计与限速状态"""
+        now = time.monotonic()
+        throttled = {
+            f"{client_key}:{chat}": round(bucket.fill_rate, 2)
+            for (client_key, chat), bucket in self.chat_buckets.items()
+            if bucket.fill_rate < bucket.base_rate or bucket.frozen_until > now
+        }
+        return {
+            "flood_wait_count": self.flood_wait_count,
+            "flood_wait_seconds": self.flood_wait_seconds,
+            "flood_wait_max": self.flood_wait_max,
+            "flood_waits_by_method": dict(self.flood_waits_by_method),
+            "last_flood_wait_at": self.last_flood_wait_at,
+            "waiting": sum(1 for waiter in self._waiters if not waiter[3].done()),
+            "throttled_chats": throttled,
+            "chat_buckets": len(self.chat_buckets),
+            "buckets": self.get_bucket_stats(),
+        }
 
 # ==================== 全局单例 ====================
 # 在这里定义全局的速率限制器实例，以便在整个应用中共享。
-# 安全推荐值：容量为5，每秒填充3个令牌。
-# 这意味着允许最多5个API调用的突发，之后会以每秒3个调用的速率平滑处理。
-# 您可以根据实际情况和Telegram的限制调整这些值。
-global_rate_limiter = TokenBucketRateLimiter(5, 3)
-
+# 各级限制通过环境变量配置，格式为 "突发容量,每秒令牌数"。
+global_rate_limiter = HierarchicalRateLimiter(
+    global_limit=parse_limit(RATE_LIMIT_GLOBAL, 'RATE_LIMIT_GLOBAL'),
+    client_limit=parse_limit(RATE_LIMIT_CLIENT, 'RATE_LIMIT_CLIENT'),
+    chat_limit=parse_limit(RATE_LIMIT_CHAT, 'RATE_LIMIT_CHAT'),
+    method_limits={
+        SEND: parse_limit(RATE_LIMIT_SEND, 'RATE_LIMIT_SEND'),
+        DOWNLOAD: parse_limit(RATE_LIMIT_DOWNLOAD, 'RATE_LIMIT_DOWNLOAD'),
+        HISTORY: parse_limit(RATE_LIMIT_HISTORY, 'RATE_LIMIT_HISTORY'),
+        EDIT: parse_limit(RATE_LIMIT_EDIT, 'RATE_LIMIT_EDIT'),
+        DELETE: parse_limit(RATE_LIMIT_DELETE, 'RATE_LIMIT_DELETE'),
+    }
+)
@@ -8,14 +8,34 @@ from pathlib import Path
 from datetime import datetime
 import shutil
 from filters.base_filter import BaseFilter
+from filters.dedup_filter import record_dedup
 import uuid
 from utils.constants import TEMP_DIR, RSS_MEDIA_DIR, get_rule_media_dir,RSS_HOST,RSS_PORT,RSS_ENABLED
-from models.models import get_session
-from utils.common import get_db_ops
-from .rate_limiter import global_rate_limiter
+from utils.constants import RSS_INGEST_MODE, RSS_INGEST_RETRIES, RSS_INGEST_RETRY_DELAY
+from .rate_limiter import global_rate_limiter, DOWNLOAD, HISTORY
+from utils.media import get_media_file_name, is_memory_file
 
 logger = logging.getLogger(__name__)
 
+# HTTP写入方式下复用的连接，过滤器每条消息都会重新创建，连接在模块内共用
+_http_session = None
+
+
+def _get_http_session():
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+    return _http_session
+
+
+async def close_rss_http_session():
+    """关闭HTTP写入方式使用的连接"""
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
 class RSSFilter(BaseFilter):
     """
     RSS过滤器，用于将符合条件的消息添加到RSS订阅源中
@@ -50,20 +70,16 @@ class RSSFilter(BaseFilter):
         if not context.should_forward:
             return False
         
-        db_ops = await get_db_ops()
-        session = get_session()
-        rss_config = await db_ops.get_rss_config(session, context.rule.id)
+        rss_config = context.rule.rss_config
         logger.info(f"规则ID: {context.rule.id}")
         logger.info(f"RSS配置: {rss_config}")
 
         if rss_config is None:
             logger.error(f"找不到规则ID为 {context.rule.id} 的RSS配置，跳过RSS处理")
-            session.close()
             return True
         
         if not rss_config.enable_rss:
             logger.info(f"规则ID为 {context.rule.id} 的RSS未启用，跳过RSS处理")
-            session.close()
             return True
 
         if context.is_media_group:
@@ -102,6 +118,8 @@ class RSSFilter(BaseFilter):
                     success = await self._send_to_rss_service(rule.id, entry_data)
                     if success:
                         logger.info(f"成功将消息添加到规则 {rule.id} 的RSS订阅源")
+                        if rule.only_rss:
+                            await record_dedup(context)
                     else:
                         logger.error(f"无法将消息添加到规则 {rule.id} 的RSS订阅源")
                 else:
@@ -290,7 +308,7 @@ class RSSFilter(BaseFilter):
                 local_path = os.path.join(rule_media_path, file_name)
                 try:
                     if not os.path.exists(local_path):
-                        await global_rate_limiter.get_token()
+                        await global_rate_limiter.get_token(DOWNLOAD, client=message.client)
                         await message.download_media(local_path)
                         logger.info(f"下载媒体文件到: {local_path}")
                     
@@ -321,7 +339,7 @@ class RSSFilter(BaseFilter):
                 
                 try:
                     if not os.path.exists(local_path):
-                        await global_rate_limiter.get_token()
+                        await global_rate_limiter.get_token(DOWNLOAD, client=message.client)
                         await message.download_media(local_path)
                         logger.info(f"下载图片到: {local_path}")
                     
@@ -360,7 +378,7 @@ class RSSFilter(BaseFilter):
                 
                 try:
                     if not os.path.exists(local_path):
-                        await global_rate_limiter.get_token()
+                        await global_rate_limiter.get_token(DOWNLOAD, client=message.client)
                         await message.download_media(local_path)
                         logger.info(f"下载视频到: {local_path}")
                     
@@ -400,7 +418,7 @@ class RSSFilter(BaseFilter):
                 
                 try:
                     if not os.path.exists(local_path):
-                        await global_rate_limiter.get_token()
+                        await global_rate_limiter.get_token(DOWNLOAD, client=message.client)
                         await message.download_media(local_path)
                         logger.info(f"下载音频到: {local_path}")
                     
@@ -432,7 +450,7 @@ class RSSFilter(BaseFilter):
                 
                 try:
                     if not os.path.exists(local_path):
-                        await global_rate_limiter.get_token()
+                        await global_rate_limiter.get_token(DOWNLOAD, client=message.client)
                         await message.download_media(local_path)
                         logger.info(f"下载语音到: {local_path}")
                     
@@ -463,10 +481,15 @@ class RSSFilter(BaseFilter):
         return filename
     
     async def _send_to_rss_service(self, rule_id, entry_data):
-        """发送数据到RSS服务"""
+        """写入条目到RSS订阅源，失败时按间隔翻倍重试
+
+        默认直接在本进程中处理条目并写入共用的条目存储，写入事务提交即为送达；
+        RSS_INGEST_MODE=http 时通过RSS服务的HTTP接口写入，收到成功响应即为送达。
+
+        Returns:
+            bool: 是否已送达
+        """
         try:
-            url = f"{self.rss_base_url}/api/entries/{rule_id}/add"
-            
             debug_data = entry_data.copy()
             if "media" in debug_data:
                 media_files = []
@@ -478,21 +501,59 @@ class RSSFilter(BaseFilter):
                     else:
                         media_files.append(str(media))
                 debug_data["media"] = f"{len(debug_data['media'])} 个媒体文件: {', '.join(media_files)}"
-            logger.info(f"发送到RSS服务: {url}, 数据: {debug_data}")
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=entry_data) as response:
-                    response_text = await response.text()
-                    if response.status != 200:
-                        logger.error(f"发送到RSS服务失败: {response.status} - {response_text}")
-                        return False
-                    
-                    logger.info(f"成功发送到RSS服务, 规则ID: {rule_id}, 响应: {response_text}")
-                    return True
-                    
+            logger.info(f"写入RSS条目 ({RSS_INGEST_MODE}), 规则ID: {rule_id}, 数据: {debug_data}")
+
+            # 每次重试使用同一个条目ID，已写入的条目不会重复写入
+            entry_data = dict(entry_data, entry_id=entry_data.get("entry_id") or str(uuid.uuid4()))
+            if RSS_INGEST_MODE == 'http':
+                send = lambda: self._post_to_rss_service(rule_id, entry_data)
+            else:
+                send = lambda: self._write_entry(rule_id, entry_data)
+
+            for attempt in range(1, RSS_INGEST_RETRIES + 2):
+                try:
+                    if await send():
+                        logger.info(f"RSS条目已写入, 规则ID: {rule_id}")
+                        return True
+                except ValueError as e:
+                    # 条目数据无效，重试也不会成功
+                    logger.error(f"RSS条目数据无效, 规则ID: {rule_id}: {str(e)}")
+                    return False
+                except Exception as e:
+                    logger.warning(f"写入RSS条目出错, 规则ID: {rule_id}: {str(e)}")
+                if attempt > RSS_INGEST_RETRIES:
+                    break
+                delay = RSS_INGEST_RETRY_DELAY * 2 ** (attempt - 1)
+                logger.warning(f"写入RSS条目失败, 规则ID: {rule_id}, {delay} 秒后重试 ({attempt}/{RSS_INGEST_RETRIES})")
+                await asyncio.sleep(delay)
+
+            logger.error(f"写入RSS条目失败，已重试 {RSS_INGEST_RETRIES} 次, 规则ID: {rule_id}")
+            return False
+
         except Exception as e:
-            logger.error(f"发送到RSS服务时出错: {str(e)}")
+            logger.error(f"写入RSS条目时出错: {str(e)}")
             return False
+
+    async def _write_entry(self, rule_id, entry_data):
+        """在本进程中处理条目并写入条目存储，规则没有RSS配置时抛出ValueError"""
+        from rss.app.services.entry_service import build_entry
+        from rss.app.crud.entry import create_entry
+        entry = await build_entry(rule_id, dict(entry_data))
+        if entry is None:
+            raise ValueError("规则没有RSS配置")
+        return await create_entry(entry)
+
+    async def _post_to_rss_service(self, rule_id, entry_data):
+        """通过RSS服务的HTTP接口写入条目，服务端错误和连接错误可重试，请求数据错误抛出ValueError"""
+        url = f"{self.rss_base_url}/api/entries/{rule_id}/add"
+        async with _get_http_session().post(url, json=entry_data) as response:
+            response_text = await response.text()
+            if 400 <= response.status < 500:
+                raise ValueError(f"{response.status} - {response_text}")
+            if response.status != 200:
+                logger.error(f"发送到RSS服务失败: {response.status} - {response_text}")
+                return False
+            return True
     
     async def _process_media_group(self, context, rule):
         """处理媒体组消息"""
@@ -511,13 +572,18 @@ class RSSFilter(BaseFilter):
             if local_media_files:
                 for local_file in local_media_files:
                     try:
-                        media_type = mimetypes.guess_type(local_file)[0] or "application/octet-stream"
-                        filename = os.path.basename(local_file)
+                        filename = get_media_file_name(local_file)
+                        media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
                         
                         target_path = os.path.join(rule_media_path, filename)
                         if not os.path.exists(target_path):
-                            shutil.copy2(local_file, target_path)
-                            logger.info(f"复制媒体文件到: {target_path}")
+                            if is_memory_file(local_file):
+                                with open(target_path, 'wb') as f:
+                                    f.write(local_file.getvalue())
+                                logger.info(f"写入内存媒体文件到: {target_path}")
+                            else:
+                                shutil.copy2(local_file, target_path)
+                                logger.info(f"复制媒体文件到: {target_path}")
                         
                         file_size = os.path.getsize(target_path)
                         
@@ -566,19 +632,19 @@ class RSSFilter(BaseFilter):
                                         logger.info(f"媒体文件已存在，跳过下载: {local_path}")
                                     else:
                                         try:
-                                            await global_rate_limiter.get_token()
+                                            await global_rate_limiter.get_token(DOWNLOAD, client=msg.client)
                                             await msg.download_media(local_path)
                                             logger.info(f"直接下载图片到: {local_path}")
                                         except Exception as e:
                                             if "file reference has expired" in str(e):
                                                 logger.warning(f"文件引用已过期，尝试重新获取消息")
                                                 try:
-                                                    await global_rate_limiter.get_token()
+                                                    await global_rate_limiter.get_token(HISTORY, client=context.client)
                                                     refreshed_msg = await context.client.get_messages(
                                                         msg.chat_id, ids=msg.id
                                                     )
                                                     if refreshed_msg:
-                                                        await global_rate_limiter.get_token()
+                                                        await global_rate_limiter.get_token(DOWNLOAD, client=refreshed_msg.client)
                                                         await refreshed_msg.download_media(local_path)
                                                         logger.info(f"成功重新下载图片到: {local_path}")
                                                     else:
@@ -623,19 +689,19 @@ class RSSFilter(BaseFilter):
                                         logger.info(f"媒体文件已存在，跳过下载: {local_path}")
                                     else:
                                         try:
-                                            await global_rate_limiter.get_token()
+                                            await global_rate_limiter.get_token(DOWNLOAD, client=msg.client)
                                             await msg.download_media(local_path)
                                             logger.info(f"直接下载文档到: {local_path}")
                                         except Exception as e:
                                             if "file reference has expired" in str(e):
                                                 logger.warning(f"文件引用已过期，尝试重新获取消息")
                                                 try:
-                                                    await global_rate_limiter.get_token()
+                                                    await global_rate_limiter.get_token(HISTORY, client=context.client)
                                                     refreshed_msg = await context.client.get_messages(
                                                         msg.chat_id, ids=msg.id
                                                     )
                                                     if refreshed_msg:
-                                                        await global_rate_limiter.get_token()
+                                                        await global_rate_limiter.get_token(DOWNLOAD, client=refreshed_msg.client)
                                                         await refreshed_msg.download_media(local_path)
                                                         logger.info(f"成功重新下载文档到: {local_path}")
                                                     else:
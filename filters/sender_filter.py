@@ -2,8 +2,14 @@ import logging
 import os
 from filters.base_filter import BaseFilter
 from enums.enums import PreviewMode
-from telethon.errors import FloodWaitError
-from .rate_limiter import global_rate_limiter
+from telethon.errors import FloodWaitError, ChannelInvalidError, ChannelPrivateError, PeerIdInvalidError
+from .rate_limiter import global_rate_limiter, DOWNLOAD, SEND
+from utils.media import download_media_file, rewind_media_file
+from utils.constants import TEMP_DIR
+from managers.temp_file_manager import temp_file_manager
+from managers.outbox_manager import outbox_manager
+from filters.dedup_filter import record_dedup
+from managers.peer_cache_manager import peer_cache_manager
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +18,8 @@ class SenderFilter(BaseFilter):
     消息发送过滤器，用于发送处理后的消息
     """
     
+    ordered_delivery = True
+    
     async def _process(self, context):
         """
         发送处理后的消息
@@ -32,67 +40,93 @@ class SenderFilter(BaseFilter):
         
         if rule.enable_only_push:
             logger.info('只转发到推送配置，跳过发送')
+            await record_dedup(context)
             return True
             
         target_chat = rule.target_chat
-        target_chat_id = int(target_chat.telegram_chat_id)
         
-        try:
-            entity = None
-            try:
-                await global_rate_limiter.get_token()
-                entity = await client.get_entity(target_chat_id)
-                logger.info(f'成功获取目标聊天实体: {target_chat.name} (ID: {target_chat_id})')
-            except Exception as e1:
-                try:
-                    if not str(target_chat_id).startswith('-100'):
-                        super_group_id = int(f'-100{abs(target_chat_id)}')
-                        await global_rate_limiter.get_token()
-                        entity = await client.get_entity(super_group_id)
-                        target_chat_id = super_group_id  # 更新使用正确的ID
-                        logger.info(f'使用私有群组ID格式成功获取实体: {target_chat.name} (ID: {target_chat_id})')
-                except Exception as e2:
-                    try:
-                        if not str(target_chat_id).startswith('-'):
-                            group_id = int(f'-{abs(target_chat_id)}')
-                            await global_rate_limiter.get_token()
-                            entity = await client.get_entity(group_id)
-                            target_chat_id = group_id  # 更新使用正确的ID
-                            logger.info(f'使用常规群组ID格式成功获取实体: {target_chat.name} (ID: {target_chat_id})')
-                    except Exception as e3:
-                        logger.warning(f'无法获取目标聊天实体，尝试继续发送: {e1}, {e2}, {e3}')
-        except Exception as e:
-            logger.warning(f'获取目标聊天实体时出错: {str(e)}')
+        # 使用缓存的Peer，热路径上不需要调用API解析目标聊天
+        context.target_peer, target_chat_id = await peer_cache_manager.resolve(client, target_chat)
         
         parse_mode = rule.message_mode.value  # 使用枚举的值（字符串）
         logger.info(f'使用消息格式: {parse_mode}')
         
+        # 先写入持久化发送队列，进程重启后未发送的消息会被补发
+        link_preview = {
+            PreviewMode.ON: True,
+            PreviewMode.OFF: False,
+            PreviewMode.FOLLOW: event.message.media is not None
+        }[rule.is_preview]
+        # 发送的文本只生成一次，发送和写入发送队列使用同一份，补发的消息与直接发送的一致
+        text, link_preview = self._build_message(context, link_preview)
+        # 从重试队列继续处理时，消息已写入队列并由本任务认领
+        outbox_id = context.outbox_id
+        if outbox_id is None:
+            outbox_id = await outbox_manager.enqueue(context, target_chat_id, text, parse_mode, link_preview)
+            if outbox_id is None:
+                logger.info('该消息已发送过或正在发送，跳过重复发送')
+                return False
+            context.outbox_id = outbox_id
+        
         try:
             if context.is_media_group or (context.media_group_messages and context.skipped_media):
                 logger.info(f'准备发送媒体组消息')
-                await self._send_media_group(context, target_chat_id, parse_mode)
+                await self._send_media_group(context, target_chat_id, parse_mode, text, link_preview)
             elif context.media_files or context.skipped_media:
                 logger.info(f'准备发送单条媒体消息')
-                await self._send_single_media(context, target_chat_id, parse_mode)
+                await self._send_single_media(context, target_chat_id, parse_mode, text, link_preview)
             else:
                 logger.info(f'准备发送纯文本消息')
-                await self._send_text_message(context, target_chat_id, parse_mode)
+                await self._send_text_message(context, target_chat_id, parse_mode, text, link_preview)
                 
             logger.info(f'消息已发送到: {target_chat.name} ({target_chat_id})')
+            await outbox_manager.mark_sent(outbox_id, context.forwarded_messages)
+            await record_dedup(context)
             return True
         except FloodWaitError as e:
-            wait_time = e.seconds
-            logger.error(f'发送消息频率限制，需要等待 {wait_time} 秒')
-            context.errors.append(f"发送消息频率限制，需要等待 {wait_time} 秒")
+            logger.warning(f'发送消息频率限制，需要等待 {e.seconds} 秒，消息将进入重试队列')
+            global_rate_limiter.report_flood_wait(e.seconds, SEND, client=context.client, chat_id=target_chat_id)
+            raise
+        except (ChannelInvalidError, ChannelPrivateError, PeerIdInvalidError) as e:
+            logger.error(f'目标聊天不可用，已清除其Peer缓存: {str(e)}')
+            context.errors.append(f"发送消息错误: {str(e)}")
+            await peer_cache_manager.invalidate(client, target_chat.id)
+            await outbox_manager.mark_failed(outbox_id, str(e), permanent=isinstance(e, ChannelPrivateError))
             return False
         except Exception as e:
             logger.error(f'发送消息时出错: {str(e)}')
             context.errors.append(f"发送消息错误: {str(e)}")
+            await outbox_manager.mark_failed(outbox_id, str(e))
             return False
     
-    async def _send_media_group(self, context, target_chat_id, parse_mode):
+    def _build_message(self, context, link_preview):
+        """生成要发送的文本和链接预览设置，与发送时选择的分支一致
+
+        Returns:
+            tuple: (文本, 是否显示链接预览)
+        """
+        event = context.event
+        original_link = f"\n原始消息: https://t.me/c/{str(event.chat_id)[4:]}/{event.message.id}"
+
+        if context.is_media_group or (context.media_group_messages and context.skipped_media):
+            text = context.sender_info + context.message_text
+            for message, size, name in context.skipped_media:
+                text += f"\n\n⚠️ 媒体文件 {name if name else '未命名文件'} ({size}MB) 超过大小限制"
+            if context.skipped_media:
+                context.original_link = original_link
+            return text + context.time_info + context.original_link, link_preview
+
+        if context.skipped_media and not context.media_files:
+            # 媒体文件全部超过大小限制，仅发送文本和提示
+            file_size = context.skipped_media[0][1]
+            file_name = context.skipped_media[0][2]
+            text = (context.message_text or '') + f"\n\n⚠️ 媒体文件 {file_name} ({file_size}MB) 超过大小限制"
+            return context.sender_info + text + context.time_info + original_link, True
+
+        return context.sender_info + context.message_text + context.time_info + context.original_link, link_preview
+
+    async def _send_media_group(self, context, target_chat_id, parse_mode, caption_text, link_preview):
         """发送媒体组消息"""
-        rule = context.rule
         client = context.client
         event = context.event
         context.forwarded_messages = []
@@ -126,38 +160,29 @@ class SenderFilter(BaseFilter):
         try:
             for message in context.media_group_messages:
                 if message.media:
-                    await global_rate_limiter.get_token()
-                    file_path = await message.download_media(os.path.join(os.getcwd(), 'temp'))
+                    await global_rate_limiter.get_token(DOWNLOAD, client=message.client)
+                    file_path = await download_media_file(message, TEMP_DIR)
                     if file_path:
-                        files.append(file_path)
+                        files.append(temp_file_manager.track(file_path))
             
             if files:
                 if not hasattr(context, 'media_files') or context.media_files is None:
                     context.media_files = []
+                # 文件引用交由上下文持有，过滤器链结束时统一释放
                 context.media_files.extend(files)
-                logger.info(f'已将 {len(files)} 个下载的媒体文件路径保存到context.media_files')
-                
-                caption_text = context.sender_info + context.message_text
+                group_files, files = files, []
+                logger.info(f'已将 {len(group_files)} 个下载的媒体文件路径保存到context.media_files')
                 
-                for message, size, name in context.skipped_media:
-                    caption_text += f"\n\n⚠️ 媒体文件 {name if name else '未命名文件'} ({size}MB) 超过大小限制"
-                
-                if context.skipped_media:
-                    context.original_link = f"\n原始消息: https://t.me/c/{str(event.chat_id)[4:]}/{event.message.id}"
-                caption_text += context.time_info + context.original_link
-                await global_rate_limiter.get_token()
-                sent_messages = await client.send_file(
-                    target_chat_id,
-                    files,
-                    caption=caption_text,
-                    parse_mode=parse_mode,
-                    buttons=context.buttons,
-                    link_preview={
-                        PreviewMode.ON: True,
-                        PreviewMode.OFF: False,
-                        PreviewMode.FOLLOW: context.event.message.media is not None
-                    }[rule.is_preview]
-                )
+                await global_rate_limiter.get_token(SEND, client=client, chat_id=target_chat_id)
+                with temp_file_manager.hold(group_files) as held_files:
+                    sent_messages = await client.send_file(
+                        context.target_peer or target_chat_id,
+                        [rewind_media_file(f) for f in held_files],
+                        caption=caption_text,
+                        parse_mode=parse_mode,
+                        buttons=context.buttons,
+                        link_preview=link_preview
+                    )
                 if isinstance(sent_messages, list):
                     context.forwarded_messages = sent_messages
                 else:
@@ -168,42 +193,26 @@ class SenderFilter(BaseFilter):
             logger.error(f'发送媒体组消息时出错: {str(e)}')
             raise
         finally:
-            if not rule.enable_push:
-                for file_path in files:
-                    try:
-                        os.remove(file_path)
-                        logger.info(f'删除临时文件: {file_path}')
-                    except Exception as e:
-                        logger.error(f'删除临时文件失败: {str(e)}')
-            else:
-                logger.info(f'推送功能已启用，保留临时文件')
+            # 未交给上下文的文件（下载中途出错）直接释放
+            temp_file_manager.release_all(files)
     
-    async def _send_single_media(self, context, target_chat_id, parse_mode):
+    async def _send_single_media(self, context, target_chat_id, parse_mode, text, link_preview):
         """发送单条媒体消息"""
-        rule = context.rule
         client = context.client
-        event = context.event
+        context.forwarded_messages = []
         
         logger.info(f'发送单条媒体消息')
         
         if context.skipped_media and not context.media_files:
-            file_size = context.skipped_media[0][1]
-            file_name = context.skipped_media[0][2]
-            original_link = f"\n原始消息: https://t.me/c/{str(event.chat_id)[4:]}/{event.message.id}"
-            
-            text_to_send = context.message_text or ''
-            text_to_send += f"\n\n⚠️ 媒体文件 {file_name} ({file_size}MB) 超过大小限制"
-            text_to_send = context.sender_info + text_to_send + context.time_info
-            
-            text_to_send += original_link
-            await global_rate_limiter.get_token()
-            await client.send_message(
-                target_chat_id,
-                text_to_send,
+            await global_rate_limiter.get_token(SEND, client=client, chat_id=target_chat_id)
+            sent_message = await client.send_message(
+                context.target_peer or target_chat_id,
+                text,
                 parse_mode=parse_mode,
-                link_preview=True,
+                link_preview=link_preview,
                 buttons=context.buttons
             )
+            context.forwarded_messages = [sent_message]
             logger.info(f'媒体文件超过大小限制，仅转发文本')
             return
         
@@ -212,61 +221,38 @@ class SenderFilter(BaseFilter):
         
         for file_path in context.media_files:
             try:
-                caption = (
-                    context.sender_info + 
-                    context.message_text + 
-                    context.time_info + 
-                    context.original_link
-                )
-                await global_rate_limiter.get_token()
-                await client.send_file(
-                    target_chat_id,
-                    file_path,
-                    caption=caption,
-                    parse_mode=parse_mode,
-                    buttons=context.buttons,
-                    link_preview={
-                        PreviewMode.ON: True,
-                        PreviewMode.OFF: False,
-                        PreviewMode.FOLLOW: context.event.message.media is not None
-                    }[rule.is_preview]
-                )
+                await global_rate_limiter.get_token(SEND, client=client, chat_id=target_chat_id)
+                with temp_file_manager.hold([file_path]):
+                    sent_message = await client.send_file(
+                        context.target_peer or target_chat_id,
+                        rewind_media_file(file_path),
+                        caption=text,
+                        parse_mode=parse_mode,
+                        buttons=context.buttons,
+                        link_preview=link_preview
+                    )
+                context.forwarded_messages.append(sent_message)
                 logger.info(f'媒体消息已发送')
             except Exception as e:
                 logger.error(f'发送媒体消息时出错: {str(e)}')
                 raise
-            finally:
-                if not rule.enable_push:
-                    try:
-                        os.remove(file_path)
-                        logger.info(f'删除临时文件: {file_path}')
-                    except Exception as e:
-                        logger.error(f'删除临时文件失败: {str(e)}')
-                else:
-                    logger.info(f'推送功能已启用，保留临时文件: {file_path}')
     
-    async def _send_text_message(self, context, target_chat_id, parse_mode):
+    async def _send_text_message(self, context, target_chat_id, parse_mode, message_text, link_preview):
         """发送纯文本消息"""
-        rule = context.rule
         client = context.client
+        context.forwarded_messages = []
         
         if not context.message_text:
             logger.info('没有文本内容，不发送消息')
             return
-            
-        link_preview = {
-            PreviewMode.ON: True,
-            PreviewMode.OFF: False,
-            PreviewMode.FOLLOW: context.event.message.media is not None  # 跟随原消息
-        }[rule.is_preview]
         
-        message_text = context.sender_info + context.message_text + context.time_info + context.original_link
-        await global_rate_limiter.get_token()
-        await client.send_message(
-            target_chat_id,
+        await global_rate_limiter.get_token(SEND, client=client, chat_id=target_chat_id)
+        sent_message = await client.send_message(
+            context.target_peer or target_chat_id,
             str(message_text),
             parse_mode=parse_mode,
             link_preview=link_preview,
             buttons=context.buttons
         )
+        context.forwarded_messages = [sent_message]
         logger.info(f'{"带预览的" if link_preview else "无预览的"}文本消息已发送') 
\ No newline at end of file
@@ -112,6 +112,8 @@ async def handle_command(client, event):
         'cr': lambda: handle_copy_rule_command(event, 'copy_rule'),
         'changelog': lambda: handle_changelog_command(event),
         'cl': lambda: handle_changelog_command(event),
+        'status': lambda: handle_status_command(event),
+        'st': lambda: handle_status_command(event),
         'list_rule': lambda: handle_list_rule_command(event, command, parts),
         'lr': lambda: handle_list_rule_command(event, command, parts),
         'delete_rule': lambda: handle_delete_rule_command(event, command, parts),
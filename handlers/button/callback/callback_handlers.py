@@ -12,6 +12,7 @@ import aiohttp
 from utils.constants import RSS_HOST, RSS_PORT
 from utils.auto_delete import respond_and_delete,reply_and_delete
 from utils.common import check_and_clean_chats
+from managers.rule_snapshot_manager import rule_snapshot_manager
 from handlers.button.button_helpers import create_sync_rule_buttons,create_other_settings_buttons
 
 logger = logging.getLogger(__name__)
@@ -118,6 +119,7 @@ async def callback_delete(event, rule_id, session, message, data):
         
         # 提交规则删除的更改
         session.commit()
+        rule_snapshot_manager.invalidate(rule_id)
         
         # 尝试删除RSS服务中的相关数据
         try:
@@ -134,7 +136,7 @@ async def callback_delete(event, rule_id, session, message, data):
             # 不影响主要流程，继续执行
         
         # 使用通用方法检查并清理不再使用的聊天记录
-        deleted_chats = await check_and_clean_chats(session, rule_obj)
+        deleted_chats = await check_and_clean_chats(rule_obj)
         if deleted_chats > 0:
             logger.info(f"删除规则后清理了 {deleted_chats} 个未使用的聊天记录")
 
@@ -539,6 +541,9 @@ async def update_rule_setting(event, rule_id, session, message, field_name, conf
             session.commit()
             logger.info("所有同步更改已提交")
 
+        if setting_type == 'media':
+            invalidate_media_snapshot(session, rule)
+
         # 根据设置类型更新UI
         if setting_type == 'rule':
             await message.edit(
@@ -7,10 +7,18 @@ import logging
 from utils.common import get_media_settings_text, get_db_ops
 from models.models import get_session
 from models.db_operations import DBOperations
+from managers.rule_snapshot_manager import rule_snapshot_manager
 
 logger = logging.getLogger(__name__)
 
 
+def invalidate_media_snapshot(session, rule):
+    """使规则及其同步规则的媒体策略快照失效"""
+    rule_ids = [rule.id]
+    if rule.enable_sync:
+        rule_ids.extend(sync.sync_rule_id for sync in session.query(RuleSync).filter(RuleSync.rule_id == rule.id).all())
+    rule_snapshot_manager.invalidate(*rule_ids)
+
 
 async def callback_media_settings(event, rule_id, session, message, data):
     # 显示媒体设置页面
@@ -213,6 +221,8 @@ async def callback_toggle_media_type(event, rule_id, session, message, data):
                         logger.error(f"同步媒体类型到规则 {sync_rule_id} 时出错: {str(e)}")
                         continue
         
+        invalidate_media_snapshot(session, rule)
+        
         # 重新获取媒体类型设置
         success, _, media_types = await db_ops.get_media_types(session, rule.id)
         
@@ -365,6 +375,8 @@ async def callback_toggle_media_extension(event, rule_id, session, message, data
             else:
                 await event.answer(f"添加扩展名失败: {msg}")
         
+        invalidate_media_snapshot(session, rule)
+        
         # 更新界面，使用之前获取的页码
         await event.edit("请选择要过滤的媒体扩展名：", buttons=await create_media_extensions_buttons(rule_id, page=current_page))
         
@@ -6,6 +6,8 @@ from telethon.tl import types
 
 from handlers.button.button_helpers import create_media_size_buttons,create_media_settings_buttons,create_media_types_buttons,create_media_extensions_buttons
 from models.models import ForwardRule, MediaTypes, MediaExtensions, RuleSync, Keyword, ReplaceRule
+from managers.rule_snapshot_manager import rule_snapshot_manager
+from models.rule_copy import copy_rule, COPY_KEYWORDS, COPY_REGEX_KEYWORDS, COPY_REPLACE_RULES
 from enums.enums import AddMode
 import logging
 from utils.common import get_media_settings_text, get_db_ops
@@ -166,180 +168,29 @@ async def callback_perform_copy_rule(event, rule_id_data, session, message, data
         source_rule_id = int(parts[0])
         target_rule_id = int(parts[1])
 
-        # 获取源规则和目标规则
-        source_rule = session.query(ForwardRule).get(source_rule_id)
-        target_rule = session.query(ForwardRule).get(target_rule_id)
-
-        if not source_rule or not target_rule:
-            await event.answer("源规则或目标规则不存在")
-            return
-
-        if source_rule.id == target_rule.id:
+        if source_rule_id == target_rule_id:
             await event.answer('不能复制规则到自身')
             return
 
-        # 记录复制的各个部分成功数量
-        keywords_normal_success = 0
-        keywords_normal_skip = 0
-        keywords_regex_success = 0
-        keywords_regex_skip = 0
-        replace_rules_success = 0
-        replace_rules_skip = 0
-        media_extensions_success = 0
-        media_extensions_skip = 0
-        rule_syncs_success = 0
-        rule_syncs_skip = 0
-
-        # 复制普通关键字
-        for keyword in source_rule.keywords:
-            if not keyword.is_regex:  # 普通关键字
-                # 检查是否已存在
-                exists = any(not k.is_regex and k.keyword == keyword.keyword and k.is_blacklist == keyword.is_blacklist
-                           for k in target_rule.keywords)
-                if not exists:
-                    new_keyword = Keyword(
-                        rule_id=target_rule.id,
-                        keyword=keyword.keyword,
-                        is_regex=False,
-                        is_blacklist=keyword.is_blacklist
-                    )
-                    session.add(new_keyword)
-                    keywords_normal_success += 1
-                else:
-                    keywords_normal_skip += 1
-
-        # 复制正则关键字
-        for keyword in source_rule.keywords:
-            if keyword.is_regex:  # 正则关键字
-                # 检查是否已存在
-                exists = any(k.is_regex and k.keyword == keyword.keyword and k.is_blacklist == keyword.is_blacklist
-                           for k in target_rule.keywords)
-                if not exists:
-                    new_keyword = Keyword(
-                        rule_id=target_rule.id,
-                        keyword=keyword.keyword,
-                        is_regex=True,
-                        is_blacklist=keyword.is_blacklist
-                    )
-                    session.add(new_keyword)
-                    keywords_regex_success += 1
-                else:
-                    keywords_regex_skip += 1
-
-        # 复制替换规则
-        for replace_rule in source_rule.replace_rules:
-            # 检查是否已存在
-            exists = any(r.pattern == replace_rule.pattern and r.content == replace_rule.content
-                         for r in target_rule.replace_rules)
-            if not exists:
-                new_rule = ReplaceRule(
-                    rule_id=target_rule.id,
-                    pattern=replace_rule.pattern,
-                    content=replace_rule.content
-                )
-                session.add(new_rule)
-                replace_rules_success += 1
-            else:
-                replace_rules_skip += 1
-
-        # 复制媒体扩展名设置
-        if hasattr(source_rule, 'media_extensions') and source_rule.media_extensions:
-            for extension in source_rule.media_extensions:
-                # 检查是否已存在
-                exists = any(e.extension == extension.extension for e in target_rule.media_extensions)
-                if not exists:
-                    new_extension = MediaExtensions(
-                        rule_id=target_rule.id,
-                        extension=extension.extension
-                    )
-                    session.add(new_extension)
-                    media_extensions_success += 1
-                else:
-                    media_extensions_skip += 1
-
-        # 复制媒体类型设置
-        if hasattr(source_rule, 'media_types') and source_rule.media_types:
-            target_media_types = session.query(MediaTypes).filter_by(rule_id=target_rule.id).first()
-
-            if not target_media_types:
-                # 如果目标规则没有媒体类型设置，创建新的
-                target_media_types = MediaTypes(rule_id=target_rule.id)
-
-                # 使用inspect自动复制所有字段（除了id和rule_id）
-                media_inspector = inspect(MediaTypes)
-                for column in media_inspector.columns:
-                    column_name = column.key
-                    if column_name not in ['id', 'rule_id']:
-                        setattr(target_media_types, column_name, getattr(source_rule.media_types, column_name))
-
-                session.add(target_media_types)
-            else:
-                # 如果已有设置，更新现有设置
-                # 使用inspect自动复制所有字段（除了id和rule_id）
-                media_inspector = inspect(MediaTypes)
-                for column in media_inspector.columns:
-                    column_name = column.key
-                    if column_name not in ['id', 'rule_id']:
-                        setattr(target_media_types, column_name, getattr(source_rule.media_types, column_name))
-
-        # 复制规则同步表数据
-        # 检查源规则是否有同步关系
-        if hasattr(source_rule, 'rule_syncs') and source_rule.rule_syncs:
-            for sync in source_rule.rule_syncs:
-                # 检查是否已存在
-                exists = any(s.sync_rule_id == sync.sync_rule_id for s in target_rule.rule_syncs)
-                if not exists:
-                    # 确保不会创建自引用的同步关系
-                    if sync.sync_rule_id != target_rule.id:
-                        new_sync = RuleSync(
-                            rule_id=target_rule.id,
-                            sync_rule_id=sync.sync_rule_id
-                        )
-                        session.add(new_sync)
-                        rule_syncs_success += 1
-
-                        # 启用目标规则的同步功能
-                        if rule_syncs_success > 0:
-                            target_rule.enable_sync = True
-                else:
-                    rule_syncs_skip += 1
-
-        # 复制规则设置
-        # 保存目标规则的原始关联
-        original_source_chat_id = target_rule.source_chat_id
-        original_target_chat_id = target_rule.target_chat_id
-
-        # 获取ForwardRule模型的所有字段
-        inspector = inspect(ForwardRule)
-        for column in inspector.columns:
-            column_name = column.key
-            if column_name not in ['id', 'source_chat_id', 'target_chat_id', 'source_chat', 'target_chat',
-                                  'keywords', 'replace_rules', 'media_types']:
-                # 获取源规则的值并设置到目标规则
-                value = getattr(source_rule, column_name)
-                setattr(target_rule, column_name, value)
-
-        # 恢复目标规则的原始关联
-        target_rule.source_chat_id = original_source_chat_id
-        target_rule.target_chat_id = original_target_chat_id
-
-        # 保存更改
-        session.commit()
+        # 在数据库线程中用集合语句复制全部内容，同一个事务中提交
+        try:
+            result = await copy_rule(source_rule_id, [target_rule_id])
+        except ValueError:
+            result = None
+        if not result or not result.target_rule_ids:
+            await event.answer("源规则或目标规则不存在")
+            return
+        rule_snapshot_manager.invalidate(target_rule_id)
 
         # 构建消息内容
         result_message = (
-            f"✅ 已从规则 `{source_rule_id}` 复制到规则 `{target_rule.id}`\n\n"
-            f"普通关键字: 成功复制 {keywords_normal_success} 个, 跳过重复 {keywords_normal_skip} 个\n"
-            f"正则关键字: 成功复制 {keywords_regex_success} 个, 跳过重复 {keywords_regex_skip} 个\n"
-            f"替换规则: 成功复制 {replace_rules_success} 个, 跳过重复 {replace_rules_skip} 个\n"
-            f"媒体扩展名: 成功复制 {media_extensions_success} 个, 跳过重复 {media_extensions_skip} 个\n"
-            f"同步规则: 成功复制 {rule_syncs_success} 个, 跳过重复 {rule_syncs_skip} 个\n"
-            f"媒体类型设置和其他规则设置已复制\n"
+            f"✅ 已从规则 `{source_rule_id}` 复制到规则 `{target_rule_id}`\n\n"
+            f"{result.summary()}\n"
         )
 
         # 创建返回设置按钮
         buttons = [[
-            Button.inline('👈 返回设置', f"other_settings:{source_rule.id}"),
+            Button.inline('👈 返回设置', f"other_settings:{source_rule_id}"),
             Button.inline('❌ 关闭', 'close_settings')
         ]]
 
@@ -409,65 +260,19 @@ async def callback_perform_copy_keyword(event, rule_id_data, session, message, d
         if source_rule_id is None or target_rule_id is None:
             return
 
-        # 获取源规则和目标规则
-        source_rule, target_rule = await get_rules(event, session, source_rule_id, target_rule_id)
-        if not source_rule or not target_rule:
+        # 复制普通关键字和正则关键字
+        result = await copy_rules_or_answer(event, source_rule_id, target_rule_id, (COPY_KEYWORDS, COPY_REGEX_KEYWORDS))
+        if not result:
             return
 
-        # 记录复制的各个部分成功数量
-        keywords_normal_success = 0
-        keywords_normal_skip = 0
-        keywords_regex_success = 0
-        keywords_regex_skip = 0
-
-        # 复制普通关键字
-        for keyword in source_rule.keywords:
-            if not keyword.is_regex:  # 普通关键字
-                # 检查是否已存在
-                exists = any(not k.is_regex and k.keyword == keyword.keyword and k.is_blacklist == keyword.is_blacklist
-                           for k in target_rule.keywords)
-                if not exists:
-                    new_keyword = Keyword(
-                        rule_id=target_rule.id,
-                        keyword=keyword.keyword,
-                        is_regex=False,
-                        is_blacklist=keyword.is_blacklist
-                    )
-                    session.add(new_keyword)
-                    keywords_normal_success += 1
-                else:
-                    keywords_normal_skip += 1
-
-        # 复制正则关键字
-        for keyword in source_rule.keywords:
-            if keyword.is_regex:  # 正则关键字
-                # 检查是否已存在
-                exists = any(k.is_regex and k.keyword == keyword.keyword and k.is_blacklist == keyword.is_blacklist
-                           for k in target_rule.keywords)
-                if not exists:
-                    new_keyword = Keyword(
-                        rule_id=target_rule.id,
-                        keyword=keyword.keyword,
-                        is_regex=True,
-                        is_blacklist=keyword.is_blacklist
-                    )
-                    session.add(new_keyword)
-                    keywords_regex_success += 1
-                else:
-                    keywords_regex_skip += 1
-
-        # 保存更改
-        session.commit()
-
         # 构建消息内容
         result_message = (
-            f"✅ 已从规则 `{source_rule_id}` 复制关键字到规则 `{target_rule.id}`\n\n"
-            f"普通关键字: 成功复制 {keywords_normal_success} 个, 跳过重复 {keywords_normal_skip} 个\n"
-            f"正则关键字: 成功复制 {keywords_regex_success} 个, 跳过重复 {keywords_regex_skip} 个\n"
+            f"✅ 已从规则 `{source_rule_id}` 复制关键字到规则 `{target_rule_id}`\n\n"
+            f"{result.summary()}\n"
         )
 
         # 发送结果消息
-        await send_result_message(event, message, result_message, source_rule.id)
+        await send_result_message(event, message, result_message, source_rule_id)
 
         await event.answer(f"已从规则 {source_rule_id} 复制关键字到规则 {target_rule_id}")
 
@@ -489,42 +294,19 @@ async def callback_perform_copy_replace(event, rule_id_data, session, message, d
         if source_rule_id is None or target_rule_id is None:
             return
 
-        # 获取源规则和目标规则
-        source_rule, target_rule = await get_rules(event, session, source_rule_id, target_rule_id)
-        if not source_rule or not target_rule:
-            return
-
-        # 记录复制的成功数量
-        replace_rules_success = 0
-        replace_rules_skip = 0
-
         # 复制替换规则
-        for replace_rule in source_rule.replace_rules:
-            # 检查是否已存在
-            exists = any(r.pattern == replace_rule.pattern and r.content == replace_rule.content
-                         for r in target_rule.replace_rules)
-            if not exists:
-                new_rule = ReplaceRule(
-                    rule_id=target_rule.id,
-                    pattern=replace_rule.pattern,
-                    content=replace_rule.content
-                )
-                session.add(new_rule)
-                replace_rules_success += 1
-            else:
-                replace_rules_skip += 1
-
-        # 保存更改
-        session.commit()
+        result = await copy_rules_or_answer(event, source_rule_id, target_rule_id, (COPY_REPLACE_RULES,))
+        if not result:
+            return
 
         # 构建消息内容
         result_message = (
-            f"✅ 已从规则 `{source_rule_id}` 复制替换规则到规则 `{target_rule.id}`\n\n"
-            f"替换规则: 成功复制 {replace_rules_success} 个, 跳过重复 {replace_rules_skip} 个\n"
+            f"✅ 已从规则 `{source_rule_id}` 复制替换规则到规则 `{target_rule_id}`\n\n"
+            f"{result.summary()}\n"
         )
 
         # 发送结果消息
-        await send_result_message(event, message, result_message, source_rule.id)
+        await send_result_message(event, message, result_message, source_rule_id)
 
         await event.answer(f"已从规则 {source_rule_id} 复制替换规则到规则 {target_rule_id}")
 
@@ -683,26 +465,27 @@ async def parse_rule_ids(event, rule_id_data):
 
     return source_rule_id, target_rule_id
 
-async def get_rules(event, session, source_rule_id, target_rule_id):
-    """获取源规则和目标规则
+async def copy_rules_or_answer(event, source_rule_id, target_rule_id, parts):
+    """复制规则的指定内容，源规则或目标规则不存在时提示用户
 
     Args:
         event: 事件对象
-        session: 数据库会话
         source_rule_id: 源规则ID
         target_rule_id: 目标规则ID
+        parts: 要复制的内容，COPY_* 常量
 
     Returns:
-        (source_rule, target_rule) 或 (None, None)
+        CopyResult 或 None
     """
-    source_rule = session.query(ForwardRule).get(source_rule_id)
-    target_rule = session.query(ForwardRule).get(target_rule_id)
-
-    if not source_rule or not target_rule:
+    try:
+        result = await copy_rule(source_rule_id, [target_rule_id], parts)
+    except ValueError:
+        result = None
+    if not result or not result.target_rule_ids:
         await event.answer("源规则或目标规则不存在")
-        return None, None
-
-    return source_rule, target_rule
+        return None
+    rule_snapshot_manager.invalidate(target_rule_id)
+    return result
 
 async def send_result_message(event, message, result_message, target_rule_id):
     """发送结果消息
@@ -1078,6 +861,7 @@ async def callback_perform_delete_rule(event, rule_id_data, session, message, da
 
         # 提交规则删除的更改
         session.commit()
+        rule_snapshot_manager.invalidate(rule.id)
 
         # 尝试删除RSS服务中的相关数据
         try:
@@ -1094,7 +878,7 @@ async def callback_perform_delete_rule(event, rule_id_data, session, message, da
             # 不影响主要流程，继续执行
 
         # 使用通用方法检查并清理不再使用的聊天记录
-        deleted_chats = await check_and_clean_chats(session, rule_obj)
+        deleted_chats = await check_and_clean_chats(rule_obj)
         if deleted_chats > 0:
             logger.info(f"删除规则后清理了 {deleted_chats} 个未使用的聊天记录")
 
@@ -196,6 +196,15 @@ RULE_SETTINGS = {
         },
         'toggle_action': 'toggle_enable_sync',
         'toggle_func': lambda current: not current
+    },
+    'enable_dedup': {
+        'display_name': '跨来源去重',
+        'values': {
+            True: '开启',
+            False: '关闭'
+        },
+        'toggle_action': 'toggle_enable_dedup',
+        'toggle_func': lambda current: not current
     }
 }
 
@@ -601,6 +610,13 @@ async def create_buttons(rule):
                 )
             ])
 
+            buttons.append([
+                Button.inline(
+                    f"🧹 跨来源去重: {RULE_SETTINGS['enable_dedup']['values'][rule.enable_dedup]}",
+                    f"toggle_enable_dedup:{rule.id}"
+                )
+            ])
+
             if UFB_ENABLED == 'true':
                 buttons.append([
                     Button.inline(
@@ -2,12 +2,14 @@ from sqlalchemy.exc import IntegrityError
 from telethon import Button
 from models.models import MediaTypes, MediaExtensions
 from enums.enums import AddMode, ForwardMode
-from models.models import get_session, Keyword, ReplaceRule, User, RuleSync
+from models.models import get_session, Keyword, ReplaceRule, User, RuleSync, ResolvedPeer
 from utils.common import *
 from utils.media import *
 from handlers.list_handlers import *
-from utils.constants import TEMP_DIR
+from utils.constants import TEMP_DIR, STATUS_MAX_BUCKETS
 import traceback
+import asyncio
+from datetime import datetime
 from sqlalchemy import inspect
 from version import VERSION, UPDATE_INFO
 import shlex
@@ -16,6 +18,15 @@ import os
 import aiohttp
 from utils.constants import RSS_HOST, RSS_PORT
 import models.models as models
+from managers.rule_snapshot_manager import rule_snapshot_manager
+from models.rule_copy import copy_rule, COPY_KEYWORDS, COPY_REGEX_KEYWORDS, COPY_REPLACE_RULES
+from managers.peer_cache_manager import peer_cache_manager
+from managers.dedup_manager import dedup_manager
+from managers.retry_queue_manager import retry_queue_manager
+from managers.outbox_manager import outbox_manager
+from managers.forward_batch_manager import forward_batch_manager
+from managers.temp_file_manager import temp_file_manager
+from filters.rate_limiter import global_rate_limiter
 from utils.auto_delete import respond_and_delete,reply_and_delete,async_delete_user_message
 from utils.common import get_bot_client
 from handlers.button.settings_manager import create_settings_text, create_buttons
@@ -666,9 +677,12 @@ async def handle_clear_all_command(event):
 
         rule_count = session.query(ForwardRule).delete(synchronize_session=False)
 
+        session.query(ResolvedPeer).delete(synchronize_session=False)
+
         chat_count = session.query(Chat).delete(synchronize_session=False)
 
         session.commit()
+        peer_cache_manager.clear()
 
         await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
         await reply_and_delete(event,
@@ -694,6 +708,69 @@ async def handle_changelog_command(event):
     await reply_and_delete(event,UPDATE_INFO, parse_mode='html')
 
 
+def _format_bytes(size: int) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f}{unit}" if unit != 'B' else f"{size}B"
+        size /= 1024
+
+
+async def handle_status_command(event):
+    """处理 status 命令，显示限速、队列与缓存的运行状态"""
+    limiter = global_rate_limiter.get_stats()
+    retry = retry_queue_manager.get_stats()
+    outbox = outbox_manager.get_stats()
+    dedup = dedup_manager.get_stats()
+    peers = peer_cache_manager.get_stats()
+    batches = forward_batch_manager.get_stats()
+    snapshots = rule_snapshot_manager.get_stats()
+    temp = await asyncio.to_thread(temp_file_manager.get_stats)
+
+    last_flood = '无'
+    if limiter['last_flood_wait_at']:
+        last_flood = datetime.fromtimestamp(limiter['last_flood_wait_at']).strftime('%Y-%m-%d %H:%M:%S')
+
+    lines = [
+        "📊 **运行状态**\n",
+        "**API限速**",
+        f"排队等待: {limiter['waiting']}",
+        f"FloodWait: {limiter['flood_wait_count']} 次，共 {limiter['flood_wait_seconds']} 秒，最长 {limiter['flood_wait_max']} 秒",
+        f"最近一次FloodWait: {last_flood}",
+    ]
+    if limiter['flood_waits_by_method']:
+        lines.append("按方法: " + ", ".join(f"{method} {count}" for method, count in limiter['flood_waits_by_method'].items()))
+
+    lines.append("\n**令牌桶** (令牌/容量 速率 获取 等待 平均/最长等待 排队 FloodWait)")
+    bucket_stats = list(limiter['buckets'].items())
+    for name, bucket in bucket_stats[:STATUS_MAX_BUCKETS]:
+        wait = bucket['wait']
+        rate = f"{bucket['fill_rate']}/{bucket['base_rate']}" if bucket['fill_rate'] < bucket['base_rate'] else f"{bucket['base_rate']}"
+        frozen = f" 冻结{bucket['frozen_for']}s" if bucket['frozen_for'] else ''
+        lines.append(
+            f"`{name}` {bucket['tokens']:.0f}/{bucket['capacity']:.0f} {rate}/s "
+            f"{bucket['acquired']} {bucket['waited']} {wait['avg']}s/{wait['max']}s "
+            f"{bucket['waiters']} {bucket['flood_waits']}{frozen}"
+        )
+    if len(bucket_stats) > STATUS_MAX_BUCKETS:
+        lines.append(f"... 另有 {len(bucket_stats) - STATUS_MAX_BUCKETS} 个桶")
+
+    lines += [
+        "\n**队列**",
+        f"重试队列: {retry['pending']} 条待重试 ({retry['targets']} 个目标)，已延迟 {retry['deferred']}，已重试 {retry['retried']}，已放弃 {retry['dropped']}",
+        f"发送队列: {outbox['inflight']} 条发送中，已补发 {outbox['recovered']}，跳过重复 {outbox['duplicates']}",
+        f"合并转发: {batches['pending_batches']} 个批次等待中，{batches['api_calls']} 次调用转发 {batches['forwarded']} 条消息，放弃 {batches['dropped']} 条",
+        "\n**缓存**",
+        f"去重: {dedup['targets']} 个目标 {dedup['entries']} 条指纹，检查 {dedup['checked']}，重复 {dedup['duplicates']}",
+        f"Peer缓存: {peers['peers']} 个，命中 {peers['hits']}，未命中 {peers['misses']}",
+        f"规则快照: 版本 {snapshots['version']}，{snapshots['sources']} 个源聊天，命中 {snapshots['hits']}，加载 {snapshots['loads']}",
+        f"临时文件: {temp['disk_files']} 个 {_format_bytes(temp['disk_bytes'])}，使用中 {temp['tracked_files']} 个，"
+        f"磁盘剩余 {_format_bytes(temp['disk_free_bytes'])}",
+    ]
+
+    await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
+    await reply_and_delete(event, "\n".join(lines), parse_mode='markdown')
+
+
 async def handle_start_command(event):
     """处理 start 命令"""
 
@@ -720,10 +797,11 @@ async def handle_help_command(event, command):
         "**绑定和设置**\n"
         "/bind(/b) <源聊天链接或名称> [目标聊天链接或名称] - 绑定源聊天\n"
         "/settings(/s) [规则ID] - 管理转发规则\n"
-        "/changelog(/cl) - 查看更新日志\n\n"
+        "/changelog(/cl) - 查看更新日志\n"
+        "/status(/st) - 查看限速、队列与缓存状态\n\n"
 
         "**转发规则管理**\n"
-        "/copy_rule(/cr)  <源规则ID> [目标规则ID] - 复制指定规则的所有设置到当前规则或目标规则ID\n"
+        "/copy_rule(/cr)  <源规则ID> [目标规则ID] [目标规则ID] ... - 复制指定规则的所有设置到当前规则或一个或多个目标规则\n"
         "/list_rule(/lr) - 列出所有转发规则\n"
         "/delete_rule(/dr) <规则ID> [规则ID] [规则ID] ... - 删除指定规则\n\n"
 
@@ -1169,16 +1247,22 @@ async def handle_clear_all_replace_command(event, command):
     finally:
         session.close()
 
-async def handle_copy_keywords_command(event, command):
-    """处理复制关键字命令"""
-    parts = event.message.text.split()
-    if len(parts) != 2:
+async def _copy_to_current_rule(event, command, parts, title):
+    """把指定规则的内容复制到当前规则
+
+    Args:
+        command: 命令名，用于提示用法
+        parts: 要复制的内容，COPY_* 常量
+        title: 复制内容的名称，用于提示
+    """
+    message_parts = event.message.text.split()
+    if len(message_parts) != 2:
         await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-        await reply_and_delete(event,'用法: /copy_keywords <规则ID>')
+        await reply_and_delete(event,f'用法: /{command} <规则ID>')
         return
 
     try:
-        source_rule_id = int(parts[1])
+        source_rule_id = int(message_parts[1])
     except ValueError:
         await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
         await reply_and_delete(event,'规则ID必须是数字')
@@ -1189,366 +1273,105 @@ async def handle_copy_keywords_command(event, command):
         rule_info = await get_current_rule(session, event)
         if not rule_info:
             return
-        target_rule, source_chat = rule_info
-
-        source_rule = session.query(ForwardRule).get(source_rule_id)
-        if not source_rule:
-            await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-            await reply_and_delete(event,f'找不到规则ID: {source_rule_id}')
-            return
-
-        success_count = 0
-        skip_count = 0
-
-        for keyword in source_rule.keywords:
-            if not keyword.is_regex:  # 只复制普通关键字
-                exists = any(k.keyword == keyword.keyword and not k.is_regex
-                             for k in target_rule.keywords)
-                if not exists:
-                    new_keyword = Keyword(
-                        rule_id=target_rule.id,
-                        keyword=keyword.keyword,
-                        is_regex=False,
-                        is_blacklist=keyword.is_blacklist
-                    )
-                    session.add(new_keyword)
-                    success_count += 1
-                else:
-                    skip_count += 1
-
-        session.commit()
-
-        await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-        await reply_and_delete(event,
-            f"✅ 已从规则 `{source_rule_id}` 复制关键字到规则 `{target_rule.id}`\n"
-            f"成功复制: {success_count} 个\n"
-            f"跳过重复: {skip_count} 个",
-            parse_mode='markdown'
-        )
-
-    except Exception as e:
-        session.rollback()
-        logger.error(f'复制关键字时出错: {str(e)}')
-        await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-        await reply_and_delete(event,'复制关键字时出错，请检查日志')
+        target_rule_id = rule_info[0].id
     finally:
         session.close()
 
-async def handle_copy_keywords_regex_command(event, command):
-    """处理复制正则关键字命令"""
-    parts = event.message.text.split()
-    if len(parts) != 2:
-        await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-        await reply_and_delete(event,'用法: /copy_keywords_regex <规则ID>')
-        return
-
     try:
-        source_rule_id = int(parts[1])
+        result = await copy_rule(source_rule_id, [target_rule_id], parts)
     except ValueError:
         await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-        await reply_and_delete(event,'规则ID必须是数字')
+        await reply_and_delete(event,f'找不到规则ID: {source_rule_id}')
         return
-
-    session = get_session()
-    try:
-        rule_info = await get_current_rule(session, event)
-        if not rule_info:
-            return
-        target_rule, source_chat = rule_info
-
-        source_rule = session.query(ForwardRule).get(source_rule_id)
-        if not source_rule:
-            await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-            await reply_and_delete(event,f'找不到规则ID: {source_rule_id}')
-            return
-
-        success_count = 0
-        skip_count = 0
-
-        for keyword in source_rule.keywords:
-            if keyword.is_regex:  # 只复制正则关键字
-                exists = any(k.keyword == keyword.keyword and k.is_regex
-                             for k in target_rule.keywords)
-                if not exists:
-                    new_keyword = Keyword(
-                        rule_id=target_rule.id,
-                        keyword=keyword.keyword,
-                        is_regex=True,
-                        is_blacklist=keyword.is_blacklist
-                    )
-                    session.add(new_keyword)
-                    success_count += 1
-                else:
-                    skip_count += 1
-
-        session.commit()
-
-        await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-        await reply_and_delete(event,
-            f"✅ 已从规则 `{source_rule_id}` 复制正则关键字到规则 `{target_rule.id}`\n"
-            f"成功复制: {success_count} 个\n"
-            f"跳过重复: {skip_count} 个",
-            parse_mode='markdown'
-        )
-
     except Exception as e:
-        session.rollback()
-        logger.error(f'复制正则关键字时出错: {str(e)}')
+        logger.error(f'复制{title}时出错: {str(e)}')
         await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-        await reply_and_delete(event,'复制正则关键字时出错，请检查日志')
-    finally:
-        session.close()
-
-async def handle_copy_replace_command(event, command):
-    """处理复制替换规则命令"""
-    parts = event.message.text.split()
-    if len(parts) != 2:
-        await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-        await reply_and_delete(event,'用法: /copy_replace <规则ID>')
+        await reply_and_delete(event,f'复制{title}时出错，请检查日志')
         return
 
-    try:
-        source_rule_id = int(parts[1])
-    except ValueError:
-        await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-        await reply_and_delete(event,'规则ID必须是数字')
+    await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
+    if not result.target_rule_ids:
+        await reply_and_delete(event,'不能复制规则到自身')
         return
 
-    session = get_session()
-    try:
-        rule_info = await get_current_rule(session, event)
-        if not rule_info:
-            return
-        target_rule, source_chat = rule_info
-
-        source_rule = session.query(ForwardRule).get(source_rule_id)
-        if not source_rule:
-            await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-            await reply_and_delete(event,f'找不到规则ID: {source_rule_id}')
-            return
-
-        success_count = 0
-        skip_count = 0
-
-        for replace_rule in source_rule.replace_rules:
-            exists = any(r.pattern == replace_rule.pattern
-                         for r in target_rule.replace_rules)
-            if not exists:
-                new_rule = ReplaceRule(
-                    rule_id=target_rule.id,
-                    pattern=replace_rule.pattern,
-                    content=replace_rule.content
-                )
-                session.add(new_rule)
-                success_count += 1
-            else:
-                skip_count += 1
+    rule_snapshot_manager.invalidate(target_rule_id)
+    copied = sum(count.copied for count in result.counts.values())
+    skipped = sum(count.skipped for count in result.counts.values())
+    await reply_and_delete(event,
+        f"✅ 已从规则 `{source_rule_id}` 复制{title}到规则 `{target_rule_id}`\n"
+        f"成功复制: {copied} 个\n"
+        f"跳过重复: {skipped} 个",
+        parse_mode='markdown'
+    )
 
-        session.commit()
+async def handle_copy_keywords_command(event, command):
+    """处理复制关键字命令"""
+    await _copy_to_current_rule(event, 'copy_keywords', (COPY_KEYWORDS,), '关键字')
 
-        await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-        await reply_and_delete(event,
-            f"✅ 已从规则 `{source_rule_id}` 复制替换规则到规则 `{target_rule.id}`\n"
-            f"成功复制: {success_count} 个\n"
-            f"跳过重复: {skip_count} 个\n",
-            parse_mode='markdown'
-        )
+async def handle_copy_keywords_regex_command(event, command):
+    """处理复制正则关键字命令"""
+    await _copy_to_current_rule(event, 'copy_keywords_regex', (COPY_REGEX_KEYWORDS,), '正则关键字')
 
-    except Exception as e:
-        session.rollback()
-        logger.error(f'复制替换规则时出错: {str(e)}')
-        await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-        await reply_and_delete(event,'复制替换规则时出错，请检查日志')
-    finally:
-        session.close()
+async def handle_copy_replace_command(event, command):
+    """处理复制替换规则命令"""
+    await _copy_to_current_rule(event, 'copy_replace', (COPY_REPLACE_RULES,), '替换规则')
 
 async def handle_copy_rule_command(event, command):
-    """处理复制规则命令 - 复制一个规则的所有设置到当前规则或指定规则"""
+    """处理复制规则命令 - 复制一个规则的所有设置到当前规则或指定的一个或多个规则"""
     parts = event.message.text.split()
-    
-    if len(parts) not in [2, 3]:
+
+    if len(parts) < 2:
         await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-        await reply_and_delete(event,'用法: /copy_rule <源规则ID> [目标规则ID]')
+        await reply_and_delete(event,'用法: /copy_rule <源规则ID> [目标规则ID] [目标规则ID] ...')
         return
 
     try:
         source_rule_id = int(parts[1])
-        
-        if len(parts) == 3:
-            target_rule_id = int(parts[2])
-            use_current_rule = False
-        else:
-            target_rule_id = None
-            use_current_rule = True
+        target_rule_ids = [int(rule_id) for rule_id in parts[2:]]
     except ValueError:
         await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
         await reply_and_delete(event,'规则ID必须是数字')
         return
 
-    session = get_session()
-    try:
-        source_rule = session.query(ForwardRule).get(source_rule_id)
-        if not source_rule:
-            await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-            await reply_and_delete(event,f'找不到源规则ID: {source_rule_id}')
-            return
-
-        if use_current_rule:
+    if not target_rule_ids:
+        session = get_session()
+        try:
             rule_info = await get_current_rule(session, event)
             if not rule_info:
                 return
-            target_rule, source_chat = rule_info
-        else:
-            target_rule = session.query(ForwardRule).get(target_rule_id)
-            if not target_rule:
-                await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-                await reply_and_delete(event,f'找不到目标规则ID: {target_rule_id}')
-                return
-
-        if source_rule.id == target_rule.id:
-            await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-            await reply_and_delete(event,'不能复制规则到自身')
-            return
-
-        keywords_normal_success = 0
-        keywords_normal_skip = 0
-        keywords_regex_success = 0
-        keywords_regex_skip = 0
-        replace_rules_success = 0
-        replace_rules_skip = 0
-        media_extensions_success = 0
-        media_extensions_skip = 0
-
-
-        for keyword in source_rule.keywords:
-            if not keyword.is_regex:
-                exists = any(k.keyword == keyword.keyword and not k.is_regex and k.is_blacklist == keyword.is_blacklist
-                             for k in target_rule.keywords)
-                if not exists:
-                    new_keyword = Keyword(
-                        rule_id=target_rule.id,
-                        keyword=keyword.keyword,
-                        is_regex=False,
-                        is_blacklist=keyword.is_blacklist
-                    )
-                    session.add(new_keyword)
-                    keywords_normal_success += 1
-                else:
-                    keywords_normal_skip += 1
-        for keyword in source_rule.keywords:
-            if keyword.is_regex:
-                exists = any(k.keyword == keyword.keyword and k.is_regex and k.is_blacklist == keyword.is_blacklist
-                             for k in target_rule.keywords)
-                if not exists:
-                    new_keyword = Keyword(
-                        rule_id=target_rule.id,
-                        keyword=keyword.keyword,
-                        is_regex=True,
-                        is_blacklist=keyword.is_blacklist
-                    )
-                    session.add(new_keyword)
-                    keywords_regex_success += 1
-                else:
-                    keywords_regex_skip += 1
-
-        for replace_rule in source_rule.replace_rules:
-            exists = any(r.pattern == replace_rule.pattern and r.content == replace_rule.content
-                         for r in target_rule.replace_rules)
-            if not exists:
-                new_rule = ReplaceRule(
-                    rule_id=target_rule.id,
-                    pattern=replace_rule.pattern,
-                    content=replace_rule.content
-                )
-                session.add(new_rule)
-                replace_rules_success += 1
-            else:
-                replace_rules_skip += 1
-
-        if hasattr(source_rule, 'media_extensions') and source_rule.media_extensions:
-            for extension in source_rule.media_extensions:
-                # 检查是否已存在
-                exists = any(e.extension == extension.extension for e in target_rule.media_extensions)
-                if not exists:
-                    new_extension = MediaExtensions(
-                        rule_id=target_rule.id,
-                        extension=extension.extension
-                    )
-                    session.add(new_extension)
-                    media_extensions_success += 1
-                else:
-                    media_extensions_skip += 1
-
-        if hasattr(source_rule, 'media_types') and source_rule.media_types:
-            target_media_types = session.query(MediaTypes).filter_by(rule_id=target_rule.id).first()
-
-            if not target_media_types:
-                target_media_types = MediaTypes(rule_id=target_rule.id)
-
-                media_inspector = inspect(MediaTypes)
-                for column in media_inspector.columns:
-                    column_name = column.key
-                    if column_name not in ['id', 'rule_id']:
-                        setattr(target_media_types, column_name, getattr(source_rule.media_types, column_name))
-
-                session.add(target_media_types)
-            else:
-                media_inspector = inspect(MediaTypes)
-                for column in media_inspector.columns:
-                    column_name = column.key
-                    if column_name not in ['id', 'rule_id']:
-                        setattr(target_media_types, column_name, getattr(source_rule.media_types, column_name))
-
-        rule_syncs_success = 0
-        rule_syncs_skip = 0
-        
-        if hasattr(source_rule, 'rule_syncs') and source_rule.rule_syncs:
-            for sync in source_rule.rule_syncs:
-                exists = any(s.sync_rule_id == sync.sync_rule_id for s in target_rule.rule_syncs)
-                if not exists:
-                    if sync.sync_rule_id != target_rule.id:
-                        new_sync = RuleSync(
-                            rule_id=target_rule.id,
-                            sync_rule_id=sync.sync_rule_id
-                        )
-                        session.add(new_sync)
-                        rule_syncs_success += 1
-                        
-                        if rule_syncs_success > 0:
-                            target_rule.enable_sync = True
-                else:
-                    rule_syncs_skip += 1
-
-        inspector = inspect(ForwardRule)
-        for column in inspector.columns:
-            column_name = column.key
-            if column_name not in ['id', 'source_chat_id', 'target_chat_id', 'source_chat', 'target_chat',
-                                      'keywords', 'replace_rules', 'media_types']:
-                value = getattr(source_rule, column_name)
-                setattr(target_rule, column_name, value)
-
-        session.commit()
-
+            target_rule_ids = [rule_info[0].id]
+        finally:
+            session.close()
 
+    if target_rule_ids == [source_rule_id]:
         await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
-        await reply_and_delete(event,
-            f"✅ 已从规则 `{source_rule_id}` 复制到规则 `{target_rule.id}`\n\n"
-            f"普通关键字: 成功复制 {keywords_normal_success} 个, 跳过重复 {keywords_normal_skip} 个\n"
-            f"正则关键字: 成功复制 {keywords_regex_success} 个, 跳过重复 {keywords_regex_skip} 个\n"
-            f"替换规则: 成功复制 {replace_rules_success} 个, 跳过重复 {replace_rules_skip} 个\n"
-            f"媒体扩展名: 成功复制 {media_extensions_success} 个, 跳过重复 {media_extensions_skip} 个\n"
-            f"同步规则: 成功复制 {rule_syncs_success} 个, 跳过重复 {rule_syncs_skip} 个\n"
-            f"媒体类型设置和其他规则设置已复制\n",
-            parse_mode='markdown'
-        )
+        await reply_and_delete(event,'不能复制规则到自身')
+        return
 
+    try:
+        result = await copy_rule(source_rule_id, target_rule_ids)
+    except ValueError:
+        await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
+        await reply_and_delete(event,f'找不到源规则ID: {source_rule_id}')
+        return
     except Exception as e:
-        session.rollback()
         logger.error(f'复制规则时出错: {str(e)}')
         await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
         await reply_and_delete(event,'复制规则时出错，请检查日志')
-    finally:
-        session.close()
+        return
+
+    await async_delete_user_message(event.client, event.message.chat_id, event.message.id, 0)
+    if not result.target_rule_ids:
+        await reply_and_delete(event,f'找不到目标规则ID: {", ".join(str(rule_id) for rule_id in result.missing_rule_ids)}')
+        return
+
+    rule_snapshot_manager.invalidate(*result.target_rule_ids)
+    target_text = ', '.join(f'`{rule_id}`' for rule_id in result.target_rule_ids)
+    await reply_and_delete(event,
+        f"✅ 已从规则 `{source_rule_id}` 复制到规则 {target_text}\n\n"
+        f"{result.summary()}\n",
+        parse_mode='markdown'
+    )
 
 async def handle_export_replace_command(event, client):
     """处理 export_replace 命令"""
@@ -1811,7 +1634,8 @@ async def handle_replace_all_command(event, parts):
             success_count, duplicate_count = await db_ops.add_replace_rules(
                 session,
                 rule.id,
-                [(pattern, content)]  # 传入一个元组列表，每个元组包含 pattern 和 content
+                [pattern],  # patterns 参数
+                [content]   # contents 参数
             )
 
             total_success += success_count
@@ -1964,11 +1788,12 @@ async def handle_delete_rule_command(event, command, parts):
                 failed_ids.append(rule_id)
 
         session.commit()
+        rule_snapshot_manager.invalidate(*success_ids)
         
         # 清理不再使用的聊天记录
         # 这里直接对整个数据库进行一次清理，不需要单独处理每个规则
         # 因为所有规则都已经从数据库中删除
-        deleted_chats = await check_and_clean_chats(session)
+        deleted_chats = await check_and_clean_chats()
         if deleted_chats > 0:
             logger.info(f"删除规则后清理了 {deleted_chats} 个未使用的聊天记录")
         response_parts = []
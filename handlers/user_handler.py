@@ -3,6 +3,10 @@ import re
 import logging
 import asyncio
 from utils.common import check_keywords, get_sender_info
+from managers.dedup_manager import dedup_manager
+from managers.peer_cache_manager import peer_cache_manager
+from managers.forward_batch_manager import forward_batch_manager
+from filters.rate_limiter import global_rate_limiter, HISTORY
 
 
 logger = logging.getLogger(__name__)
@@ -34,9 +38,25 @@ async def process_forward_rule(client, event, chat_id, rule):
     
     logger.info(f'最终决定: {"转发" if should_forward else "不转发"}')
     
+    fingerprint = None
+    if should_forward and rule.enable_dedup:
+        is_duplicate, fingerprint = await dedup_manager.check(rule.target_chat_id, event.message, message_text)
+        if is_duplicate:
+            logger.info(f'规则 ID: {rule.id} - 消息与目标聊天近期消息重复，跳过转发')
+            return
+
+    async def on_done(sent):
+        # 转发成功后才写入指纹，转发失败时撤销预留，之后相同的消息仍可转发
+        if fingerprint is None:
+            return
+        if sent:
+            await dedup_manager.record(rule.target_chat_id, fingerprint)
+        else:
+            dedup_manager.release(rule.target_chat_id, fingerprint)
+
     if should_forward:
         target_chat = rule.target_chat
-        target_chat_id = int(target_chat.telegram_chat_id)
+        target_peer, target_chat_id = await peer_cache_manager.resolve(client, target_chat)
         
         try:
             
@@ -45,6 +65,7 @@ async def process_forward_rule(client, event, chat_id, rule):
                 await asyncio.sleep(1)
                 
                 messages = []
+                await global_rate_limiter.get_token(HISTORY, client=client)
                 async for message in client.iter_messages(
                     event.chat_id,
                     limit=20,  # 限制搜索范围
@@ -55,24 +76,15 @@ async def process_forward_rule(client, event, chat_id, rule):
                         messages.append(message.id)
                         logger.info(f'找到媒体组消息: ID={message.id}')
                 
-                messages.sort()
-                
-                await client.forward_messages(
-                    target_chat_id,
-                    messages,
-                    event.chat_id
-                )
-                logger.info(f'[用户] 已转发 {len(messages)} 条媒体组消息到: {target_chat.name} ({target_chat_id})')
+                forward_batch_manager.add(client, target_peer or target_chat_id, target_chat_id, event.chat_id, messages, target_chat.name, on_done)
+                logger.info(f'[用户] {len(messages)} 条媒体组消息已加入转发批次: {target_chat.name} ({target_chat_id})')
                 
             else:
-                await client.forward_messages(
-                    target_chat_id,
-                    event.message.id,
-                    event.chat_id
-                )
-                logger.info(f'[用户] 消息已转发到: {target_chat.name} ({target_chat_id})')
+                forward_batch_manager.add(client, target_peer or target_chat_id, target_chat_id, event.chat_id, event.message.id, target_chat.name, on_done)
+                logger.info(f'[用户] 消息已加入转发批次: {target_chat.name} ({target_chat_id})')
                 
                 
         except Exception as e:
             logger.error(f'转发消息时出错: {str(e)}')
-            logger.exception(e) 
\ No newline at end of file
+            logger.exception(e)
+            await on_done(False) 
\ No newline at end of file
@@ -1,3 +1,10 @@
+from utils.constants import IMPORT_PROFILE_ENABLED, IMPORT_PROFILE_TOP
+from utils.import_profiler import import_profiler
+
+# 在导入其他模块之前开始记录导入耗时，日志初始化后输出
+if IMPORT_PROFILE_ENABLED:
+    import_profiler.install()
+
 from telethon import TelegramClient, types
 from telethon.tl.types import BotCommand
 from telethon.tl.functions.bots import SetBotCommandsRequest
@@ -7,14 +14,22 @@ from message_listener import setup_listeners
 import os
 import asyncio
 import logging
-import uvicorn
 import multiprocessing
 from models.db_operations import DBOperations
+from models.db_executor import shutdown_db_executor
 from scheduler.summary_scheduler import SummaryScheduler
 from scheduler.chat_updater import ChatUpdater
 from handlers.bot_handler import send_welcome_message
-from rss.main import app as rss_app
 from utils.log_config import setup_logging
+from managers.temp_file_manager import temp_file_manager
+from managers.dedup_manager import dedup_manager
+from utils.image_processor import image_processor
+from filters.rate_limiter import global_rate_limiter
+from filters.rss_filter import close_rss_http_session
+from managers.retry_queue_manager import retry_queue_manager
+from managers.outbox_manager import outbox_manager
+from managers.peer_cache_manager import peer_cache_manager
+from managers.forward_batch_manager import forward_batch_manager
 
 # 设置Docker日志的默认配置，如果docker-compose.yml中没有配置日志选项将使用这些值
 os.environ.setdefault('DOCKER_LOG_MAX_SIZE', '10m')
@@ -25,6 +40,8 @@ setup_logging()
 
 logger = logging.getLogger(__name__)
 
+import_profiler.report(IMPORT_PROFILE_TOP)
+
 # 加载环境变量
 load_dotenv()
 
@@ -54,22 +71,24 @@ os.makedirs('./sessions', exist_ok=True)
 os.makedirs('./temp', exist_ok=True)
 
 
-# 清空./temp文件夹
-def clear_temp_dir():
-    for file in os.listdir('./temp'):
-        os.remove(os.path.join('./temp', file))
-
-
 # 创建客户端
 user_client = TelegramClient('./sessions/user', api_id, api_hash)
 bot_client = TelegramClient('./sessions/bot', api_id, api_hash)
 
+# 两个客户端分别使用各自的速率限制桶
+global_rate_limiter.register_client(user_client, 'user')
+global_rate_limiter.register_client(bot_client, 'bot')
+
 # 初始化数据库
 engine = init_db()
 
 
 def run_rss_server(host: str, port: int):
     """在新进程中运行 RSS 服务器"""
+    # RSS服务的依赖（FastAPI、uvicorn、feedgen、markdown等）只在启用RSS时于子进程中导入
+    import uvicorn
+    from rss.main import app as rss_app
+
     uvicorn.run(
         rss_app,
         host=host,
@@ -83,6 +102,12 @@ async def start_clients():
     db_ops = await DBOperations.create()
 
     try:
+        # 清理上次运行残留的临时文件，并启动定时清理
+        await temp_file_manager.start()
+
+        # 加载持久化的消息指纹
+        await dedup_manager.start()
+
         # 启动用户客户端
         await user_client.start(phone=phone_number)
         me_user = await user_client.get_me()
@@ -96,6 +121,12 @@ async def start_clients():
         # 设置消息监听器
         await setup_listeners(user_client, bot_client)
 
+        # 加载并预热目标聊天的Peer缓存
+        await peer_cache_manager.start(user_client, bot_client)
+
+        # 补发上次运行未发送的消息
+        await outbox_manager.start(user_client, bot_client)
+
         # 注册命令
         await register_bot_commands(bot_client)
 
@@ -139,12 +170,30 @@ async def start_clients():
         # 关闭 DBOperations
         if db_ops and hasattr(db_ops, 'close'):
             await db_ops.close()
+        # 转发尚在合并窗口中的消息
+        await forward_batch_manager.flush_all()
         # 停止调度器
         if scheduler:
             scheduler.stop()
         # 停止聊天信息更新器
         if chat_updater:
             chat_updater.stop()
+        # 停止临时文件清理任务
+        temp_file_manager.stop()
+        # 停止消息指纹清理任务
+        dedup_manager.stop()
+        # 停止重试队列
+        retry_queue_manager.stop()
+        # 停止发送队列补发任务
+        outbox_manager.stop()
+        # 停止Peer缓存预热任务
+        peer_cache_manager.stop()
+        # 关闭RSS条目写入使用的HTTP连接
+        await close_rss_http_session()
+        # 关闭图片预处理进程池
+        image_processor.shutdown()
+        # 等待数据库线程中的操作完成
+        shutdown_db_executor()
         # 如果 RSS 服务在运行，停止它
         if 'rss_process' in locals() and rss_process.is_alive():
             rss_process.terminate()
@@ -297,12 +346,16 @@ async def register_bot_commands(bot):
         ),
         BotCommand(
             command='copy_rule',
-            description='复制参数规则到当前规则'
+            description='复制参数规则到当前规则或多个目标规则'
         ),
         BotCommand(
             command='changelog',
             description='查看更新日志'
         ),
+        BotCommand(
+            command='status',
+            description='查看运行状态'
+        ),
         BotCommand(
             command='list_rule',
             description='列出所有转发规则'
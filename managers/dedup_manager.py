@@ -0,0 +1,378 @@
+import asyncio
+import hashlib
+import logging
+import math
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from models.models import get_session, MessageFingerprint
+from models.db_executor import run_db
+from utils.constants import DEDUP_WINDOW_HOURS, DEDUP_MAX_ENTRIES, DEDUP_HAMMING_DISTANCE, DEDUP_MIN_TEXT_LENGTH
+
+logger = logging.getLogger(__name__)
+
+URL_PATTERN = re.compile(r'https?://\S+|t\.me/\S+')
+NON_WORD_PATTERN = re.compile(r'[\W_]+')
+
+SHINGLE_SIZE = 3
+SIMHASH_BITS = 64
+
+
+def normalize_text(text: str) -> str:
+    """归一化文本：去除链接、标点、空白和大小写差异"""
+    if not text:
+        return ''
+    text = URL_PATTERN.sub('', text.lower())
+    return NON_WORD_PATTERN.sub('', text)
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def compute_simhash(text: str) -> int:
+    """计算归一化文本的64位SimHash，按字符shingle分词以兼容中文"""
+    if len(text) <= SHINGLE_SIZE:
+        shingles = [text]
+    else:
+        shingles = [text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)]
+
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        value = _hash64(shingle)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    simhash = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            simhash |= 1 << bit
+    return simhash
+
+
+def get_message_media_ids(message) -> Tuple[str, ...]:
+    """获取消息中媒体的ID，转发或转载的同一媒体ID相同"""
+    if not message:
+        return ()
+    photo = getattr(message, 'photo', None)
+    if photo:
+        return (f"photo:{photo.id}",)
+    document = getattr(message, 'document', None)
+    if document:
+        return (f"document:{document.id}",)
+    return ()
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    """消息指纹"""
+    text_hash: Optional[str]
+    simhash: Optional[int]
+    media_ids: Tuple[str, ...]
+    created_at: float
+
+    @property
+    def long_text(self) -> bool:
+        """文本是否足够长，可以单独用于判断重复"""
+        return self.simhash is not None
+
+    @property
+    def keys(self) -> Tuple[str, ...]:
+        """用于精确匹配的键
+
+        带媒体的消息按媒体和文本的组合匹配，同一媒体配不同文案不算重复；
+        纯文本消息的文本长度达到DEDUP_MIN_TEXT_LENGTH才参与匹配，避免“好的”之类的短消息被误判。
+        """
+        if self.media_ids:
+            return (f"m:{','.join(self.media_ids)}|t:{self.text_hash or ''}",)
+        if self.text_hash and self.long_text:
+            return (f"t:{self.text_hash}",)
+        return ()
+
+
+def build_fingerprint(message, text: str) -> Optional[Fingerprint]:
+    """根据消息文本和媒体生成指纹，没有可比较内容时返回None"""
+    normalized = normalize_text(text)
+    media_ids = get_message_media_ids(message)
+    if not normalized and not media_ids:
+        return None
+
+    text_hash = None
+    simhash = None
+    if normalized:
+        text_hash = hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+        if len(normalized) >= DEDUP_MIN_TEXT_LENGTH:
+            simhash = compute_simhash(normalized)
+
+    return Fingerprint(
+        text_hash=text_hash,
+        simhash=simhash,
+        media_ids=media_ids,
+        created_at=time.time()
+    )
+
+
+def _format_media_ids(media_ids: Tuple[str, ...]) -> Optional[str]:
+    return f",{','.join(media_ids)}," if media_ids else None
+
+
+class BloomFilter:
+    """
+    布隆过滤器，用于快速判断指纹是否一定不存在于数据库中
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class TargetIndex:
+    """
+    单个目标聊天的指纹索引：内存中保留最近的指纹（LRU），布隆过滤器覆盖整个时间窗口
+    """
+
+    def __init__(self, bloom_capacity: int):
+        self.entries: "OrderedDict[int, Fingerprint]" = OrderedDict()
+        self.exact: Dict[str, int] = {}
+        self.bloom = BloomFilter(bloom_capacity)
+        self._seq = 0
+
+    def add(self, fingerprint: Fingerprint) -> None:
+        self._seq += 1
+        self.entries[self._seq] = fingerprint
+        for key in fingerprint.keys:
+            self.exact[key] = self._seq
+            self.bloom.add(key)
+        while len(self.entries) > max(DEDUP_MAX_ENTRIES, 1):
+            self._evict(*self.entries.popitem(last=False))
+
+    def remove(self, fingerprint: Fingerprint) -> None:
+        """撤销预留的指纹"""
+        for seq, entry in self.entries.items():
+            if entry is fingerprint:
+                del self.entries[seq]
+                self._evict(seq, fingerprint)
+                return
+
+    def _evict(self, seq: int, fingerprint: Fingerprint) -> None:
+        for key in fingerprint.keys:
+            if self.exact.get(key) == seq:
+                del self.exact[key]
+
+    def find(self, fingerprint: Fingerprint, cutoff: float) -> Optional[Fingerprint]:
+        """在内存中查找重复或近似重复的指纹"""
+        for key in fingerprint.keys:
+            seq = self.exact.get(key)
+            if seq is not None and self.entries[seq].created_at >= cutoff:
+                self.entries.move_to_end(seq)
+                return self.entries[seq]
+
+        if fingerprint.simhash is None or DEDUP_HAMMING_DISTANCE <= 0:
+            return None
+        for seq, entry in self.entries.items():
+            if entry.simhash is None or entry.created_at < cutoff or entry.media_ids != fingerprint.media_ids:
+                continue
+            if (entry.simhash ^ fingerprint.simhash).bit_count() <= DEDUP_HAMMING_DISTANCE:
+                self.entries.move_to_end(seq)
+                return entry
+        return None
+
+    def may_contain(self, fingerprint: Fingerprint) -> bool:
+        return any(key in self.bloom for key in fingerprint.keys)
+
+
+class DedupManager:
+    """
+    跨来源重复消息过滤管理器，按目标聊天维护有界、带时间窗口的指纹索引，并持久化到SQLite
+
+    检查通过的指纹先预留在内存索引中，同时到达的相同消息会被过滤；
+    消息发送成功后才写入数据库，未发送的消息撤销预留，之后相同的消息仍可转发。
+    """
+
+    PRUNE_INTERVAL = 3600
+
+    def __init__(self):
+        self._indexes: Dict[int, TargetIndex] = {}
+        self._lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.checked_count = 0
+        self.duplicate_count = 0
+        logger.info("DedupManager 初始化")
+
+    @property
+    def window(self) -> float:
+        return DEDUP_WINDOW_HOURS * 3600
+
+    def _new_index(self, key_count: int = 0) -> TargetIndex:
+        return TargetIndex(max(key_count * 2, DEDUP_MAX_ENTRIES * 4))
+
+    def _load(self) -> Dict[int, TargetIndex]:
+        """删除过期指纹，并从数据库加载时间窗口内的指纹"""
+        cutoff = time.time() - self.window
+        session = get_session()
+        try:
+            session.query(MessageFingerprint).filter(MessageFingerprint.created_at < cutoff).delete(synchronize_session=False)
+            session.commit()
+
+            rows = session.query(MessageFingerprint).filter(
+                MessageFingerprint.created_at >= cutoff
+            ).order_by(MessageFingerprint.created_at).all()
+        finally:
+            session.close()
+
+        grouped: Dict[int, list] = {}
+        for row in rows:
+            grouped.setdefault(row.target_chat_id, []).append(Fingerprint(
+                text_hash=row.text_hash,
+                simhash=int(row.simhash, 16) if row.simhash else None,
+                media_ids=tuple(media_id for media_id in (row.media_ids or '').split(',') if media_id),
+                created_at=row.created_at
+            ))
+
+        indexes = {}
+        for target_chat_id, fingerprints in grouped.items():
+            index = self._new_index(sum(len(fingerprint.keys) for fingerprint in fingerprints))
+            for fingerprint in fingerprints[:-DEDUP_MAX_ENTRIES or None]:
+                for key in fingerprint.keys:
+                    index.bloom.add(key)
+            for fingerprint in fingerprints[-DEDUP_MAX_ENTRIES:]:
+                index.add(fingerprint)
+            indexes[target_chat_id] = index
+        return indexes
+
+    def _query_db(self, target_chat_id: int, fingerprint: Fingerprint, cutoff: float) -> bool:
+        """布隆过滤器命中后到数据库中确认精确匹配，媒体和文本需同时一致"""
+        session = get_session()
+        try:
+            media_ids = _format_media_ids(fingerprint.media_ids)
+            return session.query(MessageFingerprint.id).filter(
+                MessageFingerprint.target_chat_id == target_chat_id,
+                MessageFingerprint.created_at >= cutoff,
+                MessageFingerprint.media_ids.is_(None) if media_ids is None else MessageFingerprint.media_ids == media_ids,
+                MessageFingerprint.text_hash.is_(None) if fingerprint.text_hash is None else MessageFingerprint.text_hash == fingerprint.text_hash
+            ).first() is not None
+        finally:
+            session.close()
+
+    def _save(self, target_chat_id: int, fingerprint: Fingerprint) -> None:
+        session = get_session()
+        try:
+            session.add(MessageFingerprint(
+                target_chat_id=target_chat_id,
+                text_hash=fingerprint.text_hash,
+                simhash=f"{fingerprint.simhash:016x}" if fingerprint.simhash is not None else None,
+                media_ids=_format_media_ids(fingerprint.media_ids),
+                created_at=fingerprint.created_at
+            ))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"保存消息指纹失败: {str(e)}")
+        finally:
+            session.close()
+
+    async def check(self, target_chat_id: int, message, text: str) -> Tuple[bool, Optional[Fingerprint]]:
+        """检查消息是否与目标聊天时间窗口内的消息重复，不重复时预留指纹
+
+        预留的指纹需在消息发送成功后调用record写入数据库，未发送时调用release撤销。
+
+        Args:
+            target_chat_id: 目标聊天在chats表中的ID
+            message: 消息对象
+            text: 消息文本
+
+        Returns:
+            Tuple[bool, Optional[Fingerprint]]: (是否为重复消息, 预留的指纹)
+        """
+        fingerprint = build_fingerprint(message, text)
+        if fingerprint is None or not fingerprint.keys:
+            return False, None
+
+        async with self._lock:
+            self.checked_count += 1
+            cutoff = fingerprint.created_at - self.window
+            index = self._indexes.get(target_chat_id)
+            if index is None:
+                index = self._indexes[target_chat_id] = self._new_index()
+
+            duplicate = index.find(fingerprint, cutoff) is not None
+            if not duplicate and index.may_contain(fingerprint):
+                duplicate = await run_db(self._query_db, target_chat_id, fingerprint, cutoff)
+
+            if duplicate:
+                self.duplicate_count += 1
+                return True, None
+
+            index.add(fingerprint)
+            return False, fingerprint
+
+    async def record(self, target_chat_id: int, fingerprint: Fingerprint) -> None:
+        """消息发送成功后把预留的指纹写入数据库"""
+        await run_db(self._save, target_chat_id, fingerprint)
+
+    def release(self, target_chat_id: int, fingerprint: Fingerprint) -> None:
+        """消息没有发送时撤销预留的指纹"""
+        index = self._indexes.get(target_chat_id)
+        if index is not None:
+            index.remove(fingerprint)
+
+    def get_stats(self) -> dict:
+        """获取去重统计"""
+        return {
+            "targets": len(self._indexes),
+            "entries": sum(len(index.entries) for index in self._indexes.values()),
+            "checked": self.checked_count,
+            "duplicates": self.duplicate_count,
+        }
+
+    async def start(self):
+        """加载持久化的指纹，并启动定时清理任务"""
+        async with self._lock:
+            self._indexes = await run_db(self._load)
+        stats = self.get_stats()
+        logger.info(f"已加载 {stats['targets']} 个目标的 {stats['entries']} 条消息指纹")
+        self.task = asyncio.create_task(self._run_prune_task())
+
+    async def _run_prune_task(self):
+        """定时清理过期指纹并重建布隆过滤器"""
+        while True:
+            try:
+                await asyncio.sleep(self.PRUNE_INTERVAL)
+                async with self._lock:
+                    self._indexes = await run_db(self._load)
+                logger.info(f"消息指纹清理完成，统计: {self.get_stats()}")
+            except asyncio.CancelledError:
+                logger.info("消息指纹清理任务已取消")
+                break
+            except Exception as e:
+                logger.error(f"消息指纹清理任务出错: {str(e)}")
+
+    def stop(self):
+        """停止定时清理任务"""
+        if self.task:
+            self.task.cancel()
+            logger.info("消息指纹清理任务已停止")
+
+
+dedup_manager = DedupManager()
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from telethon.errors import FloodWaitError
+from filters.rate_limiter import global_rate_limiter, SEND
+from utils.constants import FORWARD_BATCH_WINDOW_MS, FORWARD_BATCH_MAX_SIZE, FLOOD_RETRY_MAX_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+# Telegram单次forward_messages最多转发100条消息
+MAX_FORWARD_IDS = 100
+
+
+@dataclass
+class ForwardBatch:
+    """同一源聊天发往同一目标聊天、等待合并转发的消息"""
+    client: object
+    target: object
+    target_chat_id: int
+    source_chat_id: int
+    target_name: str
+    message_ids: Set[int] = field(default_factory=set)
+    callbacks: List[Tuple[Set[int], Callable]] = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class ForwardBatchManager:
+    """
+    用户模式转发的合并管理器
+
+    在很短的时间窗口内收集同一源聊天发往同一目标聊天的消息ID，
+    窗口结束或达到数量上限时按ID排序后通过一次forward_messages转发，
+    媒体组的消息自然合并在同一次调用中。
+    触发FloodWait时等待限速桶解冻后重新转发，同一目标后续的批次排在其后，保持消息顺序。
+    """
+
+    def __init__(self):
+        self._batches: Dict[Tuple[int, int, int], ForwardBatch] = {}
+        self._locks: Dict[Tuple[int, int, int], asyncio.Lock] = {}
+        self._lock_users: Dict[Tuple[int, int, int], int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.forwarded_count = 0
+        self.call_count = 0
+        self.dropped_count = 0
+        logger.info("ForwardBatchManager 初始化")
+
+    def add(self, client, target, target_chat_id: int, source_chat_id: int, message_ids, target_name: str = '', on_done: Optional[Callable] = None) -> None:
+        """将消息加入合并转发批次
+
+        Args:
+            client: 用户客户端
+            target: 目标聊天的InputPeer或ID
+            target_chat_id: 目标聊天ID
+            source_chat_id: 源聊天ID
+            message_ids: 消息ID或消息ID列表
+            target_name: 目标聊天名称，用于日志
+            on_done: 批次发送结束后调用的协程函数，参数为这些消息是否全部转发成功
+        """
+        if isinstance(message_ids, int):
+            message_ids = [message_ids]
+
+        key = (id(client), int(target_chat_id), int(source_chat_id))
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = ForwardBatch(client, target, int(target_chat_id), int(source_chat_id), target_name)
+            self._batches[key] = batch
+        batch.message_ids.update(message_ids)
+        if on_done is not None:
+            batch.callbacks.append((set(message_ids), on_done))
+
+        if FORWARD_BATCH_WINDOW_MS <= 0 or len(batch.message_ids) >= min(FORWARD_BATCH_MAX_SIZE, MAX_FORWARD_IDS):
+            self._schedule_flush(key)
+        elif batch.timer is None:
+            loop = asyncio.get_running_loop()
+            batch.timer = loop.call_later(FORWARD_BATCH_WINDOW_MS / 1000, self._schedule_flush, key)
+
+    def _schedule_flush(self, key) -> None:
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer:
+            batch.timer.cancel()
+        task = asyncio.create_task(self._flush(key, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, key, batch: ForwardBatch) -> None:
+        # 同一目标的批次按创建顺序依次发送，保持消息顺序
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        sent_ids = set()
+        try:
+            async with lock:
+                message_ids = sorted(batch.message_ids)
+                for start in range(0, len(message_ids), MAX_FORWARD_IDS):
+                    chunk = message_ids[start:start + MAX_FORWARD_IDS]
+                    if await self._forward_chunk(batch, chunk):
+                        sent_ids.update(chunk)
+        finally:
+            # 没有等待中的批次时删除该目标的锁
+            self._lock_users[key] -= 1
+            if not self._lock_users[key]:
+                del self._lock_users[key]
+                del self._locks[key]
+
+        for callback_ids, on_done in batch.callbacks:
+            try:
+                await on_done(callback_ids <= sent_ids)
+            except Exception as e:
+                logger.error(f'处理转发结果时出错: {str(e)}')
+
+    async def _forward_chunk(self, batch: ForwardBatch, chunk) -> bool:
+        """转发一组消息，触发FloodWait时冻结限速桶，等待解冻后重新转发"""
+        for attempt in range(1, FLOOD_RETRY_MAX_ATTEMPTS + 2):
+            try:
+                # 触发FloodWait后限速桶被冻结，获取令牌时会等待到解冻
+                await global_rate_limiter.get_token(SEND, client=batch.client, chat_id=batch.target_chat_id)
+                await batch.client.forward_messages(batch.target, chunk, batch.source_chat_id)
+                self.call_count += 1
+                self.forwarded_count += len(chunk)
+                logger.info(f'[用户] 已合并转发 {len(chunk)} 条消息到: {batch.target_name} ({batch.target_chat_id})')
+                return True
+            except FloodWaitError as e:
+                global_rate_limiter.report_flood_wait(e.seconds, SEND, client=batch.client, chat_id=batch.target_chat_id)
+                if attempt > FLOOD_RETRY_MAX_ATTEMPTS:
+                    break
+                logger.warning(f'转发消息频率限制，{e.seconds} 秒后第 {attempt} 次重试')
+            except Exception as e:
+                logger.error(f'转发消息时出错: {str(e)}')
+                logger.exception(e)
+                return False
+
+        self.dropped_count += len(chunk)
+        logger.error(f'转发 {len(chunk)} 条消息到 {batch.target_name} ({batch.target_chat_id}) 重试 {FLOOD_RETRY_MAX_ATTEMPTS} 次后仍然频率受限，放弃转发')
+        return False
+
+    async def flush_all(self) -> None:
+        """立即转发所有等待中的批次"""
+        for key in list(self._batches):
+            self._schedule_flush(key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        """获取合并转发统计"""
+        return {
+            "pending_batches": len(self._batches),
+            "forwarded": self.forwarded_count,
+            "api_calls": self.call_count,
+            "dropped": self.dropped_count,
+        }
+
+
+forward_batch_manager = ForwardBatchManager()
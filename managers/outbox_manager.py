@@ -0,0 +1,349 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Optional, Set
+from sqlalchemy.exc import IntegrityError
+from telethon import Button
+from telethon.errors import FloodWaitError
+from models.models import get_session, OutboundMessage
+from models.db_executor import run_db
+from filters.rate_limiter import global_rate_limiter, SEND, DOWNLOAD, HISTORY
+from managers.temp_file_manager import temp_file_manager
+from utils.media import download_media_file, rewind_media_file
+from utils.constants import TEMP_DIR, OUTBOX_RETENTION_HOURS, OUTBOX_MAX_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+
+def get_idempotency_key(source_chat_id, message_id, rule_id) -> str:
+    """同一条源消息在同一条规则下只发送一次"""
+    return f"{source_chat_id}:{message_id}:{rule_id}"
+
+
+def serialize_buttons(buttons) -> Optional[str]:
+    """序列化URL按钮，其他类型的按钮无法在重启后还原，直接忽略"""
+    rows = []
+    for row in buttons or []:
+        row = row if isinstance(row, (list, tuple)) else [row]
+        items = [
+            {"text": button.text, "url": button.url}
+            for button in row
+            if getattr(button, 'url', None)
+        ]
+        if items:
+            rows.append(items)
+    return json.dumps(rows, ensure_ascii=False) if rows else None
+
+
+def deserialize_buttons(value: Optional[str]):
+    if not value:
+        return None
+    return [[Button.url(item["text"], item["url"]) for item in row] for row in json.loads(value)]
+
+
+class OutboxManager:
+    """
+    持久化发送队列管理器
+
+    发送前先将消息写入outbound_messages表，发送成功后标记为已发送。
+    进程重启后，未发送的消息由后台任务重新下载媒体并发送（至少一次）；
+    幂等键（源聊天ID:消息ID:规则ID）保证已发送的源消息不会再次发送。
+
+    记录状态：pending 待发送、sending 已被认领正在发送、sent 已发送、failed 失败次数达到上限。
+    发送前先在数据库中把记录从 pending 原子地改为 sending，同一条记录只会有一个发送者；
+    启动时把上次运行遗留的 sending 记录恢复为 pending。
+    """
+
+    DRAIN_INTERVAL = 60
+
+    def __init__(self):
+        self.user_client = None
+        self.bot_client = None
+        self.task: Optional[asyncio.Task] = None
+        # 正在由过滤器链发送（包括在重试队列中等待）的记录，后台任务不会处理
+        self._inflight: Set[int] = set()
+        self.recovered_count = 0
+        self.duplicate_count = 0
+        logger.info("OutboxManager 初始化")
+
+    def _claim(self, session, entry_id: int, statuses=('pending',)) -> bool:
+        """把处于指定状态的记录原子地改为sending，返回是否认领成功"""
+        claimed = session.query(OutboundMessage).filter(
+            OutboundMessage.id == entry_id,
+            OutboundMessage.status.in_(statuses)
+        ).update({'status': 'sending', 'updated_at': time.time()}, synchronize_session=False)
+        session.commit()
+        return claimed == 1
+
+    def _claim_entry(self, entry_id: int) -> bool:
+        session = get_session()
+        try:
+            return self._claim(session, entry_id)
+        finally:
+            session.close()
+
+    def _enqueue(self, key: str, values: dict):
+        """写入并认领记录，返回 (记录ID, 无法认领时记录的状态)"""
+        session = get_session()
+        try:
+            now = time.time()
+            entry = OutboundMessage(idempotency_key=key, created_at=now, updated_at=now, **values)
+            session.add(entry)
+            try:
+                session.commit()
+                return entry.id, None
+            except IntegrityError:
+                session.rollback()
+                entry = session.query(OutboundMessage).filter_by(idempotency_key=key).first()
+                # 待发送的记录重新认领后发送，失败次数已达上限的记录不再发送
+                if entry.status == 'pending' and self._claim(session, entry.id):
+                    return entry.id, None
+                session.refresh(entry)
+                return entry.id, entry.status
+        finally:
+            session.close()
+
+    async def enqueue(self, context, target_chat_id, text, parse_mode, link_preview) -> Optional[int]:
+        """将过滤器链处理完成的消息写入发送队列
+
+        Args:
+            context: 消息上下文
+            target_chat_id: 目标聊天ID
+            text: 最终发送的文本或媒体说明
+            parse_mode: 解析模式
+            link_preview: 是否显示链接预览
+
+        Returns:
+            Optional[int]: 队列记录ID，该源消息已发送过或正在由其他任务发送时返回None
+        """
+        event = context.event
+        if context.is_media_group:
+            media_ids = [message.id for message in context.media_group_messages if message.media]
+        elif context.media_files:
+            media_ids = [event.message.id]
+        else:
+            media_ids = []
+
+        key = get_idempotency_key(event.chat_id, event.message.id, context.rule.id)
+        values = dict(
+            rule_id=context.rule.id,
+            source_chat_id=str(event.chat_id),
+            source_message_ids=','.join(str(message_id) for message_id in media_ids) or None,
+            target_chat_id=str(target_chat_id),
+            text=text,
+            parse_mode=parse_mode,
+            link_preview=bool(link_preview),
+            buttons=serialize_buttons(context.buttons),
+            status='sending',
+        )
+        entry_id, status = await run_db(self._enqueue, key, values)
+        if status is not None:
+            self.duplicate_count += 1
+            logger.info(f"消息 {key} 的发送状态为 {status}，跳过重复发送")
+            return None
+        self._inflight.add(entry_id)
+        return entry_id
+
+    def _update(self, entry_id: int, **values) -> None:
+        session = get_session()
+        try:
+            entry = session.get(OutboundMessage, entry_id)
+            if entry:
+                for name, value in values.items():
+                    setattr(entry, name, value)
+                entry.updated_at = time.time()
+                session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"更新发送队列记录 {entry_id} 失败: {str(e)}")
+        finally:
+            session.close()
+
+    async def mark_sent(self, entry_id: int, sent_messages=None) -> None:
+        """标记消息已发送"""
+        self._inflight.discard(entry_id)
+        sent_ids = ','.join(str(message.id) for message in sent_messages or [] if hasattr(message, 'id'))
+        await run_db(self._update, entry_id, status='sent', sent_message_ids=sent_ids or None, last_error=None)
+
+    def _fail(self, entry_id: int, error: str, permanent: bool) -> None:
+        session = get_session()
+        try:
+            entry = session.get(OutboundMessage, entry_id)
+            if entry:
+                entry.attempts = (entry.attempts or 0) + 1
+                entry.last_error = error
+                entry.status = 'failed' if permanent or entry.attempts >= OUTBOX_MAX_ATTEMPTS else 'pending'
+                entry.updated_at = time.time()
+                session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"更新发送队列记录 {entry_id} 失败: {str(e)}")
+        finally:
+            session.close()
+
+    async def mark_failed(self, entry_id: int, error: str, permanent: bool = False) -> None:
+        """记录一次发送失败，未超过最大次数时由后台任务重试
+
+        Args:
+            entry_id: 记录ID
+            error: 错误信息
+            permanent: 重试也不会成功的错误（如目标聊天不可用），直接标记为失败
+        """
+        self._inflight.discard(entry_id)
+        await run_db(self._fail, entry_id, error, permanent)
+
+    async def release(self, entry_id: int) -> None:
+        """恢复为待发送但不计入失败次数，用于频率限制等与消息本身无关的延迟"""
+        self._inflight.discard(entry_id)
+        await run_db(self._update, entry_id, status='pending')
+
+    def forget(self, entry_id: int) -> None:
+        """进程退出前放弃认领，数据库中的记录在下次启动时恢复为待发送"""
+        self._inflight.discard(entry_id)
+
+    def _reset_claims(self) -> int:
+        session = get_session()
+        try:
+            reset = session.query(OutboundMessage).filter(
+                OutboundMessage.status == 'sending'
+            ).update({'status': 'pending'}, synchronize_session=False)
+            session.commit()
+            return reset
+        finally:
+            session.close()
+
+    def _load_pending(self):
+        cutoff = time.time() - OUTBOX_RETENTION_HOURS * 3600
+        session = get_session()
+        try:
+            session.query(OutboundMessage).filter(
+                OutboundMessage.status.in_(('sent', 'failed')),
+                OutboundMessage.updated_at < cutoff
+            ).delete(synchronize_session=False)
+            session.commit()
+
+            entries = session.query(OutboundMessage).filter(
+                OutboundMessage.status == 'pending'
+            ).order_by(OutboundMessage.id).all()
+            session.expunge_all()
+            return entries
+        finally:
+            session.close()
+
+    async def _deliver(self, entry) -> list:
+        """重新下载媒体并发送一条队列中的消息"""
+        target_chat_id = int(entry.target_chat_id)
+        files = []
+        try:
+            if entry.source_message_ids:
+                message_ids = [int(message_id) for message_id in entry.source_message_ids.split(',')]
+                await global_rate_limiter.get_token(HISTORY, client=self.user_client)
+                messages = await self.user_client.get_messages(int(entry.source_chat_id), ids=message_ids)
+                for message in messages:
+                    if message and message.media:
+                        await global_rate_limiter.get_token(DOWNLOAD, client=self.user_client)
+                        file_path = await download_media_file(message, TEMP_DIR)
+                        if file_path:
+                            files.append(temp_file_manager.track(file_path))
+
+            buttons = deserialize_buttons(entry.buttons)
+            await global_rate_limiter.get_token(SEND, client=self.bot_client, chat_id=target_chat_id)
+            if files:
+                sent = await self.bot_client.send_file(
+                    target_chat_id,
+                    [rewind_media_file(f) for f in files] if len(files) > 1 else rewind_media_file(files[0]),
+                    caption=entry.text,
+                    parse_mode=entry.parse_mode,
+                    buttons=buttons,
+                    link_preview=entry.link_preview
+                )
+            elif entry.text:
+                sent = await self.bot_client.send_message(
+                    target_chat_id,
+                    entry.text,
+                    parse_mode=entry.parse_mode,
+                    link_preview=entry.link_preview,
+                    buttons=buttons
+                )
+            else:
+                sent = []
+            return sent if isinstance(sent, list) else [sent]
+        finally:
+            temp_file_manager.release_all(files)
+
+    async def drain(self) -> int:
+        """发送队列中所有不在处理中的待发送消息
+
+        Returns:
+            int: 成功发送的消息数量
+        """
+        entries = await run_db(self._load_pending)
+        if not entries:
+            return 0
+        logger.info(f"发送队列中有 {len(entries)} 条待发送消息，开始补发")
+
+        delivered = 0
+        for entry in entries:
+            # 读取之后可能已被过滤器链重新认领
+            if not await run_db(self._claim_entry, entry.id):
+                continue
+            self._inflight.add(entry.id)
+            try:
+                sent = await self._deliver(entry)
+                await self.mark_sent(entry.id, sent)
+                delivered += 1
+                self.recovered_count += 1
+                logger.info(f"已补发队列消息 {entry.idempotency_key} 到 {entry.target_chat_id}")
+            except FloodWaitError as e:
+                # 频率限制不计入失败次数，冻结限速桶后结束本轮，剩余消息由下一轮补发
+                logger.warning(f"补发队列消息触发频率限制，需要等待 {e.seconds} 秒，本轮补发结束")
+                await self.release(entry.id)
+                global_rate_limiter.report_flood_wait(e.seconds, SEND, client=self.bot_client, chat_id=int(entry.target_chat_id))
+                break
+            except asyncio.CancelledError:
+                self.forget(entry.id)
+                raise
+            except Exception as e:
+                logger.error(f"补发队列消息 {entry.idempotency_key} 失败: {str(e)}")
+                await self.mark_failed(entry.id, str(e))
+        return delivered
+
+    def get_stats(self) -> dict:
+        """获取发送队列统计"""
+        return {
+            "inflight": len(self._inflight),
+            "recovered": self.recovered_count,
+            "duplicates": self.duplicate_count,
+        }
+
+    async def start(self, user_client, bot_client):
+        """启动后台任务，补发上次运行未发送的消息"""
+        self.user_client = user_client
+        self.bot_client = bot_client
+        reset = await run_db(self._reset_claims)
+        if reset:
+            logger.info(f"已将上次运行未完成的 {reset} 条发送中消息恢复为待发送")
+        self.task = asyncio.create_task(self._run_drain_task())
+        logger.info("发送队列补发任务已启动")
+
+    async def _run_drain_task(self):
+        while True:
+            try:
+                await self.drain()
+                await asyncio.sleep(self.DRAIN_INTERVAL)
+            except asyncio.CancelledError:
+                logger.info("发送队列补发任务已取消")
+                break
+            except Exception as e:
+                logger.error(f"发送队列补发任务出错: {str(e)}")
+                await asyncio.sleep(self.DRAIN_INTERVAL)
+
+    def stop(self):
+        """停止后台任务"""
+        if self.task:
+            self.task.cancel()
+            logger.info("发送队列补发任务已停止")
+
+
+outbox_manager = OutboxManager()
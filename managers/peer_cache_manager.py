@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+from telethon import utils
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+from models.models import get_session, ForwardRule, ResolvedPeer
+from models.db_executor import run_db
+from filters.rate_limiter import global_rate_limiter, HISTORY, REALTIME, BULK
+
+logger = logging.getLogger(__name__)
+
+
+def _build_input_peer(peer_type: str, peer_id: int, access_hash: Optional[int]):
+    if peer_type == 'channel':
+        return InputPeerChannel(peer_id, access_hash)
+    if peer_type == 'chat':
+        return InputPeerChat(peer_id)
+    return InputPeerUser(peer_id, access_hash)
+
+
+def _describe_input_peer(input_peer) -> Tuple[str, int, Optional[int]]:
+    """返回InputPeer的类型、ID和access_hash"""
+    if isinstance(input_peer, InputPeerChannel):
+        return 'channel', input_peer.channel_id, input_peer.access_hash
+    if isinstance(input_peer, InputPeerChat):
+        return 'chat', input_peer.chat_id, None
+    return 'user', input_peer.user_id, input_peer.access_hash
+
+
+def get_candidate_chat_ids(telegram_chat_id) -> list:
+    """数据库中保存的聊天ID可能缺少前缀，依次尝试原始ID、-100前缀和-前缀"""
+    chat_id = int(telegram_chat_id)
+    candidates = [chat_id]
+    if not str(chat_id).startswith('-100'):
+        candidates.append(int(f'-100{abs(chat_id)}'))
+    if not str(chat_id).startswith('-'):
+        candidates.append(int(f'-{abs(chat_id)}'))
+    return candidates
+
+
+class PeerCacheManager:
+    """
+    目标聊天的Peer缓存管理器
+
+    保存每个客户端解析出的可用聊天ID和InputPeer（包括access_hash），
+    启动时预热、由聊天信息更新器定期刷新，发送消息时无需调用API解析目标聊天。
+    """
+
+    def __init__(self):
+        self._peers: Dict[Tuple[str, int], Tuple[object, int]] = {}
+        self.user_client = None
+        self.bot_client = None
+        self.task: Optional[asyncio.Task] = None
+        self.hit_count = 0
+        self.miss_count = 0
+        logger.info("PeerCacheManager 初始化")
+
+    async def _client_name(self, client) -> str:
+        # 启动时已调用过get_me，is_bot()直接返回缓存的结果
+        return 'bot' if await client.is_bot() else 'user'
+
+    def _load(self) -> None:
+        session = get_session()
+        try:
+            for row in session.query(ResolvedPeer).all():
+                self._peers[(row.client_name, row.chat_id)] = (
+                    _build_input_peer(row.peer_type, row.peer_id, row.access_hash),
+                    int(row.resolved_chat_id)
+                )
+        finally:
+            session.close()
+
+    def _save(self, client_name: str, chat_db_id: int, input_peer, resolved_chat_id: int) -> None:
+        peer_type, peer_id, access_hash = _describe_input_peer(input_peer)
+        session = get_session()
+        try:
+            row = session.query(ResolvedPeer).filter_by(chat_id=chat_db_id, client_name=client_name).first()
+            if row is None:
+                row = ResolvedPeer(chat_id=chat_db_id, client_name=client_name)
+                session.add(row)
+            row.resolved_chat_id = str(resolved_chat_id)
+            row.peer_type = peer_type
+            row.peer_id = peer_id
+            row.access_hash = access_hash
+            row.updated_at = time.time()
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"保存聊天 {chat_db_id} 的Peer缓存失败: {str(e)}")
+        finally:
+            session.close()
+
+    def _delete(self, client_name: str, chat_db_id: int) -> None:
+        session = get_session()
+        try:
+            session.query(ResolvedPeer).filter_by(chat_id=chat_db_id, client_name=client_name).delete()
+            session.commit()
+        finally:
+            session.close()
+
+    async def remember(self, client_name: str, chat_db_id: int, entity) -> None:
+        """保存已获取到的实体，供聊天信息更新器等已有实体的调用方使用"""
+        input_peer = utils.get_input_peer(entity)
+        resolved_chat_id = utils.get_peer_id(entity)
+        self._peers[(client_name, chat_db_id)] = (input_peer, resolved_chat_id)
+        await run_db(self._save, client_name, chat_db_id, input_peer, resolved_chat_id)
+
+    async def _resolve_remote(self, client, telegram_chat_id, priority=REALTIME):
+        errors = []
+        for candidate in get_candidate_chat_ids(telegram_chat_id):
+            try:
+                await global_rate_limiter.get_token(HISTORY, client=client, priority=priority)
+                return await client.get_entity(candidate)
+            except Exception as e:
+                errors.append(f"{candidate}: {str(e)}")
+        logger.warning(f"无法获取聊天实体 {telegram_chat_id}: {'; '.join(errors)}")
+        return None
+
+    async def resolve(self, client, chat) -> Tuple[Optional[object], int]:
+        """获取客户端访问目标聊天所需的InputPeer和可用的聊天ID
+
+        Args:
+            client: 客户端
+            chat: Chat对象
+
+        Returns:
+            (InputPeer, 聊天ID)，无法解析时InputPeer为None，聊天ID为原始ID
+        """
+        client_name = await self._client_name(client)
+        cached = self._peers.get((client_name, chat.id))
+        if cached:
+            self.hit_count += 1
+            return cached
+
+        self.miss_count += 1
+        entity = await self._resolve_remote(client, chat.telegram_chat_id)
+        if entity is None:
+            return None, int(chat.telegram_chat_id)
+        await self.remember(client_name, chat.id, entity)
+        logger.info(f"已缓存聊天 {chat.name} 的Peer: {utils.get_peer_id(entity)} ({client_name})")
+        return self._peers[(client_name, chat.id)]
+
+    async def invalidate(self, client, chat_db_id: int) -> None:
+        """目标聊天的Peer失效（如被踢出频道）时删除缓存"""
+        client_name = await self._client_name(client)
+        if self._peers.pop((client_name, chat_db_id), None) is not None:
+            await run_db(self._delete, client_name, chat_db_id)
+            logger.info(f"聊天 {chat_db_id} 的Peer缓存已失效 ({client_name})")
+
+    def forget_chats(self, chat_db_ids) -> None:
+        """聊天记录被删除后移除其内存中的缓存，数据库中的记录由调用方删除"""
+        chat_db_ids = set(chat_db_ids)
+        for key in [key for key in self._peers if key[1] in chat_db_ids]:
+            del self._peers[key]
+
+    def clear(self) -> None:
+        """清空内存中的缓存"""
+        self._peers.clear()
+
+    def _get_target_chats(self) -> Dict[str, list]:
+        """按发送客户端分组的目标聊天"""
+        session = get_session()
+        try:
+            targets = {'bot': {}, 'user': {}}
+            for rule in session.query(ForwardRule).all():
+                chat = rule.target_chat
+                if chat:
+                    targets['bot' if rule.use_bot else 'user'][chat.id] = (chat.id, chat.telegram_chat_id, chat.name)
+            return {name: list(chats.values()) for name, chats in targets.items()}
+        finally:
+            session.close()
+
+    async def refresh(self, client_name: str, only_missing: bool = False) -> int:
+        """重新解析客户端的所有目标聊天
+
+        Args:
+            client_name: 'user' 或 'bot'
+            only_missing: 只解析尚未缓存的聊天
+
+        Returns:
+            int: 成功解析的聊天数量
+        """
+        client = self.bot_client if client_name == 'bot' else self.user_client
+        if client is None:
+            return 0
+        targets = await run_db(self._get_target_chats)
+        resolved = 0
+        for chat_db_id, telegram_chat_id, name in targets.get(client_name, []):
+            if only_missing and (client_name, chat_db_id) in self._peers:
+                continue
+            entity = await self._resolve_remote(client, telegram_chat_id, priority=BULK)
+            if entity is not None:
+                await self.remember(client_name, chat_db_id, entity)
+                resolved += 1
+        logger.info(f"已刷新 {resolved} 个目标聊天的Peer缓存 ({client_name})")
+        return resolved
+
+    def get_stats(self) -> dict:
+        """获取缓存统计"""
+        return {
+            "peers": len(self._peers),
+            "hits": self.hit_count,
+            "misses": self.miss_count,
+        }
+
+    async def start(self, user_client, bot_client):
+        """加载持久化的Peer缓存，并在后台预热尚未缓存的目标聊天"""
+        self.user_client = user_client
+        self.bot_client = bot_client
+        await run_db(self._load)
+        logger.info(f"已加载 {len(self._peers)} 个Peer缓存")
+        self.task = asyncio.create_task(self._warm())
+
+    async def _warm(self):
+        try:
+            for client_name in ('bot', 'user'):
+                await self.refresh(client_name, only_missing=True)
+        except asyncio.CancelledError:
+            logger.info("Peer缓存预热任务已取消")
+        except Exception as e:
+            logger.error(f"Peer缓存预热出错: {str(e)}")
+
+    def stop(self):
+        """停止预热任务"""
+        if self.task:
+            self.task.cancel()
+
+
+peer_cache_manager = PeerCacheManager()
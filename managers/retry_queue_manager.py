@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict
+from utils.constants import FLOOD_RETRY_MAX_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetryJob:
+    """一条等待重试的消息，从过滤器链的第index个过滤器继续处理"""
+    chain: object
+    context: object
+    index: int
+    ready_at: float
+    attempts: int = 0
+    rescheduled: bool = False
+
+
+class RetryQueueManager:
+    """
+    延迟重试队列管理器，按目标聊天排队，同一目标的消息按进入队列的顺序依次重试
+    """
+
+    def __init__(self):
+        self._queues: Dict[int, Deque[RetryJob]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self.deferred_count = 0
+        self.retried_count = 0
+        self.dropped_count = 0
+        logger.info("RetryQueueManager 初始化")
+
+    def has_pending(self, key: int, context=None) -> bool:
+        """目标聊天是否有排在该消息之前的消息在等待重试
+
+        已在队列中的消息只需等待排在它前面的消息，排在它后面的消息不影响它的发送。
+        """
+        queue = self._queues.get(key)
+        if not queue:
+            return False
+        # 队列按顺序处理，只要队首不是该消息，就有消息排在它前面
+        return queue[0].context is not context
+
+    def defer(self, key: int, delay: float, chain, context, index: int, is_retry: bool = True) -> bool:
+        """将消息加入目标聊天的重试队列
+
+        Args:
+            key: 目标聊天在chats表中的ID
+            delay: 最早多少秒后重试
+            chain: 过滤器链
+            context: 消息上下文
+            index: 从第几个过滤器继续处理
+            is_retry: 是否因发送失败而重试，为False时只是排在前面的消息之后
+
+        Returns:
+            bool: 是否已加入队列，超过最大重试次数时返回False
+        """
+        queue = self._queues.setdefault(key, deque())
+        ready_at = time.monotonic() + delay
+
+        for job in queue:
+            if job.context is context:
+                # 只是排在前面的消息之后时不计入重试次数
+                if not is_retry:
+                    job.index = index
+                    job.ready_at = ready_at
+                    job.rescheduled = True
+                    return True
+                job.attempts += 1
+                if job.attempts > FLOOD_RETRY_MAX_ATTEMPTS:
+                    self.dropped_count += 1
+                    logger.error(f"目标聊天 {key} 的消息重试 {FLOOD_RETRY_MAX_ATTEMPTS} 次后仍然失败，放弃发送")
+                    return False
+                job.index = index
+                job.ready_at = ready_at
+                job.rescheduled = True
+                logger.info(f"目标聊天 {key} 的消息将在 {delay} 秒后第 {job.attempts} 次重试")
+                return True
+
+        queue.append(RetryJob(chain=chain, context=context, index=index, ready_at=ready_at, attempts=1 if is_retry else 0))
+        self.deferred_count += 1
+        logger.info(f"目标聊天 {key} 的消息已加入重试队列，{delay} 秒后处理，队列长度: {len(queue)}")
+
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._run_worker(key))
+        return True
+
+    async def _run_worker(self, key: int):
+        """按顺序处理一个目标聊天的重试队列"""
+        queue = self._queues[key]
+        running = None
+        try:
+            while queue:
+                job = queue[0]
+                delay = job.ready_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                job.rescheduled = False
+                self.retried_count += 1
+                running = job
+                try:
+                    await job.chain.resume(job.context, job.index)
+                except Exception as e:
+                    logger.error(f"重试目标聊天 {key} 的消息时出错: {str(e)}")
+                running = None
+
+                if not job.rescheduled:
+                    queue.popleft()
+        except asyncio.CancelledError:
+            logger.info(f"目标聊天 {key} 的重试任务已取消，丢弃 {len(queue)} 条消息")
+            for job in queue:
+                # 正在处理的消息已由过滤器链释放临时文件
+                job.chain.abandon(job.context, release_files=job is not running)
+            queue.clear()
+            raise
+        finally:
+            self._workers.pop(key, None)
+            if not queue:
+                self._queues.pop(key, None)
+
+    def get_stats(self) -> dict:
+        """获取重试队列统计"""
+        return {
+            "pending": sum(len(queue) for queue in self._queues.values()),
+            "targets": len(self._queues),
+            "deferred": self.deferred_count,
+            "retried": self.retried_count,
+            "dropped": self.dropped_count,
+        }
+
+    def stop(self):
+        """取消所有重试任务"""
+        for task in list(self._workers.values()):
+            task.cancel()
+        logger.info("重试队列已停止")
+
+
+retry_queue_manager = RetryQueueManager()
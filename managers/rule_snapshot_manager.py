@@ -0,0 +1,423 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, fields, make_dataclass
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+from sqlalchemy import event
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList
+from sqlalchemy.orm import Session, joinedload, selectinload
+from enums.enums import AddMode
+from models.models import (
+    Chat, ForwardRule, Keyword, ReplaceRule, MediaTypes, MediaExtensions, PushConfig, RSSConfig, RuleSync
+)
+from models.db_executor import run_in_session
+from utils.constants import RULE_SNAPSHOT_TTL
+
+logger = logging.getLogger(__name__)
+
+# 媒体类型位掩码，检查顺序与MediaTypes字段一致
+MEDIA_TYPE_BITS = {
+    'photo': 1 << 0,
+    'document': 1 << 1,
+    'video': 1 << 2,
+    'audio': 1 << 3,
+    'voice': 1 << 4,
+}
+
+MEDIA_TYPE_NAMES = {
+    'photo': '图片',
+    'document': '文档',
+    'video': '视频',
+    'audio': '音频',
+    'voice': '语音',
+}
+
+NO_EXTENSION = "无扩展名"
+
+# 写入这些表会使规则快照失效
+SNAPSHOT_MODELS = (Chat, ForwardRule, Keyword, ReplaceRule, MediaTypes, MediaExtensions, PushConfig, RSSConfig, RuleSync)
+SNAPSHOT_TABLES = frozenset(model.__tablename__ for model in SNAPSHOT_MODELS)
+
+# 各表中用于定位受影响快照的列：(列名, 列值是规则ID还是聊天ID)
+RULE = 'rule'
+CHAT = 'chat'
+# 无法确定写入了哪些规则
+ALL = 'all'
+SNAPSHOT_KEYS = {
+    ForwardRule.__tablename__: ('id', RULE),
+    Chat.__tablename__: ('id', CHAT),
+    **{
+        model.__tablename__: ('rule_id', RULE)
+        for model in SNAPSHOT_MODELS if model not in (ForwardRule, Chat)
+    },
+}
+
+
+@dataclass(frozen=True, slots=True)
+class MediaPolicy:
+    """规则的媒体过滤策略，创建后不可修改"""
+    blocked_types: int = 0
+    extensions: FrozenSet[str] = frozenset()
+    extension_filter_mode: AddMode = AddMode.BLACKLIST
+
+    def blocked_type_of(self, media) -> Optional[str]:
+        """返回被屏蔽的媒体类型名，未被屏蔽时返回None"""
+        if not self.blocked_types:
+            return None
+        for name, bit in MEDIA_TYPE_BITS.items():
+            if self.blocked_types & bit and getattr(media, name, None):
+                return name
+        return None
+
+    def is_extension_allowed(self, extension: str) -> bool:
+        """判断扩展名是否被允许（扩展名需为小写且不带点）"""
+        if self.extension_filter_mode == AddMode.BLACKLIST:
+            return extension not in self.extensions
+        return extension in self.extensions
+
+
+@dataclass(frozen=True, slots=True)
+class ChatSnapshot:
+    id: int
+    telegram_chat_id: str
+    name: Optional[str]
+
+
+@dataclass(frozen=True, slots=True)
+class KeywordSnapshot:
+    keyword: str
+    is_regex: bool
+    is_blacklist: bool
+
+
+@dataclass(frozen=True, slots=True)
+class ReplaceRuleSnapshot:
+    pattern: str
+    content: Optional[str]
+
+
+@dataclass(frozen=True, slots=True)
+class PushConfigSnapshot:
+    id: int
+    enable_push_channel: bool
+    push_channel: str
+    media_send_mode: str
+
+
+@dataclass(frozen=True, slots=True)
+class RSSConfigSnapshot:
+    enable_rss: bool
+    rule_title: Optional[str]
+    rule_description: Optional[str]
+    language: Optional[str]
+    max_items: Optional[int]
+
+
+# 转发规则的只读快照：forward_rules表的全部字段，加上过滤器链用到的关联数据
+RuleSnapshot = make_dataclass(
+    'RuleSnapshot',
+    [column.name for column in ForwardRule.__table__.columns] + [
+        ('version', int),
+        ('source_chat', ChatSnapshot),
+        ('target_chat', ChatSnapshot),
+        ('keywords', Tuple[KeywordSnapshot, ...]),
+        ('replace_rules', Tuple[ReplaceRuleSnapshot, ...]),
+        ('push_configs', Tuple[PushConfigSnapshot, ...]),
+        ('rss_config', Optional[RSSConfigSnapshot]),
+        ('media_policy', MediaPolicy),
+    ],
+    frozen=True,
+    slots=True,
+)
+RuleSnapshot.__module__ = __name__
+RuleSnapshot.__doc__ = "转发规则的只读快照，过滤器链只读取快照，不访问ORM对象"
+
+
+def _copy(snapshot_cls, obj):
+    """按快照类的字段从ORM对象复制数据"""
+    return snapshot_cls(**{field.name: getattr(obj, field.name) for field in fields(snapshot_cls)})
+
+
+def _build_media_policy(rule) -> MediaPolicy:
+    blocked_types = 0
+    if rule.media_types:
+        for name, bit in MEDIA_TYPE_BITS.items():
+            if getattr(rule.media_types, name):
+                blocked_types |= bit
+    return MediaPolicy(
+        blocked_types=blocked_types,
+        extensions=frozenset(ext.extension.lower() for ext in rule.media_extensions),
+        extension_filter_mode=rule.extension_filter_mode or AddMode.BLACKLIST
+    )
+
+
+def build_rule_snapshot(rule, push_configs, version: int):
+    """从预加载了关联数据的ORM规则构建快照"""
+    values = {column.name: getattr(rule, column.name) for column in ForwardRule.__table__.columns}
+    return RuleSnapshot(
+        **values,
+        version=version,
+        source_chat=_copy(ChatSnapshot, rule.source_chat),
+        target_chat=_copy(ChatSnapshot, rule.target_chat),
+        keywords=tuple(_copy(KeywordSnapshot, keyword) for keyword in rule.keywords),
+        replace_rules=tuple(_copy(ReplaceRuleSnapshot, replace_rule) for replace_rule in rule.replace_rules),
+        push_configs=tuple(_copy(PushConfigSnapshot, config) for config in push_configs),
+        rss_config=_copy(RSSConfigSnapshot, rule.rss_config) if rule.rss_config else None,
+        media_policy=_build_media_policy(rule),
+    )
+
+
+def get_media_extension(media) -> Optional[str]:
+    """获取媒体文件的扩展名（小写、不带点），无法获取文件名时返回None"""
+    document = getattr(media, 'document', None)
+    if not document:
+        return None
+    for attr in getattr(document, 'attributes', []):
+        if hasattr(attr, 'file_name'):
+            _, extension = os.path.splitext(attr.file_name)
+            return extension.lstrip('.').lower() or NO_EXTENSION
+    return None
+
+
+class RuleSnapshotManager:
+    """
+    规则快照管理器，按源聊天缓存其全部转发规则的快照
+
+    本进程内的会话写入规则相关的表时，只失效包含被写入规则（或引用被写入聊天）的源聊天快照，
+    无法确定写入了哪些规则的批量写入和文本SQL使全部快照失效；
+    其他进程（如RSS服务）的修改在RULE_SNAPSHOT_TTL秒后生效。
+    每次失效都会递增版本号，加载期间发生失效的快照不会被缓存。
+    """
+
+    def __init__(self):
+        self._by_source: Dict[str, Tuple[int, float, Optional[ChatSnapshot], tuple]] = {}
+        # 规则ID、聊天ID到缓存中引用它们的源聊天
+        self._rule_sources: Dict[int, str] = {}
+        self._chat_sources: Dict[int, Set[str]] = {}
+        self._version = 0
+        self._lock = threading.Lock()
+        self.hit_count = 0
+        self.load_count = 0
+        logger.info("RuleSnapshotManager 初始化")
+
+    def _load_source(self, session, telegram_chat_id: str, version: int):
+        """在数据库线程中加载源聊天的全部规则及关联数据"""
+        source_chat = session.query(Chat).filter(Chat.telegram_chat_id == telegram_chat_id).first()
+        if not source_chat:
+            return None, ()
+
+        rules = session.query(ForwardRule).options(
+            joinedload(ForwardRule.source_chat),
+            joinedload(ForwardRule.target_chat),
+            joinedload(ForwardRule.media_types),
+            joinedload(ForwardRule.rss_config),
+            selectinload(ForwardRule.keywords),
+            selectinload(ForwardRule.replace_rules),
+            selectinload(ForwardRule.media_extensions),
+        ).filter(
+            ForwardRule.source_chat_id == source_chat.id
+        ).order_by(ForwardRule.id).all()
+
+        # 一条规则可以有多个推送配置，一次查询全部规则的配置
+        push_configs: Dict[int, list] = {}
+        if rules:
+            for config in session.query(PushConfig).filter(
+                PushConfig.rule_id.in_([rule.id for rule in rules])
+            ).order_by(PushConfig.id).all():
+                push_configs.setdefault(config.rule_id, []).append(config)
+
+        snapshots = tuple(
+            build_rule_snapshot(rule, push_configs.get(rule.id, ()), version)
+            for rule in rules
+        )
+        return _copy(ChatSnapshot, source_chat), snapshots
+
+    async def get_source_rules(self, chat_id) -> Tuple[Optional[ChatSnapshot], tuple]:
+        """获取源聊天及以其为源的全部规则快照
+
+        Args:
+            chat_id: 源聊天的Telegram ID
+
+        Returns:
+            (源聊天快照, 规则快照元组)，源聊天不存在时为 (None, ())
+        """
+        key = str(chat_id)
+        cached = self._by_source.get(key)
+        if cached and time.monotonic() - cached[1] < RULE_SNAPSHOT_TTL:
+            self.hit_count += 1
+            return cached[2], cached[3]
+
+        version = self._version
+        source_chat, rules = await run_in_session(self._load_source, key, version)
+        self.load_count += 1
+        with self._lock:
+            # 加载期间规则被修改时不缓存，下次重新加载
+            if version == self._version:
+                self._by_source[key] = (version, time.monotonic(), source_chat, rules)
+                if source_chat:
+                    self._chat_sources.setdefault(source_chat.id, set()).add(key)
+                for rule in rules:
+                    self._rule_sources[rule.id] = key
+                    self._chat_sources.setdefault(rule.target_chat.id, set()).add(key)
+        return source_chat, rules
+
+    def invalidate(self, *rule_ids: int) -> None:
+        """使包含这些规则的源聊天快照失效，不传规则ID时使全部快照失效
+
+        规则的写入会自动使快照失效，保留该方法供显式调用
+        """
+        if not rule_ids:
+            self.clear()
+            return
+        with self._lock:
+            self._version += 1
+            self._drop(self._rule_sources.pop(rule_id, None) for rule_id in rule_ids)
+
+    def invalidate_chats(self, *chat_ids: int) -> None:
+        """使以这些聊天为源或目标的快照失效"""
+        with self._lock:
+            self._version += 1
+            for chat_id in chat_ids:
+                self._drop(self._chat_sources.pop(chat_id, ()))
+
+    def _drop(self, keys: Iterable[Optional[str]]) -> None:
+        for key in keys:
+            if key is not None:
+                self._by_source.pop(key, None)
+
+    def clear(self) -> None:
+        """递增版本号并清空所有快照"""
+        with self._lock:
+            self._version += 1
+            self._by_source = {}
+            self._rule_sources = {}
+            self._chat_sources = {}
+
+    def get_stats(self) -> dict:
+        """获取快照缓存统计"""
+        return {
+            "version": self._version,
+            "sources": len(self._by_source),
+            "hits": self.hit_count,
+            "loads": self.load_count,
+        }
+
+
+rule_snapshot_manager = RuleSnapshotManager()
+
+
+def _where_values(whereclause, column: str):
+    """从 column = 值 或 column IN (值) 形式的条件中取出值，条件是AND连接时取其中一项，无法确定时返回None"""
+    if whereclause is None:
+        return None
+    if isinstance(whereclause, BooleanClauseList) and whereclause.operator is operators.and_:
+        terms = whereclause.clauses
+    else:
+        terms = (whereclause,)
+    for term in terms:
+        if not isinstance(term, BinaryExpression) or getattr(term.left, 'name', None) != column:
+            continue
+        if not isinstance(term.right, BindParameter):
+            continue
+        value = term.right.effective_value
+        if term.operator is operators.eq:
+            return [value]
+        if term.operator is operators.in_op:
+            return list(value)
+    return None
+
+
+def _mark_dirty(session, kind=None, ids=()) -> None:
+    """会话写入了规则相关的表：立即使对应的快照失效，提交后再失效一次
+
+    写入到提交之间加载的快照读到的是旧数据，提交后的失效保证它们不会被继续使用。
+    kind为None时表示无法确定写入了哪些规则，使全部快照失效。
+    """
+    dirty = session.info.get('rule_snapshot_dirty')
+    if kind is None or dirty == ALL:
+        session.info['rule_snapshot_dirty'] = ALL
+        rule_snapshot_manager.clear()
+        return
+    if dirty is None:
+        dirty = session.info['rule_snapshot_dirty'] = {RULE: set(), CHAT: set()}
+    ids = {value for value in ids if value is not None}
+    dirty[kind].update(ids)
+    _invalidate(kind, ids)
+
+
+def _invalidate(kind, ids) -> None:
+    if not ids:
+        return
+    if kind == RULE:
+        rule_snapshot_manager.invalidate(*ids)
+    else:
+        rule_snapshot_manager.invalidate_chats(*ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_on_flush(session, flush_context):
+    """会话写入规则相关的对象时使对应规则的快照失效"""
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, ForwardRule):
+            # 新规则或更换源聊天的规则还不在缓存的映射中，按源聊天失效
+            _mark_dirty(session, RULE, (obj.id,))
+            _mark_dirty(session, CHAT, (obj.source_chat_id,))
+        elif isinstance(obj, Chat):
+            _mark_dirty(session, CHAT, (obj.id,))
+        elif isinstance(obj, SNAPSHOT_MODELS):
+            _mark_dirty(session, RULE, (obj.rule_id,))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _invalidate_on_execute(orm_execute_state):
+    """批量写入以及文本SQL写入规则相关的表时使快照失效"""
+    if orm_execute_state.is_select:
+        return
+    statement = orm_execute_state.statement
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(getattr(statement, 'table', None), 'name', None)
+        if table not in SNAPSHOT_TABLES:
+            return
+        column, kind = SNAPSHOT_KEYS[table]
+        if orm_execute_state.is_insert:
+            if table == Chat.__tablename__:
+                # 新聊天还没有被任何快照引用
+                return
+            if table == ForwardRule.__tablename__:
+                column, kind = 'source_chat_id', CHAT
+            parameters = orm_execute_state.parameters
+            rows = parameters if isinstance(parameters, (list, tuple)) else [parameters or {}]
+            values = [row.get(column) for row in rows]
+            if values and None not in values:
+                _mark_dirty(orm_execute_state.session, kind, values)
+                return
+        else:
+            values = _where_values(statement.whereclause, column)
+            if values is not None:
+                _mark_dirty(orm_execute_state.session, kind, values)
+                return
+        _mark_dirty(orm_execute_state.session)
+        return
+    text = str(statement).lstrip().lower()
+    if text.startswith(('insert', 'update', 'delete', 'replace')) and any(table in text for table in SNAPSHOT_TABLES):
+        _mark_dirty(orm_execute_state.session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    """事务中的所有写入提交后统一失效一次"""
+    if 'rule_snapshot_dirty' not in session.info:
+        return
+    dirty = session.info.pop('rule_snapshot_dirty')
+    if dirty == ALL:
+        rule_snapshot_manager.clear()
+        return
+    for kind, ids in dirty.items():
+        _invalidate(kind, ids)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _reset_on_rollback(session, previous_transaction):
+    session.info.pop('rule_snapshot_dirty', None)
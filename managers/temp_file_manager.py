@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+from utils.constants import TEMP_DIR, TEMP_FILE_MAX_AGE, TEMP_SWEEP_INTERVAL
+from utils.media import is_memory_file
+
+logger = logging.getLogger(__name__)
+
+class TempFileManager:
+    """
+    临时文件管理器，对临时目录中的文件进行引用计数，最后一个使用者释放后删除文件
+    """
+
+    def __init__(self, temp_dir: str = TEMP_DIR):
+        self.temp_dir = os.path.abspath(temp_dir)
+        self._refs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.deleted_count = 0
+        self.deleted_bytes = 0
+        self.swept_count = 0
+        self.swept_bytes = 0
+        logger.info("TempFileManager 初始化")
+
+    def _key(self, path) -> str:
+        return os.path.abspath(str(path))
+
+    def _is_managed(self, path) -> bool:
+        """只管理临时目录中的磁盘文件，内存缓冲区不参与引用计数"""
+        if not path or is_memory_file(path):
+            return False
+        return os.path.dirname(self._key(path)) == self.temp_dir
+
+    def _delete(self, key: str) -> int:
+        """删除文件并返回删除的字节数"""
+        try:
+            size = os.path.getsize(key)
+            os.remove(key)
+            return size
+        except FileNotFoundError:
+            return 0
+
+    def track(self, path):
+        """登记新下载的临时文件，调用者持有一个引用
+
+        Args:
+            path: 文件路径或内存缓冲区
+
+        Returns:
+            原样返回path，便于链式调用
+        """
+        if not self._is_managed(path):
+            return path
+        key = self._key(path)
+        with self._lock:
+            self._refs[key] = self._refs.get(key, 0) + 1
+        logger.debug(f"登记临时文件: {key}, 引用数: {self._refs[key]}")
+        return path
+
+    def acquire(self, path):
+        """为已登记的临时文件增加一个引用"""
+        if not self._is_managed(path):
+            return path
+        key = self._key(path)
+        with self._lock:
+            if key in self._refs:
+                self._refs[key] += 1
+        return path
+
+    def release(self, path) -> bool:
+        """释放一个引用，最后一个引用释放时删除文件
+
+        Args:
+            path: 文件路径或内存缓冲区
+
+        Returns:
+            bool: 文件是否已被删除
+        """
+        if not self._is_managed(path):
+            return False
+        key = self._key(path)
+        with self._lock:
+            count = self._refs.get(key, 0) - 1
+            if count > 0:
+                self._refs[key] = count
+                return False
+            self._refs.pop(key, None)
+        try:
+            size = self._delete(key)
+            self.deleted_count += 1
+            self.deleted_bytes += size
+            logger.info(f"删除临时文件: {key}")
+            return True
+        except Exception as e:
+            logger.error(f"删除临时文件失败: {key}, 错误: {str(e)}")
+            return False
+
+    def release_all(self, paths) -> None:
+        """释放一组文件的引用"""
+        for path in list(paths or []):
+            self.release(path)
+
+    @contextmanager
+    def hold(self, paths):
+        """在使用期间持有一组文件的引用"""
+        paths = list(paths or [])
+        for path in paths:
+            self.acquire(path)
+        try:
+            yield paths
+        finally:
+            self.release_all(paths)
+
+    def sweep(self, max_age: Optional[float] = None) -> int:
+        """清理临时目录中未被引用的文件
+
+        Args:
+            max_age: 文件最小存在时间（秒），为None时清理全部未引用文件
+
+        Returns:
+            int: 清理的文件数量
+        """
+        if not os.path.isdir(self.temp_dir):
+            return 0
+        now = time.time()
+        swept = 0
+        with self._lock:
+            tracked = set(self._refs)
+        for entry in os.scandir(self.temp_dir):
+            try:
+                if not entry.is_file() or entry.path in tracked:
+                    continue
+                if max_age is not None and now - entry.stat().st_mtime < max_age:
+                    continue
+                size = self._delete(entry.path)
+                swept += 1
+                self.swept_count += 1
+                self.swept_bytes += size
+            except Exception as e:
+                logger.error(f"清理临时文件失败: {entry.path}, 错误: {str(e)}")
+        if swept:
+            logger.info(f"清理了 {swept} 个过期临时文件")
+        return swept
+
+    def get_stats(self) -> dict:
+        """获取临时文件与磁盘占用统计"""
+        with self._lock:
+            tracked = dict(self._refs)
+        tracked_bytes = 0
+        for key in tracked:
+            try:
+                tracked_bytes += os.path.getsize(key)
+            except OSError:
+                pass
+        disk_files = 0
+        disk_bytes = 0
+        if os.path.isdir(self.temp_dir):
+            for entry in os.scandir(self.temp_dir):
+                if entry.is_file():
+                    disk_files += 1
+                    try:
+                        disk_bytes += entry.stat().st_size
+                    except OSError:
+                        pass
+        usage = shutil.disk_usage(self.temp_dir) if os.path.isdir(self.temp_dir) else None
+        return {
+            "tracked_files": len(tracked),
+            "tracked_refs": sum(tracked.values()),
+            "tracked_bytes": tracked_bytes,
+            "disk_files": disk_files,
+            "disk_bytes": disk_bytes,
+            "deleted_files": self.deleted_count,
+            "deleted_bytes": self.deleted_bytes,
+            "swept_files": self.swept_count,
+            "swept_bytes": self.swept_bytes,
+            "disk_free_bytes": usage.free if usage else 0,
+            "disk_total_bytes": usage.total if usage else 0,
+        }
+
+    async def start(self):
+        """启动时清理残留文件，并启动定时清理任务"""
+        os.makedirs(self.temp_dir, exist_ok=True)
+        swept = await asyncio.to_thread(self.sweep)
+        logger.info(f"启动清理完成，删除了 {swept} 个残留临时文件")
+        if TEMP_SWEEP_INTERVAL > 0:
+            self.task = asyncio.create_task(self._run_sweep_task())
+            logger.info(f"临时文件定时清理已启动，间隔: {TEMP_SWEEP_INTERVAL} 秒")
+
+    async def _run_sweep_task(self):
+        """定时清理过期的未引用临时文件"""
+        while True:
+            try:
+                await asyncio.sleep(TEMP_SWEEP_INTERVAL)
+                await asyncio.to_thread(self.sweep, TEMP_FILE_MAX_AGE)
+                stats = self.get_stats()
+                logger.info(f"临时目录统计: 文件 {stats['disk_files']} 个, 占用 {stats['disk_bytes'] // 1024} KB, 引用中 {stats['tracked_files']} 个")
+            except asyncio.CancelledError:
+                logger.info("临时文件清理任务已取消")
+                break
+            except Exception as e:
+                logger.error(f"临时文件清理任务出错: {str(e)}")
+
+    def stop(self):
+        """停止定时清理任务"""
+        if self.task:
+            self.task.cancel()
+            logger.info("临时文件清理任务已停止")
+
+temp_file_manager = TempFileManager()
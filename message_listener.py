@@ -1,5 +1,5 @@
 from telethon import events
-from models.models import get_session, Chat, ForwardRule
+from managers.rule_snapshot_manager import rule_snapshot_manager
 import logging
 from handlers import user_handler, bot_handler
 from handlers.prompt_handlers import handle_prompt_setting
@@ -112,13 +112,9 @@ async def handle_user_message(event, user_client, bot_client):
         PROCESSED_GROUPS.add(group_key)
         asyncio.create_task(clear_group_cache(group_key))
     
-    # 首先检查数据库中是否有该聊天的转发规则
-    session = get_session()
     try:
-        # 查询源聊天
-        source_chat = session.query(Chat).filter(
-            Chat.telegram_chat_id == str(chat_id)
-        ).first()
+        # 首先检查数据库中是否有该聊天的转发规则，使用缓存的规则快照
+        source_chat, rules = await rule_snapshot_manager.get_source_rules(chat_id)
         
         if not source_chat:
             return
@@ -126,11 +122,6 @@ async def handle_user_message(event, user_client, bot_client):
         # 添加日志：查询转发规则
         logger.info(f'找到源聊天: {source_chat.name} (ID: {source_chat.id})')
         
-        # 查找以当前聊天为源的规则
-        rules = session.query(ForwardRule).filter(
-            ForwardRule.source_chat_id == source_chat.id
-        ).all()
-        
         if not rules:
             logger.info(f'聊天 {source_chat.name} 没有转发规则')
             return
@@ -160,8 +151,6 @@ async def handle_user_message(event, user_client, bot_client):
     except Exception as e:
         logger.error(f'处理用户消息时发生错误: {str(e)}')
         logger.exception(e)  # 添加详细的错误堆栈
-    finally:
-        session.close()
 
 async def handle_bot_message(event, bot_client):
     """处理机器人客户端收到的消息（命令）"""
@@ -0,0 +1,60 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from models.models import get_session
+from utils.constants import DB_THREADS
+
+logger = logging.getLogger(__name__)
+
+# 专用的数据库线程池，同步的SQLAlchemy查询在这里执行，不阻塞事件循环
+_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='db')
+
+
+async def run_db(func, *args, **kwargs):
+    """在数据库线程中执行同步函数
+
+    Args:
+        func: 同步函数
+        *args, **kwargs: 传给函数的参数
+
+    Returns:
+        函数的返回值
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_in_session(func, *args, commit=False, **kwargs):
+    """在数据库线程中创建会话并执行 func(session, *args, **kwargs)
+
+    会话在函数返回后关闭，返回的ORM对象需要在函数内预加载所需的关联并从会话中分离，
+    否则在事件循环中访问未加载的属性会出错。
+
+    Args:
+        func: 以会话为第一个参数的同步函数
+        commit: 函数成功返回后是否提交
+
+    Returns:
+        函数的返回值
+    """
+    def call():
+        session = get_session()
+        try:
+            result = func(session, *args, **kwargs)
+            if commit:
+                session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    return await run_db(call)
+
+
+def shutdown_db_executor():
+    """关闭数据库线程池，等待已提交的操作完成"""
+    _executor.shutdown(wait=True)
+    logger.info("数据库线程池已关闭")
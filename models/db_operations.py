@@ -10,6 +10,11 @@ from pathlib import Path
 from dotenv import load_dotenv
 from ufb.ufb_client import UFBClient
 from models.models import get_session
+from models.db_executor import run_db
+from models.rule_sync import (
+    get_sync_closure, add_keywords_to_rules, delete_keywords_from_rules,
+    add_replace_rules_to_rules, delete_replace_rules_from_rules
+)
 from sqlalchemy import text
 from enums.enums import ForwardMode, PreviewMode, MessageMode, AddMode, HandleMode
 
@@ -140,9 +145,14 @@ class DBOperations:
     async def sync_from_json(self, config):
         """从收到的JSON配置同步关键字到数据库
         
+        重写大量关键字的提交较慢，在数据库线程中执行，不阻塞消息接收
+        
         Args:
             config: 收到的配置数据
         """
+        await run_db(self._sync_from_json, config)
+
+    def _sync_from_json(self, config):
         logger.info(f"从JSON同步关键字到数据库")
         session = get_session()
         try:
@@ -206,7 +216,7 @@ class DBOperations:
             session.close()
 
     async def add_keywords(self, session, rule_id, keywords, is_regex=False, is_blacklist=False):
-        """添加关键字到规则
+        """添加关键字到规则，启用同步时一并添加到同步闭包中的所有规则
 
         Args:
             session: 数据库会话
@@ -218,82 +228,18 @@ class DBOperations:
         Returns:
             tuple: (成功数量, 重复数量)
         """
-        success_count = 0
-        duplicate_count = 0
-
         rule = session.query(ForwardRule).get(rule_id)
         if not rule:
             logger.error(f"规则ID {rule_id} 不存在")
             return 0, 0
 
-        for keyword in keywords:
-            try:
-                existing_keyword = session.query(Keyword).filter(
-                    Keyword.rule_id == rule_id,
-                    Keyword.keyword == keyword,
-                    Keyword.is_blacklist == is_blacklist
-                ).first()
-
-                if existing_keyword:
-                    duplicate_count += 1
-                    continue
+        success_count = add_keywords_to_rules(session, [rule_id], keywords, is_regex, is_blacklist)
+        duplicate_count = len(keywords) - success_count
 
-                new_keyword = Keyword(
-                    rule_id=rule_id,
-                    keyword=keyword,
-                    is_regex=is_regex,
-                    is_blacklist=is_blacklist
-                )
-                session.add(new_keyword)
-                session.flush()
-                success_count += 1
-            except Exception as e:
-                logger.error(f"添加关键字时出错: {str(e)}")
-                session.rollback()
-                duplicate_count += 1
-                continue
-
-        if rule.enable_sync:
-            logger.info(f"规则 {rule_id} 启用了同步功能，正在同步关键字到关联规则")
-            sync_rules = session.query(RuleSync).filter(RuleSync.rule_id == rule_id).all()
-            
-            for sync_rule in sync_rules:
-                sync_rule_id = sync_rule.sync_rule_id
-                logger.info(f"正在同步关键字到规则 {sync_rule_id}")
-                
-                target_rule = session.query(ForwardRule).get(sync_rule_id)
-                if not target_rule:
-                    logger.warning(f"同步目标规则 {sync_rule_id} 不存在，跳过")
-                    continue
-                
-                sync_success = 0
-                sync_duplicate = 0
-                for keyword in keywords:
-                    try:
-                        existing_keyword = session.query(Keyword).filter(
-                            Keyword.rule_id == sync_rule_id,
-                            Keyword.keyword == keyword,
-                            Keyword.is_blacklist == is_blacklist
-                        ).first()
-                        
-                        if existing_keyword:
-                            sync_duplicate += 1
-                            continue
-                            
-                        new_keyword = Keyword(
-                            rule_id=sync_rule_id,
-                            keyword=keyword,
-                            is_regex=is_regex,
-                            is_blacklist=is_blacklist
-                        )
-                        session.add(new_keyword)
-                        session.flush()
-                        sync_success += 1
-                    except Exception as e:
-                        logger.error(f"同步关键字到规则 {sync_rule_id} 时出错: {str(e)}")
-                        continue
-                
-                logger.info(f"同步规则 {sync_rule_id} 的结果: 成功={sync_success}, 重复={sync_duplicate}")
+        sync_rule_ids = get_sync_closure(session, rule_id) if rule.enable_sync else ()
+        if sync_rule_ids:
+            sync_success = add_keywords_to_rules(session, sync_rule_ids, keywords, is_regex, is_blacklist)
+            logger.info(f"规则 {rule_id} 的关键字已同步到规则 {list(sync_rule_ids)}: 成功={sync_success}")
 
         await self.sync_to_server(session, rule_id)
         return success_count, duplicate_count
@@ -314,7 +260,7 @@ class DBOperations:
         ).all()
 
     async def delete_keywords(self, session, rule_id, indices):
-        """删除指定索引的关键字
+        """删除指定索引的关键字，启用同步时一并删除同步闭包中所有规则的相同关键字
         
         Args:
             session: 数据库会话
@@ -328,63 +274,30 @@ class DBOperations:
         if not rule:
             logger.error(f"规则ID {rule_id} 不存在")
             return 0, []
-            
-        keywords = await self.get_keywords(session, rule_id, 'blacklist' if rule.add_mode == AddMode.BLACKLIST else 'whitelist')
+
+        add_mode = 'blacklist' if rule.add_mode == AddMode.BLACKLIST else 'whitelist'
+        keywords = await self.get_keywords(session, rule_id, add_mode)
         if not keywords:
             return 0, []
-            
-        deleted_count = 0
-        max_id = len(keywords)
-        
-        keywords_to_delete = []
-        for idx in indices:
-            if 1 <= idx <= max_id:
-                keyword = keywords[idx - 1]
-                keywords_to_delete.append({
-                    'keyword': keyword.keyword,
-                    'is_regex': keyword.is_regex,
-                    'is_blacklist': keyword.is_blacklist
-                })
-                session.delete(keyword)
-                deleted_count += 1
-        
-        if rule.enable_sync and keywords_to_delete:
-            logger.info(f"规则 {rule_id} 启用了同步功能，正在同步删除关联规则的关键字")
-            sync_rules = session.query(RuleSync).filter(RuleSync.rule_id == rule_id).all()
-            
-            for sync_rule in sync_rules:
-                sync_rule_id = sync_rule.sync_rule_id
-                logger.info(f"正在同步删除规则 {sync_rule_id} 的关键字")
-                
-                target_rule = session.query(ForwardRule).get(sync_rule_id)
-                if not target_rule:
-                    logger.warning(f"同步目标规则 {sync_rule_id} 不存在，跳过")
-                    continue
-                
-                sync_deleted = 0
-                for kw_info in keywords_to_delete:
-                    try:
-                        target_keywords = session.query(Keyword).filter(
-                            Keyword.rule_id == sync_rule_id,
-                            Keyword.keyword == kw_info['keyword'],
-                            Keyword.is_regex == kw_info['is_regex'],
-                            Keyword.is_blacklist == kw_info['is_blacklist']
-                        ).all()
-                        
-                        for target_kw in target_keywords:
-                            session.delete(target_kw)
-                            sync_deleted += 1
-                    except Exception as e:
-                        logger.error(f"同步删除规则 {sync_rule_id} 的关键字时出错: {str(e)}")
-                        continue
-                
-                logger.info(f"同步删除规则 {sync_rule_id} 的关键字: 删除了 {sync_deleted} 个")
+
+        keywords_to_delete = [keywords[idx - 1] for idx in sorted(set(indices)) if 1 <= idx <= len(keywords)]
+        if keywords_to_delete:
+            rows = [
+                {'keyword': keyword.keyword, 'is_regex': keyword.is_regex, 'is_blacklist': keyword.is_blacklist}
+                for keyword in keywords_to_delete
+            ]
+            sync_rule_ids = get_sync_closure(session, rule_id) if rule.enable_sync else ()
+            deleted = delete_keywords_from_rules(session, [rule_id, *sync_rule_ids], rows)
+            for keyword in keywords_to_delete:
+                session.expunge(keyword)
+            if sync_rule_ids:
+                logger.info(f"已同步删除规则 {list(sync_rule_ids)} 的关键字，共删除 {deleted} 个")
 
         await self.sync_to_server(session, rule_id)
-        return deleted_count, await self.get_keywords(session, rule_id, 'blacklist' if rule.add_mode == AddMode.BLACKLIST else 'whitelist')
+        return len(keywords_to_delete), await self.get_keywords(session, rule_id, add_mode)
 
     async def add_replace_rules(self, session, rule_id, patterns, contents=None):
-        """添加替换规则
+        """添加替换规则，启用同步时一并添加到同步闭包中的所有规则
         
         Args:
             session: 数据库会话
@@ -400,81 +313,19 @@ class DBOperations:
         if not rule:
             logger.error(f"规则ID {rule_id} 不存在")
             return 0, 0
-            
-        success_count = 0
-        duplicate_count = 0
-        
+
         if contents is None:
             contents = [''] * len(patterns)
-        
-        added_rules = []  # 存储成功添加的规则，用于后续同步
-        for pattern, content in zip(patterns, contents):
-            try:
-                existing_rule = session.query(ReplaceRule).filter(
-                    ReplaceRule.rule_id == rule_id,
-                    ReplaceRule.pattern == pattern,
-                    ReplaceRule.content == content
-                ).first()
-                
-                if existing_rule:
-                    duplicate_count += 1
-                    continue
-                    
-                new_rule = ReplaceRule(
-                    rule_id=rule_id,
-                    pattern=pattern,
-                    content=content
-                )
-                session.add(new_rule)
-                session.flush()
-                success_count += 1
-                added_rules.append({'pattern': pattern, 'content': content})
-            except IntegrityError:
-                session.rollback()
-                duplicate_count += 1
-                continue
-        
-        if rule.enable_sync and added_rules:
-            logger.info(f"规则 {rule_id} 启用了同步功能，正在同步添加替换规则到关联规则")
-            sync_rules = session.query(RuleSync).filter(RuleSync.rule_id == rule_id).all()
-            
-            for sync_rule in sync_rules:
-                sync_rule_id = sync_rule.sync_rule_id
-                logger.info(f"正在同步添加替换规则到规则 {sync_rule_id}")
-                
-                target_rule = session.query(ForwardRule).get(sync_rule_id)
-                if not target_rule:
-                    logger.warning(f"同步目标规则 {sync_rule_id} 不存在，跳过")
-                    continue
-                
-                sync_success = 0
-                sync_duplicate = 0
-                for rule_info in added_rules:
-                    try:
-                        existing_rule = session.query(ReplaceRule).filter(
-                            ReplaceRule.rule_id == sync_rule_id,
-                            ReplaceRule.pattern == rule_info['pattern'],
-                            ReplaceRule.content == rule_info['content']
-                        ).first()
-                        
-                        if existing_rule:
-                            sync_duplicate += 1
-                            continue
-                            
-                        new_rule = ReplaceRule(
-                            rule_id=sync_rule_id,
-                            pattern=rule_info['pattern'],
-                            content=rule_info['content']
-                        )
-                        session.add(new_rule)
-                        session.flush()
-                        sync_success += 1
-                    except Exception as e:
-                        logger.error(f"同步添加替换规则到规则 {sync_rule_id} 时出错: {str(e)}")
-                        continue
-                
-                logger.info(f"同步规则 {sync_rule_id} 的替换规则添加结果: 成功={sync_success}, 重复={sync_duplicate}")
-        
+        replace_rules = [{'pattern': pattern, 'content': content} for pattern, content in zip(patterns, contents)]
+
+        success_count = add_replace_rules_to_rules(session, [rule_id], replace_rules)
+        duplicate_count = len(replace_rules) - success_count
+
+        sync_rule_ids = get_sync_closure(session, rule_id) if rule.enable_sync and success_count else ()
+        if sync_rule_ids:
+            sync_success = add_replace_rules_to_rules(session, sync_rule_ids, replace_rules)
+            logger.info(f"规则 {rule_id} 的替换规则已同步到规则 {list(sync_rule_ids)}: 成功={sync_success}")
+
         return success_count, duplicate_count
 
     async def get_replace_rules(self, session, rule_id):
@@ -492,7 +343,7 @@ class DBOperations:
         ).all()
 
     async def delete_replace_rules(self, session, rule_id, indices):
-        """删除指定索引的替换规则
+        """删除指定索引的替换规则，启用同步时一并删除同步闭包中所有规则的相同替换规则
         
         Args:
             session: 数据库会话
@@ -507,57 +358,22 @@ class DBOperations:
         if not rule:
             logger.error(f"规则ID {rule_id} 不存在")
             return 0, []
-            
+
         rules = await self.get_replace_rules(session, rule_id)
         if not rules:
             return 0, []
-            
-        deleted_count = 0
-        max_id = len(rules)
-        
-        rules_to_delete = []
-        for idx in indices:
-            if 1 <= idx <= max_id:
-                replace_rule = rules[idx - 1]
-                rules_to_delete.append({
-                    'pattern': replace_rule.pattern,
-                    'content': replace_rule.content
-                })
-                session.delete(replace_rule)
-                deleted_count += 1
-        
-        if rule.enable_sync and rules_to_delete:
-            logger.info(f"规则 {rule_id} 启用了同步功能，正在同步删除关联规则的替换规则")
-            sync_rules = session.query(RuleSync).filter(RuleSync.rule_id == rule_id).all()
-            
-            for sync_rule in sync_rules:
-                sync_rule_id = sync_rule.sync_rule_id
-                logger.info(f"正在同步删除规则 {sync_rule_id} 的替换规则")
-                
-                target_rule = session.query(ForwardRule).get(sync_rule_id)
-                if not target_rule:
-                    logger.warning(f"同步目标规则 {sync_rule_id} 不存在，跳过")
-                    continue
-                
-                sync_deleted = 0
-                for rule_info in rules_to_delete:
-                    try:
-                        target_rules = session.query(ReplaceRule).filter(
-                            ReplaceRule.rule_id == sync_rule_id,
-                            ReplaceRule.pattern == rule_info['pattern'],
-                            ReplaceRule.content == rule_info['content']
-                        ).all()
-                        
-                        for target_rule in target_rules:
-                            session.delete(target_rule)
-                            sync_deleted += 1
-                    except Exception as e:
-                        logger.error(f"同步删除规则 {sync_rule_id} 的替换规则时出错: {str(e)}")
-                        continue
-                
-                logger.info(f"同步删除规则 {sync_rule_id} 的替换规则: 删除了 {sync_deleted} 个")
-                
-        return deleted_count, await self.get_replace_rules(session, rule_id)
+
+        rules_to_delete = [rules[idx - 1] for idx in sorted(set(indices)) if 1 <= idx <= len(rules)]
+        if rules_to_delete:
+            rows = [{'pattern': replace_rule.pattern, 'content': replace_rule.content} for replace_rule in rules_to_delete]
+            sync_rule_ids = get_sync_closure(session, rule_id) if rule.enable_sync else ()
+            deleted = delete_replace_rules_from_rules(session, [rule_id, *sync_rule_ids], rows)
+            for replace_rule in rules_to_delete:
+                session.expunge(replace_rule)
+            if sync_rule_ids:
+                logger.info(f"已同步删除规则 {list(sync_rule_ids)} 的替换规则，共删除 {deleted} 个")
+
+        return len(rules_to_delete), await self.get_replace_rules(session, rule_id)
 
     async def get_media_types(self, session, rule_id):
         """获取媒体类型设置"""
@@ -1,10 +1,17 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, ForeignKey, Enum, UniqueConstraint, inspect, text
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, Float, ForeignKey, Enum, UniqueConstraint, Index, MetaData, Table, inspect, text, select, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from enums.enums import ForwardMode, PreviewMode, MessageMode, AddMode, HandleMode
+import json
 import logging
 import os
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
+from utils.constants import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, RSS_DATA_DIR
 
 load_dotenv()
 Base = declarative_base()
@@ -15,18 +22,19 @@ class Chat(Base):
     id = Column(Integer, primary_key=True)
     telegram_chat_id = Column(String, unique=True, nullable=False)
     name = Column(String, nullable=True)
-    current_add_id = Column(String, nullable=True)
+    current_add_id = Column(String, nullable=True, index=True)
 
     # 关系
     source_rules = relationship('ForwardRule', foreign_keys='ForwardRule.source_chat_id', back_populates='source_chat')
     target_rules = relationship('ForwardRule', foreign_keys='ForwardRule.target_chat_id', back_populates='target_chat')
+    resolved_peers = relationship('ResolvedPeer', back_populates='chat', cascade="all, delete-orphan")
 
 class ForwardRule(Base):
     __tablename__ = 'forward_rules'
 
     id = Column(Integer, primary_key=True)
-    source_chat_id = Column(Integer, ForeignKey('chats.id'), nullable=False)
-    target_chat_id = Column(Integer, ForeignKey('chats.id'), nullable=False)
+    source_chat_id = Column(Integer, ForeignKey('chats.id'), nullable=False, index=True)
+    target_chat_id = Column(Integer, ForeignKey('chats.id'), nullable=False, index=True)
     forward_mode = Column(Enum(ForwardMode), nullable=False, default=ForwardMode.BLACKLIST)
     use_bot = Column(Boolean, default=True)
     message_mode = Column(Enum(MessageMode), nullable=False, default=MessageMode.MARKDOWN)
@@ -73,6 +81,7 @@ class ForwardRule(Base):
     delay_seconds = Column(Integer, default=5)  # 延迟处理秒数
     only_rss = Column(Boolean, default=False)  # 是否只转发RSS
     enable_sync = Column(Boolean, default=False)  # 是否启用规则同步功能
+    enable_dedup = Column(Boolean, default=False)  # 是否启用跨来源重复消息过滤
 
     __table_args__ = (
         UniqueConstraint('source_chat_id', 'target_chat_id', name='unique_source_target'),
@@ -92,7 +101,7 @@ class Keyword(Base):
     __tablename__ = 'keywords'
 
     id = Column(Integer, primary_key=True)
-    rule_id = Column(Integer, ForeignKey('forward_rules.id'), nullable=False)
+    rule_id = Column(Integer, ForeignKey('forward_rules.id'), nullable=False, index=True)
     keyword = Column(String, nullable=True)
     is_regex = Column(Boolean, default=False)
     is_blacklist = Column(Boolean, default=True)
@@ -106,7 +115,7 @@ class ReplaceRule(Base):
     __tablename__ = 'replace_rules'
 
     id = Column(Integer, primary_key=True)
-    rule_id = Column(Integer, ForeignKey('forward_rules.id'), nullable=False)
+    rule_id = Column(Integer, ForeignKey('forward_rules.id'), nullable=False, index=True)
     pattern = Column(String, nullable=False)  # 替换模式
     content = Column(String, nullable=True)   # 替换内容
 
@@ -156,7 +165,7 @@ class PushConfig(Base):
     __tablename__ = 'push_configs'
 
     id = Column(Integer, primary_key=True)
-    rule_id = Column(Integer, ForeignKey('forward_rules.id'), nullable=False)
+    rule_id = Column(Integer, ForeignKey('forward_rules.id'), nullable=False, index=True)
     enable_push_channel = Column(Boolean, default=False)
     push_channel = Column(String, nullable=False)
     media_send_mode = Column(String, nullable=False, default='Single')
@@ -203,6 +212,87 @@ class RSSPattern(Base):
         UniqueConstraint('rss_config_id', 'pattern', 'pattern_type', name='unique_rss_pattern'),
     )
 
+class RSSEntry(Base):
+    __tablename__ = 'rss_entries'
+
+    id = Column(Integer, primary_key=True)
+    entry_id = Column(String, nullable=False, unique=True)  # 条目的UUID，对外使用的条目ID
+    rule_id = Column(Integer, nullable=False)
+    message_id = Column(String, nullable=True)
+    title = Column(String, nullable=True)
+    content = Column(String, nullable=True)
+    published = Column(String, nullable=False)  # ISO格式的发布时间，按字符串排序即按时间排序
+    author = Column(String, nullable=True)
+    link = Column(String, nullable=True)
+    media = Column(String, nullable=True)  # 媒体文件列表，JSON格式
+    original_link = Column(String, nullable=True)
+    sender_info = Column(String, nullable=True)
+    created_at = Column(String, nullable=True)
+    # 写入时预先生成的Feed片段，生成Feed时不再重复提取标题和渲染Markdown
+    auto_title = Column(String, nullable=True)  # 按标题模板提取的标题
+    content_html = Column(String, nullable=True)  # 全部内容渲染的HTML
+    auto_content_html = Column(String, nullable=True)  # 提取标题后剩余内容渲染的HTML
+
+    __table_args__ = (
+        Index('idx_rss_entry_rule_published', 'rule_id', 'published', 'id'),
+    )
+
+class ResolvedPeer(Base):
+    __tablename__ = 'resolved_peers'
+
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer, ForeignKey('chats.id'), nullable=False)
+    client_name = Column(String, nullable=False)  # 'user' 或 'bot'，不同账号的access_hash不同
+    resolved_chat_id = Column(String, nullable=False)  # 实际可用的聊天ID格式
+    peer_type = Column(String, nullable=False)  # 'user' / 'chat' / 'channel'
+    peer_id = Column(Integer, nullable=False)
+    access_hash = Column(Integer, nullable=True)
+    updated_at = Column(Float, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('chat_id', 'client_name', name='unique_chat_client_peer'),
+    )
+
+    chat = relationship('Chat', back_populates='resolved_peers')
+
+class MessageFingerprint(Base):
+    __tablename__ = 'message_fingerprints'
+
+    id = Column(Integer, primary_key=True)
+    target_chat_id = Column(Integer, nullable=False)  # 目标聊天在chats表中的ID
+    text_hash = Column(String, nullable=True)  # 归一化文本的精确哈希
+    simhash = Column(String, nullable=True)  # 归一化文本的SimHash（16位十六进制）
+    media_ids = Column(String, nullable=True)  # 媒体ID，逗号分隔
+    created_at = Column(Float, nullable=False)  # 记录时间戳
+
+    __table_args__ = (
+        Index('idx_fingerprint_target_created', 'target_chat_id', 'created_at'),
+    )
+
+class OutboundMessage(Base):
+    __tablename__ = 'outbound_messages'
+
+    id = Column(Integer, primary_key=True)
+    idempotency_key = Column(String, nullable=False, unique=True)  # 源聊天ID:消息ID:规则ID
+    rule_id = Column(Integer, nullable=False)
+    source_chat_id = Column(String, nullable=False)  # 源聊天的Telegram ID
+    source_message_ids = Column(String, nullable=True)  # 需要发送的媒体所在的源消息ID，逗号分隔
+    target_chat_id = Column(String, nullable=False)  # 目标聊天的Telegram ID
+    text = Column(String, nullable=True)
+    parse_mode = Column(String, nullable=True)
+    link_preview = Column(Boolean, default=False)
+    buttons = Column(String, nullable=True)  # URL按钮，JSON格式
+    status = Column(String, nullable=False, default='pending')  # pending / sending / sent / failed
+    attempts = Column(Integer, default=0)
+    last_error = Column(String, nullable=True)
+    sent_message_ids = Column(String, nullable=True)
+    created_at = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index('idx_outbound_status', 'status', 'id'),
+    )
+
 class User(Base):
     __tablename__ = 'users'
 
@@ -210,43 +300,57 @@ class User(Base):
     username = Column(String, nullable=False)  
     password = Column(String, nullable=False)  
 
-def migrate_db(engine):
-    """数据库迁移函数，确保新字段的添加"""
+def _migrate_legacy_schema(engine):
+    """迁移1：补齐引入版本号之前的数据库缺少的表和字段"""
     inspector = inspect(engine)
     
     existing_tables = inspector.get_table_names()
-    
-    connection = engine.connect()
+
+    forward_rules_columns = {column['name'] for column in inspector.get_columns('forward_rules')}
+
+    keyword_columns = {column['name'] for column in inspector.get_columns('keywords')}
         
     try:
-        with engine.connect() as connection:
+        with engine.begin() as connection:
 
             if 'rule_syncs' not in existing_tables:
                 logging.info("创建rule_syncs表...")
-                RuleSync.__table__.create(engine)
+                RuleSync.__table__.create(engine, checkfirst=True)
 
 
             if 'users' not in existing_tables:
                 logging.info("创建users表...")
-                User.__table__.create(engine)
+                User.__table__.create(engine, checkfirst=True)
 
             if 'rss_configs' not in existing_tables:
                 logging.info("创建rss_configs表...")
-                RSSConfig.__table__.create(engine)
+                RSSConfig.__table__.create(engine, checkfirst=True)
                 
 
             if 'rss_patterns' not in existing_tables:
                 logging.info("创建rss_patterns表...")
-                RSSPattern.__table__.create(engine)
+                RSSPattern.__table__.create(engine, checkfirst=True)
 
             if 'push_configs' not in existing_tables:
                 logging.info("创建push_configs表...")
-                PushConfig.__table__.create(engine)
+                PushConfig.__table__.create(engine, checkfirst=True)
+
+            if 'resolved_peers' not in existing_tables:
+                logging.info("创建resolved_peers表...")
+                ResolvedPeer.__table__.create(engine, checkfirst=True)
+
+            if 'message_fingerprints' not in existing_tables:
+                logging.info("创建message_fingerprints表...")
+                MessageFingerprint.__table__.create(engine, checkfirst=True)
+
+            if 'outbound_messages' not in existing_tables:
+                logging.info("创建outbound_messages表...")
+                OutboundMessage.__table__.create(engine, checkfirst=True)
    
                 
             if 'media_types' not in existing_tables:
                 logging.info("创建media_types表...")
-                MediaTypes.__table__.create(engine)
+                MediaTypes.__table__.create(engine, checkfirst=True)
                 
                 if 'selected_media_types' in forward_rules_columns:
                     logging.info("迁移媒体类型数据到新表...")
@@ -280,139 +384,326 @@ def migrate_db(engine):
                             )
             if 'media_extensions' not in existing_tables:
                 logging.info("创建media_extensions表...")
-                MediaExtensions.__table__.create(engine)
+                MediaExtensions.__table__.create(engine, checkfirst=True)
                 
     except Exception as e:
         logging.error(f'迁移媒体类型数据时出错: {str(e)}')
-    
-            
-
-
-    forward_rules_columns = {column['name'] for column in inspector.get_columns('forward_rules')}
-
-    keyword_columns = {column['name'] for column in inspector.get_columns('keywords')}
+        raise
 
     forward_rules_new_columns = {
         'is_ai': 'ALTER TABLE forward_rules ADD COLUMN is_ai BOOLEAN DEFAULT FALSE',
         'ai_model': 'ALTER TABLE forward_rules ADD COLUMN ai_model VARCHAR DEFAULT NULL',
         'ai_prompt': 'ALTER TABLE forward_rules ADD COLUMN ai_prompt VARCHAR DEFAULT NULL',
         'is_summary': 'ALTER TABLE forward_rules ADD COLUMN is_summary BOOLEAN DEFAULT FALSE',
-        'summary_time': 'ALTER TABLE forward_rules ADD COLUMN summary_time VARCHAR DEFAULT "07:00"',
+        'summary_time': "ALTER TABLE forward_rules ADD COLUMN summary_time VARCHAR DEFAULT '07:00'",
         'summary_prompt': 'ALTER TABLE forward_rules ADD COLUMN summary_prompt VARCHAR DEFAULT NULL',
         'is_delete_original': 'ALTER TABLE forward_rules ADD COLUMN is_delete_original BOOLEAN DEFAULT FALSE',
         'is_original_sender': 'ALTER TABLE forward_rules ADD COLUMN is_original_sender BOOLEAN DEFAULT FALSE',
         'is_original_time': 'ALTER TABLE forward_rules ADD COLUMN is_original_time BOOLEAN DEFAULT FALSE',
         'is_keyword_after_ai': 'ALTER TABLE forward_rules ADD COLUMN is_keyword_after_ai BOOLEAN DEFAULT FALSE',
-        'add_mode': 'ALTER TABLE forward_rules ADD COLUMN add_mode VARCHAR DEFAULT "BLACKLIST"',
+        'add_mode': "ALTER TABLE forward_rules ADD COLUMN add_mode VARCHAR DEFAULT 'BLACKLIST'",
         'enable_rule': 'ALTER TABLE forward_rules ADD COLUMN enable_rule BOOLEAN DEFAULT TRUE',
         'is_top_summary': 'ALTER TABLE forward_rules ADD COLUMN is_top_summary BOOLEAN DEFAULT TRUE',
         'is_filter_user_info': 'ALTER TABLE forward_rules ADD COLUMN is_filter_user_info BOOLEAN DEFAULT FALSE',
         'enable_delay': 'ALTER TABLE forward_rules ADD COLUMN enable_delay BOOLEAN DEFAULT FALSE',
         'delay_seconds': 'ALTER TABLE forward_rules ADD COLUMN delay_seconds INTEGER DEFAULT 5',
-        'handle_mode': 'ALTER TABLE forward_rules ADD COLUMN handle_mode VARCHAR DEFAULT "FORWARD"',
+        'handle_mode': "ALTER TABLE forward_rules ADD COLUMN handle_mode VARCHAR DEFAULT 'FORWARD'",
         'enable_comment_button': 'ALTER TABLE forward_rules ADD COLUMN enable_comment_button BOOLEAN DEFAULT FALSE',
         'enable_media_type_filter': 'ALTER TABLE forward_rules ADD COLUMN enable_media_type_filter BOOLEAN DEFAULT FALSE',
         'enable_media_size_filter': 'ALTER TABLE forward_rules ADD COLUMN enable_media_size_filter BOOLEAN DEFAULT FALSE',
         'max_media_size': f'ALTER TABLE forward_rules ADD COLUMN max_media_size INTEGER DEFAULT {os.getenv("DEFAULT_MAX_MEDIA_SIZE", 10)}',
         'is_send_over_media_size_message': 'ALTER TABLE forward_rules ADD COLUMN is_send_over_media_size_message BOOLEAN DEFAULT TRUE',
         'enable_extension_filter': 'ALTER TABLE forward_rules ADD COLUMN enable_extension_filter BOOLEAN DEFAULT FALSE',
-        'extension_filter_mode': 'ALTER TABLE forward_rules ADD COLUMN extension_filter_mode VARCHAR DEFAULT "BLACKLIST"',
+        'extension_filter_mode': "ALTER TABLE forward_rules ADD COLUMN extension_filter_mode VARCHAR DEFAULT 'BLACKLIST'",
         'enable_reverse_blacklist': 'ALTER TABLE forward_rules ADD COLUMN enable_reverse_blacklist BOOLEAN DEFAULT FALSE',
         'enable_reverse_whitelist': 'ALTER TABLE forward_rules ADD COLUMN enable_reverse_whitelist BOOLEAN DEFAULT FALSE',
         'only_rss': 'ALTER TABLE forward_rules ADD COLUMN only_rss BOOLEAN DEFAULT FALSE',
         'enable_sync': 'ALTER TABLE forward_rules ADD COLUMN enable_sync BOOLEAN DEFAULT FALSE',
-        'userinfo_template': 'ALTER TABLE forward_rules ADD COLUMN userinfo_template VARCHAR DEFAULT "**{name}**"',
-        'time_template': 'ALTER TABLE forward_rules ADD COLUMN time_template VARCHAR DEFAULT "{time}"',
-        'original_link_template': 'ALTER TABLE forward_rules ADD COLUMN original_link_template VARCHAR DEFAULT "原始连接：{original_link}"',
+        'userinfo_template': "ALTER TABLE forward_rules ADD COLUMN userinfo_template VARCHAR DEFAULT '**{name}**'",
+        'time_template': "ALTER TABLE forward_rules ADD COLUMN time_template VARCHAR DEFAULT '{time}'",
+        'original_link_template': "ALTER TABLE forward_rules ADD COLUMN original_link_template VARCHAR DEFAULT '原始连接：{original_link}'",
         'enable_push': 'ALTER TABLE forward_rules ADD COLUMN enable_push BOOLEAN DEFAULT FALSE',
         'enable_only_push': 'ALTER TABLE forward_rules ADD COLUMN enable_only_push BOOLEAN DEFAULT FALSE',
         'media_allow_text': 'ALTER TABLE forward_rules ADD COLUMN media_allow_text BOOLEAN DEFAULT FALSE',
         'enable_ai_upload_image': 'ALTER TABLE forward_rules ADD COLUMN enable_ai_upload_image BOOLEAN DEFAULT FALSE',
+        'enable_dedup': 'ALTER TABLE forward_rules ADD COLUMN enable_dedup BOOLEAN DEFAULT FALSE',
     }
 
     keywords_new_columns = {
         'is_blacklist': 'ALTER TABLE keywords ADD COLUMN is_blacklist BOOLEAN DEFAULT TRUE',
     }
 
-    with engine.connect() as connection:
-        # 添加forward_rules表的列
-        for column, sql in forward_rules_new_columns.items():
-            if column not in forward_rules_columns:
+    # 每条DDL单独提交：PostgreSQL等数据库中DDL是事务性的，一条失败会使同一事务中的其他语句一起回滚
+    for table, new_columns, existing_columns in (
+        ('forward_rules', forward_rules_new_columns, forward_rules_columns),
+        ('keywords', keywords_new_columns, keyword_columns),
+    ):
+        for column, sql in new_columns.items():
+            if column not in existing_columns:
                 try:
-                    connection.execute(text(sql))
+                    with engine.begin() as connection:
+                        connection.execute(text(sql))
                     logging.info(f'已添加列: {column}')
                 except Exception as e:
-                    logging.error(f'添加列 {column} 时出错: {str(e)}')
-                    
-        for column, sql in keywords_new_columns.items():
-            if column not in keyword_columns:
-                try:
-                    connection.execute(text(sql))
-                    logging.info(f'已添加列: {column}')
-                except Exception as e:
-                    logging.error(f'添加列 {column} 时出错: {str(e)}')
-
-        if 'forward_mode' not in forward_rules_columns:
-            # 修改forward_rules表的列mode为forward_mode
+                    # 同时启动的其他进程可能已经添加了该列，否则迁移失败
+                    if column not in {existing['name'] for existing in inspect(engine).get_columns(table)}:
+                        logging.error(f'添加列 {column} 时出错: {str(e)}')
+                        raise
+                    logging.info(f'列 {column} 已由其他进程添加')
+
+    if 'forward_mode' not in forward_rules_columns:
+        # 修改forward_rules表的列mode为forward_mode
+        with engine.begin() as connection:
             connection.execute(text("ALTER TABLE forward_rules RENAME COLUMN mode TO forward_mode"))
-            logging.info('修改forward_rules表的列mode为forward_mode成功')
+        logging.info('修改forward_rules表的列mode为forward_mode成功')
 
-        try:
-            with engine.connect() as connection:
-                result = connection.execute(text("""
-                    SELECT name FROM sqlite_master 
-                    WHERE type='index' AND name='unique_rule_keyword_is_regex_is_blacklist'
+    try:
+        if _has_keyword_unique_constraint(engine):
+            logging.info('唯一约束已存在，跳过创建')
+        elif engine.dialect.name == 'sqlite':
+            # SQLite不支持修改约束，重建keywords表
+            logging.info('开始更新 keywords 表的唯一约束...')
+            try:
+                with engine.begin() as connection:
+                    connection.execute(text("""
+                        CREATE TABLE keywords_temp (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            rule_id INTEGER,
+                            keyword TEXT,
+                            is_regex BOOLEAN,
+                            is_blacklist BOOLEAN
+                            -- 如果 keywords 表还有其他字段，请在这里一并定义
+                        )
+                    """))
+                    logging.info('创建 keywords_temp 表结构成功')
+
+                    result = connection.execute(text("""
+                        INSERT INTO keywords_temp (rule_id, keyword, is_regex, is_blacklist)
+                        SELECT rule_id, keyword, is_regex, is_blacklist FROM keywords
+                    """))
+                    logging.info(f'复制数据到 keywords_temp 成功，影响行数: {result.rowcount}')
+
+                    connection.execute(text("DROP TABLE keywords"))
+                    logging.info('删除原表 keywords 成功')
+
+                    connection.execute(text("ALTER TABLE keywords_temp RENAME TO keywords"))
+                    logging.info('重命名 keywords_temp 为 keywords 成功')
+
+                    connection.execute(text("""
+                        CREATE UNIQUE INDEX unique_rule_keyword_is_regex_is_blacklist 
+                        ON keywords (rule_id, keyword, is_regex, is_blacklist)
+                    """))
+                    logging.info('添加唯一约束 unique_rule_keyword_is_regex_is_blacklist 成功')
+
+                    logging.info('成功更新 keywords 表结构和唯一约束')
+            except Exception as e:
+                logging.error(f'更新 keywords 表结构时出错: {str(e)}')
+                raise
+        else:
+            with engine.begin() as connection:
+                connection.execute(text("""
+                    CREATE UNIQUE INDEX unique_rule_keyword_is_regex_is_blacklist
+                    ON keywords (rule_id, keyword, is_regex, is_blacklist)
                 """))
-                index_exists = result.fetchone() is not None
-                if not index_exists:
-                    logging.info('开始更新 keywords 表的唯一约束...')
-                    try:
-                        
-                        with engine.begin() as connection:
-                            connection.execute(text("""
-                                CREATE TABLE keywords_temp (
-                                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                    rule_id INTEGER,
-                                    keyword TEXT,
-                                    is_regex BOOLEAN,
-                                    is_blacklist BOOLEAN
-                                    -- 如果 keywords 表还有其他字段，请在这里一并定义
-                                )
-                            """))
-                            logging.info('创建 keywords_temp 表结构成功')
-
-                            result = connection.execute(text("""
-                                INSERT INTO keywords_temp (rule_id, keyword, is_regex, is_blacklist)
-                                SELECT rule_id, keyword, is_regex, is_blacklist FROM keywords
-                            """))
-                            logging.info(f'复制数据到 keywords_temp 成功，影响行数: {result.rowcount}')
-
-                            connection.execute(text("DROP TABLE keywords"))
-                            logging.info('删除原表 keywords 成功')
-
-                            connection.execute(text("ALTER TABLE keywords_temp RENAME TO keywords"))
-                            logging.info('重命名 keywords_temp 为 keywords 成功')
-
-                            connection.execute(text("""
-                                CREATE UNIQUE INDEX unique_rule_keyword_is_regex_is_blacklist 
-                                ON keywords (rule_id, keyword, is_regex, is_blacklist)
-                            """))
-                            logging.info('添加唯一约束 unique_rule_keyword_is_regex_is_blacklist 成功')
-
-                            logging.info('成功更新 keywords 表结构和唯一约束')
-                    except Exception as e:
-                        logging.error(f'更新 keywords 表结构时出错: {str(e)}')
-                else:
-                    logging.info('唯一约束已存在，跳过创建')
+            logging.info('添加唯一约束 unique_rule_keyword_is_regex_is_blacklist 成功')
 
+    except Exception as e:
+        logging.error(f'更新唯一约束时出错: {str(e)}')
+        if not _has_keyword_unique_constraint(engine):
+            raise
+
+
+def _has_keyword_unique_constraint(engine) -> bool:
+    """keywords表是否已有 (rule_id, keyword, is_regex, is_blacklist) 唯一约束，不依赖具体数据库的系统表"""
+    inspector = inspect(engine)
+    columns = ['rule_id', 'keyword', 'is_regex', 'is_blacklist']
+    constraints = inspector.get_unique_constraints('keywords') + [
+        index for index in inspector.get_indexes('keywords') if index.get('unique')
+    ]
+    return any(
+        constraint.get('name') == 'unique_rule_keyword_is_regex_is_blacklist' or constraint['column_names'] == columns
+        for constraint in constraints
+    )
+
+
+# 常用查询的外键和过滤字段索引，名称与模型中 index=True 生成的索引一致
+HOT_QUERY_INDEXES = {
+    'ix_forward_rules_source_chat_id': ('forward_rules', 'source_chat_id'),
+    'ix_forward_rules_target_chat_id': ('forward_rules', 'target_chat_id'),
+    'ix_keywords_rule_id': ('keywords', 'rule_id'),
+    'ix_replace_rules_rule_id': ('replace_rules', 'rule_id'),
+    'ix_chats_current_add_id': ('chats', 'current_add_id'),
+    'ix_push_configs_rule_id': ('push_configs', 'rule_id'),
+}
+
+
+def _migrate_hot_query_indexes(engine):
+    """迁移2：为常用查询添加索引"""
+    inspector = inspect(engine)
+    existing = {table: {index['name'] for index in inspector.get_indexes(table)} for table in {t for t, _ in HOT_QUERY_INDEXES.values()}}
+    with engine.begin() as connection:
+        for name, (table, column) in HOT_QUERY_INDEXES.items():
+            if name in existing[table]:
+                continue
+            Index(name, Base.metadata.tables[table].c[column]).create(connection)
+            logging.info(f'已添加索引: {name}')
+
+
+RSS_ENTRY_FIELDS = (
+    'message_id', 'title', 'content', 'published', 'author', 'link', 'original_link', 'sender_info', 'created_at',
+    'auto_title', 'content_html', 'auto_content_html',
+)
+
+
+def _migrate_rss_entries(engine):
+    """迁移3：把各规则数据目录下的 entries.json 导入 rss_entries 表
+
+    导入完成的文件重命名为 entries.json.migrated 保留备份，已导入的条目不会重复导入。
+    """
+    if not os.path.isdir(RSS_DATA_DIR):
+        return
+    table = RSSEntry.__table__
+    for name in os.listdir(RSS_DATA_DIR):
+        file_path = os.path.join(RSS_DATA_DIR, name, 'entries.json')
+        if not name.isdigit() or not os.path.isfile(file_path):
+            continue
+        rule_id = int(name)
+        try:
+            with open(file_path, 'r', encoding='utf-8') as file:
+                entries = json.load(file)
+        except (OSError, ValueError) as e:
+            logging.warning(f'读取条目文件失败，跳过: {file_path}, 错误: {str(e)}')
+            continue
+
+        with engine.begin() as connection:
+            existing = set(connection.execute(
+                select(table.c.entry_id).where(table.c.rule_id == rule_id)
+            ).scalars())
+            rows = []
+            for entry in entries:
+                entry_id = entry.get('id') or str(uuid.uuid4())
+                if entry_id in existing:
+                    continue
+                existing.add(entry_id)
+                row = {field: entry.get(field) for field in RSS_ENTRY_FIELDS}
+                row['published'] = row['published'] or row['created_at'] or ''
+                row.update(entry_id=entry_id, rule_id=rule_id, media=json.dumps(entry.get('media') or [], ensure_ascii=False))
+                rows.append(row)
+            if rows:
+                connection.execute(table.insert(), rows)
+        os.replace(file_path, f'{file_path}.migrated')
+        logging.info(f'已导入规则 {rule_id} 的 {len(rows)} 个RSS条目')
+
+
+def _migrate_rss_entry_fragments(engine):
+    """迁移4：为RSS条目添加预先生成的Feed片段字段，已有条目在生成Feed时补齐"""
+    existing = {column['name'] for column in inspect(engine).get_columns('rss_entries')}
+    for column in ('auto_title', 'content_html', 'auto_content_html'):
+        if column in existing:
+            continue
+        with engine.begin() as connection:
+            connection.execute(text(f'ALTER TABLE rss_entries ADD COLUMN {column} VARCHAR DEFAULT NULL'))
+        logging.info(f'已添加字段: rss_entries.{column}')
+
+
+# 按版本号排序的迁移，每个迁移都可以重复执行；新的表结构变更请在末尾追加
+MIGRATIONS = [
+    (1, '补齐旧版本数据库的表和字段', _migrate_legacy_schema),
+    (2, '为常用查询添加索引', _migrate_hot_query_indexes),
+    (3, '把RSS条目从JSON文件导入数据库', _migrate_rss_entries),
+    (4, '为RSS条目添加预生成的Feed片段', _migrate_rss_entry_fragments),
+]
+
+# 迁移版本记录表，不属于模型的元数据，由迁移逻辑自行维护
+schema_version_table = Table(
+    'schema_version', MetaData(),
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('description', String(255)),
+    Column('applied_at', Float),
+)
+
+
+def get_schema_version(engine) -> int:
+    """获取数据库已执行到的迁移版本，未记录时为0"""
+    schema_version_table.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        return connection.execute(select(func.max(schema_version_table.c.version))).scalar() or 0
+
+
+def migrate_db(engine):
+    """按版本号执行尚未执行过的数据库迁移，已是最新版本时直接跳过"""
+    current = get_schema_version(engine)
+    pending = [migration for migration in MIGRATIONS if migration[0] > current]
+    if not pending:
+        logging.info(f'数据库结构已是最新版本 {current}，跳过迁移')
+        return
+
+    for version, description, migrate in pending:
+        logging.info(f'执行数据库迁移 {version}: {description}')
+        try:
+            migrate(engine)
         except Exception as e:
-            logging.error(f'更新唯一约束时出错: {str(e)}')
+            # 不记录版本号，下次启动时重新执行；结构未迁移完成时中止启动
+            logging.error(f'数据库迁移 {version} 出错: {str(e)}')
+            raise
+        try:
+            with engine.begin() as connection:
+                connection.execute(
+                    schema_version_table.insert(),
+                    {'version': version, 'description': description, 'applied_at': time.time()}
+                )
+        except IntegrityError:
+            # 同时启动的其他进程已执行完该迁移并记录了版本号，迁移本身可以重复执行
+            logging.info(f'数据库迁移 {version} 已由其他进程记录')
+            continue
+        logging.info(f'数据库迁移 {version} 完成')
+
+
+_engine = None
+_session_factory = None
+_engine_lock = threading.Lock()
+
+
+def _create_engine():
+    url = make_url(DATABASE_URL)
+    if url.get_backend_name() == 'sqlite':
+        database = url.database
+        if database and database != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(database)), exist_ok=True)
+        # SQLite使用默认的连接池；会话在数据库线程池和事件循环之间创建，允许跨线程使用连接
+        return create_engine(url, connect_args={'check_same_thread': False})
+
+    # 服务端数据库：多个进程共用，连接池复用连接，取用前检测连接是否仍然可用
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+def get_engine():
+    """获取进程内共用的数据库引擎，首次调用时根据DATABASE_URL创建"""
+    global _engine, _session_factory
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = _create_engine()
+                _session_factory = sessionmaker(bind=engine)
+                _engine = engine
+                logging.info(f'数据库引擎已创建: {engine.url.render_as_string(hide_password=True)}')
+    return _engine
 
 
 def init_db():
     """初始化数据库"""
-    os.makedirs('./db', exist_ok=True)
-    engine = create_engine('sqlite:///./db/forward.db')
+    engine = get_engine()
+
+    if engine.dialect.name == 'sqlite':
+        # WAL模式下读写互不阻塞，发送队列的频繁写入不会影响其他查询；该设置会持久保存在数据库文件中
+        with engine.connect() as connection:
+            connection.execute(text("PRAGMA journal_mode=WAL"))
 
     Base.metadata.create_all(engine)
 
@@ -421,13 +712,12 @@ def init_db():
     return engine
 
 def get_session():
-    """创建会话工厂"""
-    engine = create_engine('sqlite:///./db/forward.db')
-    Session = sessionmaker(bind=engine)
-    return Session()
+    """从共用引擎的会话工厂创建会话"""
+    get_engine()
+    return _session_factory()
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
     engine = init_db()
     session = get_session()
-    logging.info("数据库初始化和迁移完成。")
\ No newline at end of file
+    logging.info("数据库初始化和迁移完成。")
@@ -0,0 +1,214 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Tuple
+from sqlalchemy import select, insert, update, exists, func
+from models.models import ForwardRule, Keyword, ReplaceRule, MediaTypes, MediaExtensions, PushConfig, RuleSync
+from models.db_executor import run_in_session
+
+logger = logging.getLogger(__name__)
+
+# 可复制的内容
+COPY_KEYWORDS = 'keywords'
+COPY_REGEX_KEYWORDS = 'regex_keywords'
+COPY_REPLACE_RULES = 'replace_rules'
+COPY_MEDIA_EXTENSIONS = 'media_extensions'
+COPY_PUSH_CONFIGS = 'push_configs'
+COPY_RULE_SYNCS = 'rule_syncs'
+COPY_MEDIA_TYPES = 'media_types'
+COPY_SETTINGS = 'settings'
+
+COPY_ALL = (
+    COPY_KEYWORDS, COPY_REGEX_KEYWORDS, COPY_REPLACE_RULES, COPY_MEDIA_EXTENSIONS,
+    COPY_PUSH_CONFIGS, COPY_RULE_SYNCS, COPY_MEDIA_TYPES, COPY_SETTINGS,
+)
+
+COPY_PART_NAMES = {
+    COPY_KEYWORDS: '普通关键字',
+    COPY_REGEX_KEYWORDS: '正则关键字',
+    COPY_REPLACE_RULES: '替换规则',
+    COPY_MEDIA_EXTENSIONS: '媒体扩展名',
+    COPY_PUSH_CONFIGS: '推送配置',
+    COPY_RULE_SYNCS: '同步规则',
+    COPY_MEDIA_TYPES: '媒体类型设置',
+    COPY_SETTINGS: '其他规则设置',
+}
+
+# 覆盖目标规则的内容，没有重复跳过的概念
+OVERWRITE_PARTS = (COPY_MEDIA_TYPES, COPY_SETTINGS)
+
+# 复制规则设置时保留目标规则自身的字段
+RULE_IDENTITY_COLUMNS = frozenset({'id', 'source_chat_id', 'target_chat_id'})
+
+
+@dataclass
+class CopyCount:
+    copied: int = 0
+    skipped: int = 0
+
+
+@dataclass
+class CopyResult:
+    """一次复制操作的结果，counts中的数量为所有目标规则的合计"""
+    source_rule_id: int
+    target_rule_ids: Tuple[int, ...] = ()
+    missing_rule_ids: Tuple[int, ...] = ()
+    counts: Dict[str, CopyCount] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        """生成各部分复制数量的说明文本"""
+        lines = [
+            f"{COPY_PART_NAMES[part]}: 成功复制 {count.copied} 个, 跳过重复 {count.skipped} 个"
+            for part, count in self.counts.items()
+            if part not in OVERWRITE_PARTS
+        ]
+        overwritten = [COPY_PART_NAMES[part] for part in OVERWRITE_PARTS if part in self.counts]
+        if overwritten:
+            lines.append(f"{'和'.join(overwritten)}已复制")
+        if self.missing_rule_ids:
+            lines.append(f"不存在的目标规则: {', '.join(str(rule_id) for rule_id in self.missing_rule_ids)}")
+        return '\n'.join(lines)
+
+
+def _copy_children(session, table, match_columns, source_rule_id, target_ids, condition=None) -> CopyCount:
+    """用一条 INSERT ... SELECT ... WHERE NOT EXISTS 把源规则的子表记录复制到所有目标规则
+
+    Args:
+        table: 子表
+        match_columns: 判断记录重复的字段，目标规则中已存在相同记录时跳过
+        condition: 可选，以 (源记录别名, 目标规则别名) 为参数、返回额外过滤条件的函数
+    """
+    src = table.alias('src')
+    dst = table.alias('dst')
+    target = ForwardRule.__table__.alias('target')
+
+    duplicate = exists().where(
+        dst.c.rule_id == target.c.id,
+        *[dst.c[name].is_not_distinct_from(src.c[name]) for name in match_columns]
+    )
+    # 每个目标规则与源规则的每条记录组合
+    pairs = target.join(src, src.c.rule_id == source_rule_id)
+    extra = [condition(src, target)] if condition is not None else []
+
+    columns = [column.name for column in table.columns if column.name not in ('id', 'rule_id')]
+    rows = select(target.c.id, *[src.c[name] for name in columns]).select_from(pairs).where(
+        target.c.id.in_(target_ids), ~duplicate, *extra
+    )
+    copied = session.execute(insert(table).from_select(['rule_id', *columns], rows)).rowcount
+
+    # 每个目标规则都会尝试复制全部源记录，未插入的即为重复跳过的
+    candidates = session.execute(
+        select(func.count()).select_from(pairs).where(target.c.id.in_(target_ids), *extra)
+    ).scalar()
+    return CopyCount(copied=copied, skipped=candidates - copied)
+
+
+def _copy_media_types(session, source_rule_id, target_ids) -> CopyCount:
+    """覆盖目标规则的媒体类型设置，目标规则没有设置时插入"""
+    table = MediaTypes.__table__
+    row = session.execute(select(table).where(table.c.rule_id == source_rule_id)).mappings().first()
+    if row is None:
+        return CopyCount()
+    values = {name: value for name, value in row.items() if name not in ('id', 'rule_id')}
+    updated = session.execute(
+        update(table).where(table.c.rule_id.in_(target_ids)).values(**values)
+    ).rowcount
+    inserted = _copy_children(session, table, (), source_rule_id, target_ids).copied
+    return CopyCount(copied=updated + inserted)
+
+
+def _copy_settings(session, source_rule_id, target_ids) -> CopyCount:
+    """用一条UPDATE把源规则的设置复制到所有目标规则，保留目标规则的源聊天和目标聊天"""
+    table = ForwardRule.__table__
+    row = session.execute(select(table).where(table.c.id == source_rule_id)).mappings().first()
+    if row is None:
+        return CopyCount()
+    values = {name: value for name, value in row.items() if name not in RULE_IDENTITY_COLUMNS}
+    updated = session.execute(update(table).where(table.c.id.in_(target_ids)).values(**values)).rowcount
+    return CopyCount(copied=updated)
+
+
+def _enable_rule_syncs(session, source_rule_id, target_ids) -> None:
+    """为拥有源规则同步关系的目标规则开启同步"""
+    rules = ForwardRule.__table__
+    syncs = RuleSync.__table__
+    source_syncs = select(syncs.c.sync_rule_id).where(syncs.c.rule_id == source_rule_id)
+    session.execute(
+        update(rules).where(
+            rules.c.id.in_(target_ids),
+            exists().where(syncs.c.rule_id == rules.c.id, syncs.c.sync_rule_id.in_(source_syncs))
+        ).values(enable_sync=True)
+    )
+
+
+def copy_rule_parts(session, source_rule_id: int, target_rule_ids: Iterable[int], parts=COPY_ALL) -> CopyResult:
+    """把源规则的指定内容复制到多个目标规则
+
+    每张表只执行一条集合语句，由调用方在同一个事务中提交。
+
+    Args:
+        session: 数据库会话
+        source_rule_id: 源规则ID
+        target_rule_ids: 目标规则ID，源规则自身会被忽略
+        parts: 要复制的内容，COPY_* 常量
+
+    Returns:
+        CopyResult: 各部分的复制数量和不存在的目标规则ID
+    """
+    rules = ForwardRule.__table__
+    if session.execute(select(rules.c.id).where(rules.c.id == source_rule_id)).first() is None:
+        raise ValueError(f'找不到源规则ID: {source_rule_id}')
+
+    requested = sorted({int(rule_id) for rule_id in target_rule_ids} - {source_rule_id})
+    existing = set(session.execute(select(rules.c.id).where(rules.c.id.in_(requested))).scalars()) if requested else set()
+    target_ids = tuple(rule_id for rule_id in requested if rule_id in existing)
+    result = CopyResult(
+        source_rule_id=source_rule_id,
+        target_rule_ids=target_ids,
+        missing_rule_ids=tuple(rule_id for rule_id in requested if rule_id not in existing),
+    )
+    if not target_ids:
+        return result
+
+    # 与原有复制命令一致：同类关键字按关键字内容判断重复，替换规则按匹配模式判断重复
+    copiers = {
+        COPY_KEYWORDS: lambda: _copy_children(
+            session, Keyword.__table__, ('keyword', 'is_regex'), source_rule_id, target_ids,
+            lambda src, target: src.c.is_regex.is_not(True)
+        ),
+        COPY_REGEX_KEYWORDS: lambda: _copy_children(
+            session, Keyword.__table__, ('keyword', 'is_regex'), source_rule_id, target_ids,
+            lambda src, target: src.c.is_regex.is_(True)
+        ),
+        COPY_REPLACE_RULES: lambda: _copy_children(
+            session, ReplaceRule.__table__, ('pattern',), source_rule_id, target_ids
+        ),
+        COPY_MEDIA_EXTENSIONS: lambda: _copy_children(
+            session, MediaExtensions.__table__, ('extension',), source_rule_id, target_ids
+        ),
+        COPY_PUSH_CONFIGS: lambda: _copy_children(
+            session, PushConfig.__table__, ('push_channel',), source_rule_id, target_ids
+        ),
+        # 不为目标规则创建指向自身的同步关系
+        COPY_RULE_SYNCS: lambda: _copy_children(
+            session, RuleSync.__table__, ('sync_rule_id',), source_rule_id, target_ids,
+            lambda src, target: src.c.sync_rule_id != target.c.id
+        ),
+        COPY_MEDIA_TYPES: lambda: _copy_media_types(session, source_rule_id, target_ids),
+        COPY_SETTINGS: lambda: _copy_settings(session, source_rule_id, target_ids),
+    }
+    for part in parts:
+        result.counts[part] = copiers[part]()
+    # 复制规则设置会覆盖enable_sync，最后再开启同步
+    if COPY_RULE_SYNCS in parts:
+        _enable_rule_syncs(session, source_rule_id, target_ids)
+
+    logger.info(
+        f"已从规则 {source_rule_id} 复制到规则 {list(target_ids)}: "
+        + ', '.join(f"{part} 复制 {count.copied} 跳过 {count.skipped}" for part, count in result.counts.items())
+    )
+    return result
+
+
+async def copy_rule(source_rule_id: int, target_rule_ids: Iterable[int], parts=COPY_ALL) -> CopyResult:
+    """在数据库线程中把源规则的指定内容复制到多个目标规则，全部内容在同一个事务中提交"""
+    return await run_in_session(copy_rule_parts, source_rule_id, tuple(target_rule_ids), parts, commit=True)
@@ -0,0 +1,128 @@
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+from sqlalchemy import select, insert, delete, exists, bindparam, literal_column
+from models.models import ForwardRule, Keyword, ReplaceRule, RuleSync
+
+logger = logging.getLogger(__name__)
+
+KEYWORD_COLUMNS = ('keyword', 'is_regex', 'is_blacklist')
+REPLACE_RULE_COLUMNS = ('pattern', 'content')
+
+
+def get_sync_closure(session, rule_id: int) -> Tuple[int, ...]:
+    """计算规则的完整同步闭包
+
+    从规则出发沿RuleSync逐层查找同步目标，只有启用了同步功能的规则才会继续向下传播，
+    已访问过的规则不会重复处理，同步关系成环时不会死循环。不存在的目标规则被忽略。
+
+    Returns:
+        除规则自身以外需要同步的规则ID，按发现顺序排列
+    """
+    edges: Dict[int, List[int]] = {}
+    for source_id, target_id in session.execute(
+        select(RuleSync.rule_id, RuleSync.sync_rule_id)
+        .join(ForwardRule, ForwardRule.id == RuleSync.rule_id)
+        .where(ForwardRule.enable_sync.is_(True))
+        .order_by(RuleSync.id)
+    ):
+        edges.setdefault(source_id, []).append(target_id)
+    if rule_id not in edges:
+        return ()
+
+    candidates = {target_id for targets in edges.values() for target_id in targets}
+    existing = set(session.execute(select(ForwardRule.id).where(ForwardRule.id.in_(candidates))).scalars())
+
+    visited: Set[int] = {rule_id}
+    closure: List[int] = []
+    queue = deque([rule_id])
+    while queue:
+        current = queue.popleft()
+        for target_id in edges.get(current, ()):
+            if target_id in visited:
+                if target_id == rule_id:
+                    logger.info(f"规则 {current} 同步回规则 {rule_id}，同步关系成环，已跳过")
+                continue
+            visited.add(target_id)
+            if target_id not in existing:
+                logger.warning(f"同步目标规则 {target_id} 不存在，跳过")
+                continue
+            closure.append(target_id)
+            queue.append(target_id)
+    return tuple(closure)
+
+
+def _rule_id_filter(column, rule_ids: Iterable[int]):
+    # 规则ID直接写入语句，其余参数按记录批量绑定（executemany不支持展开的IN参数）
+    return column.in_([literal_column(str(int(rule_id))) for rule_id in rule_ids])
+
+
+def insert_missing(session, table, rule_ids: Sequence[int], rows: Sequence[dict], match_columns: Sequence[str]) -> int:
+    """把记录插入到每个规则中，规则中已存在相同记录时跳过
+
+    对所有记录执行同一条 INSERT ... SELECT ... WHERE NOT EXISTS，
+    每条记录只绑定一次参数，与规则数量无关。
+
+    Args:
+        table: 子表
+        rule_ids: 规则ID
+        rows: 记录，字段为子表除id和rule_id以外的字段
+        match_columns: 判断记录重复的字段
+
+    Returns:
+        int: 插入的记录数
+    """
+    if not rule_ids or not rows:
+        return 0
+    columns = list(rows[0])
+    params = {name: bindparam(name, type_=table.c[name].type) for name in columns}
+    target = ForwardRule.__table__.alias('target')
+    dst = table.alias('dst')
+    duplicate = exists().where(
+        dst.c.rule_id == target.c.id,
+        *[dst.c[name].is_not_distinct_from(params[name]) for name in match_columns]
+    )
+    new_rows = select(target.c.id, *[params[name] for name in columns]).where(
+        _rule_id_filter(target.c.id, rule_ids), ~duplicate
+    )
+    return session.execute(insert(table).from_select(['rule_id', *columns], new_rows), list(rows)).rowcount
+
+
+def delete_matching(session, table, rule_ids: Sequence[int], rows: Sequence[dict]) -> int:
+    """从每个规则中删除与记录字段相同的记录
+
+    Returns:
+        int: 删除的记录数
+    """
+    if not rule_ids or not rows:
+        return 0
+    columns = list(rows[0])
+    statement = delete(table).where(
+        _rule_id_filter(table.c.rule_id, rule_ids),
+        *[table.c[name].is_not_distinct_from(bindparam(name, type_=table.c[name].type)) for name in columns]
+    )
+    return session.execute(statement, list(rows)).rowcount
+
+
+def add_keywords_to_rules(session, rule_ids, keywords, is_regex=False, is_blacklist=False) -> int:
+    """添加关键字到多个规则，同一黑白名单中已存在的关键字跳过"""
+    rows = [{'keyword': keyword, 'is_regex': is_regex, 'is_blacklist': is_blacklist} for keyword in keywords]
+    return insert_missing(session, Keyword.__table__, rule_ids, rows, ('keyword', 'is_blacklist'))
+
+
+def delete_keywords_from_rules(session, rule_ids, keywords: Sequence[dict]) -> int:
+    """从多个规则中删除关键字，keywords为包含keyword、is_regex、is_blacklist的字典"""
+    rows = [{name: keyword[name] for name in KEYWORD_COLUMNS} for keyword in keywords]
+    return delete_matching(session, Keyword.__table__, rule_ids, rows)
+
+
+def add_replace_rules_to_rules(session, rule_ids, replace_rules: Sequence[dict]) -> int:
+    """添加替换规则到多个规则，已存在相同匹配模式和替换内容的跳过"""
+    rows = [{name: replace_rule[name] for name in REPLACE_RULE_COLUMNS} for replace_rule in replace_rules]
+    return insert_missing(session, ReplaceRule.__table__, rule_ids, rows, REPLACE_RULE_COLUMNS)
+
+
+def delete_replace_rules_from_rules(session, rule_ids, replace_rules: Sequence[dict]) -> int:
+    """从多个规则中删除替换规则，replace_rules为包含pattern、content的字典"""
+    rows = [{name: replace_rule[name] for name in REPLACE_RULE_COLUMNS} for replace_rule in replace_rules]
+    return delete_matching(session, ReplaceRule.__table__, rule_ids, rows)
@@ -1,83 +1,212 @@
 import json
 import logging
+import os
 import uuid
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any
+from sqlalchemy import select, insert, update, delete, func, and_, or_
+from sqlalchemy.exc import IntegrityError
 from ..models.entry import Entry
 from ..core.config import settings
+from ..services.feed_cache import feed_cache
+from ..services.feed_generator import FeedService
+from models.models import RSSEntry, RSSConfig, RSS_ENTRY_FIELDS
+from models.db_executor import run_db, run_in_session
 
 logger = logging.getLogger(__name__)
 
+# 条目存储在 rss_entries 表中，(rule_id, published, id) 上的索引支持按规则分页读取和按时间裁剪
+entries_table = RSSEntry.__table__
+
+DEFAULT_MAX_ITEMS = 50
+
 def ensure_storage_exists():
     """确保数据存储目录存在"""
     entries_dir = Path(settings.DATA_PATH)
     entries_dir.mkdir(parents=True, exist_ok=True)
 
-def get_rule_entries_path(rule_id: int) -> Path:
-    """获取规则对应的条目存储文件路径"""
-    rule_data_path = settings.get_rule_data_path(rule_id)
-    return Path(rule_data_path) / "entries.json"
+def _to_row(entry: Entry) -> Dict[str, Any]:
+    """把条目转换为表中的一行"""
+    data = entry.dict()
+    row = {field: data.get(field) for field in RSS_ENTRY_FIELDS}
+    row.update(
+        entry_id=entry.id,
+        rule_id=entry.rule_id,
+        media=json.dumps(data.get('media') or [], ensure_ascii=False)
+    )
+    return row
+
+def _to_entry(row) -> Entry:
+    """把表中的一行转换为条目"""
+    data = {field: row[field] for field in RSS_ENTRY_FIELDS}
+    data.update(
+        id=row['entry_id'],
+        rule_id=row['rule_id'],
+        media=json.loads(row['media']) if row['media'] else []
+    )
+    for field in ('message_id', 'title', 'content', 'author', 'link'):
+        if data[field] is None:
+            data[field] = ""
+    return Entry(**data)
+
+def _newest_first(rule_id: int):
+    return select(entries_table).where(entries_table.c.rule_id == rule_id).order_by(
+        entries_table.c.published.desc(), entries_table.c.id.desc()
+    )
+
+def _get_max_items(session, rule_id: int) -> int:
+    max_items = session.execute(
+        select(RSSConfig.max_items).where(RSSConfig.rule_id == rule_id)
+    ).scalar()
+    return max_items or DEFAULT_MAX_ITEMS
+
+def trim_entries(session, rule_id: int, keep: int) -> List[Entry]:
+    """只保留规则最新的 keep 个条目，返回被删除的条目
+
+    条目按环形缓冲区保留：通过索引定位第 keep+1 新的条目，用一条DELETE删除它以及比它更早的条目，
+    不需要读取保留的条目。每次写入后都会裁剪，Feed已满时每个新条目只会挤掉一个最早的条目。
+    """
+    cutoff = session.execute(
+        select(entries_table.c.published, entries_table.c.id)
+        .where(entries_table.c.rule_id == rule_id)
+        .order_by(entries_table.c.published.desc(), entries_table.c.id.desc())
+        .offset(max(keep, 0)).limit(1)
+    ).first()
+    if cutoff is None:
+        return []
+
+    expired = and_(
+        entries_table.c.rule_id == rule_id,
+        or_(
+            entries_table.c.published < cutoff.published,
+            and_(entries_table.c.published == cutoff.published, entries_table.c.id <= cutoff.id)
+        )
+    )
+    removed = [_to_entry(row) for row in session.execute(select(entries_table).where(expired)).mappings()]
+    session.execute(delete(entries_table).where(expired))
+    return removed
+
+def remove_entry_media(rule_id: int, entries: List[Entry]) -> int:
+    """删除条目的媒体文件，返回删除的文件数量"""
+    media_dir = Path(settings.get_rule_media_path(rule_id))
+    removed = 0
+    for entry in entries:
+        for media in entry.media:
+            media_path = media_dir / media.filename
+            try:
+                os.remove(media_path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"删除媒体文件失败: {media_path}, 错误: {str(e)}")
+    return removed
+
+def _get_entries(session, rule_id: int, limit: int, offset: int) -> List[Entry]:
+    rows = session.execute(_newest_first(rule_id).limit(limit).offset(offset)).mappings()
+    return [_to_entry(row) for row in rows]
+
+def _count_entries(session, rule_id: int) -> int:
+    return session.execute(
+        select(func.count()).select_from(entries_table).where(entries_table.c.rule_id == rule_id)
+    ).scalar()
+
+def _get_entries_state(session, rule_id: int) -> tuple:
+    return tuple(session.execute(
+        select(func.count(), func.max(entries_table.c.id)).where(entries_table.c.rule_id == rule_id)
+    ).one())
+
+def _create_entry(session, entry: Entry) -> List[Entry]:
+    # 在数据库线程中提取标题和渲染HTML，生成Feed时直接使用
+    FeedService.prerender_entry(entry)
+    session.execute(insert(entries_table).values(**_to_row(entry)))
+    return trim_entries(session, entry.rule_id, _get_max_items(session, entry.rule_id))
+
+def _entry_exists(session, entry_id: str) -> bool:
+    return session.execute(
+        select(entries_table.c.id).where(entries_table.c.entry_id == entry_id)
+    ).first() is not None
+
+def _update_entry(session, rule_id: int, entry_id: str, updated_data: Dict[str, Any]) -> bool:
+    if 'content' in updated_data:
+        fragments = FeedService.prerender_entry(Entry(rule_id=rule_id, message_id="", title="", content=updated_data['content'] or "", published=""))
+        updated_data = {
+            'auto_title': fragments.auto_title,
+            'content_html': fragments.content_html,
+            'auto_content_html': fragments.auto_content_html,
+            **updated_data,
+        }
+    values = {field: value for field, value in updated_data.items() if field in RSS_ENTRY_FIELDS}
+    if 'media' in updated_data:
+        values['media'] = json.dumps(
+            [media.dict() if hasattr(media, 'dict') else media for media in updated_data['media'] or []],
+            ensure_ascii=False
+        )
+    if not values:
+        return False
+    return session.execute(
+        update(entries_table)
+        .where(entries_table.c.rule_id == rule_id, entries_table.c.entry_id == entry_id)
+        .values(**values)
+    ).rowcount > 0
+
+def _delete_entry(session, rule_id: int, entry_id: str) -> bool:
+    return session.execute(
+        delete(entries_table).where(entries_table.c.rule_id == rule_id, entries_table.c.entry_id == entry_id)
+    ).rowcount > 0
+
+def _delete_rule_entries(session, rule_id: int) -> int:
+    return session.execute(delete(entries_table).where(entries_table.c.rule_id == rule_id)).rowcount
 
 async def get_entries(rule_id: int, limit: int = 100, offset: int = 0) -> List[Entry]:
-    """获取规则对应的条目"""
+    """按发布时间从新到旧分页获取规则对应的条目"""
     try:
-        file_path = get_rule_entries_path(rule_id)
-        
-        if not file_path.exists():
-            return []
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            
-        entries = [Entry(**entry) for entry in data]
-        
-        entries.sort(key=lambda x: x.published, reverse=True)
-        
-        return entries[offset:offset + limit]
+        return await run_in_session(_get_entries, rule_id, limit, offset)
     except Exception as e:
         logger.error(f"获取条目时出错: {str(e)}")
         return []
 
+async def count_entries(rule_id: int) -> int:
+    """获取规则对应的条目数量"""
+    try:
+        return await run_in_session(_count_entries, rule_id)
+    except Exception as e:
+        logger.error(f"统计条目数量时出错: {str(e)}")
+        return 0
+
+async def get_entries_state(rule_id: int) -> tuple:
+    """获取规则条目的状态 (条目数量, 最新写入的条目ID)，条目增删后状态随之改变"""
+    return await run_in_session(_get_entries_state, rule_id)
+
 async def create_entry(entry: Entry) -> bool:
-    """创建新条目"""
+    """创建新条目，超出RSS配置的最大条目数时删除最早的条目
+
+    使用条目已有的ID写入，同一ID的条目已存在时视为写入成功，重试写入不会产生重复条目。
+    """
     try:
         if not entry.id:
             entry.id = str(uuid.uuid4())
-        
+
         entry.created_at = datetime.now().isoformat()
-        
-        file_path = get_rule_entries_path(entry.rule_id)
-        
-        entries = []
-        if file_path.exists():
-            with open(file_path, 'r', encoding='utf-8') as file:
-                try:
-                    entries = json.load(file)
-                except json.JSONDecodeError:
-                    logger.warning(f"解析条目文件时出错，将创建新文件: {file_path}")
-                    entries = []
-        
-        entries.append(entry.dict())
-        
-        try:
-            from models.models import get_session, RSSConfig
-            session = get_session()
-            rss_config = session.query(RSSConfig).filter(RSSConfig.rule_id == entry.rule_id).first()
-            max_items = rss_config.max_items if rss_config and hasattr(rss_config, 'max_items') else 50
-            session.close()
-        except Exception as e:
-            logger.warning(f"获取RSS配置失败，使用默认最大条目数量(50): {str(e)}")
-            max_items = 50
-        
-        if len(entries) > max_items:
-            # 按发布时间排序（新的在前）
-            entries.sort(key=lambda x: x.get('published', ''), reverse=True)
-            entries = entries[:max_items]
-        
-        with open(file_path, 'w', encoding='utf-8') as file:
-            json.dump(entries, file, ensure_ascii=False, indent=2)
-        
+
+        removed = await run_in_session(_create_entry, entry, commit=True)
+        feed_cache.invalidate(entry.rule_id)
+        if removed:
+            # 条目删除已提交，再一次性删除这些条目的媒体文件
+            removed_media = await run_db(remove_entry_media, entry.rule_id, removed)
+            logger.info(f"规则 {entry.rule_id} 的条目超过最大数量，已删除 {len(removed)} 个最早的条目和 {removed_media} 个媒体文件")
+
         return True
+    except IntegrityError as e:
+        try:
+            if await run_in_session(_entry_exists, entry.id):
+                logger.info(f"条目 {entry.id} 已存在，跳过重复写入")
+                return True
+        except Exception as inner_e:
+            logger.error(f"检查条目是否存在时出错: {str(inner_e)}")
+        logger.error(f"创建条目时出错: {str(e)}")
+        return False
     except Exception as e:
         logger.error(f"创建条目时出错: {str(e)}")
         return False
@@ -85,28 +214,9 @@ async def create_entry(entry: Entry) -> bool:
 async def update_entry(rule_id: int, entry_id: str, updated_data: Dict[str, Any]) -> bool:
     """更新条目"""
     try:
-        file_path = get_rule_entries_path(rule_id)
-        
-        if not file_path.exists():
-            return False
-        
-        with open(file_path, 'r', encoding='utf-8') as file:
-            entries = json.load(file)
-        
-        found = False
-        for i, entry in enumerate(entries):
-            if entry.get('id') == entry_id:
-                entries[i].update(updated_data)
-                found = True
-                break
-        
-        if not found:
-            return False
-        
-        with open(file_path, 'w', encoding='utf-8') as file:
-            json.dump(entries, file, ensure_ascii=False, indent=2)
-        
-        return True
+        updated = await run_in_session(_update_entry, rule_id, entry_id, updated_data, commit=True)
+        feed_cache.invalidate(rule_id)
+        return updated
     except Exception as e:
         logger.error(f"更新条目时出错: {str(e)}")
         return False
@@ -114,24 +224,19 @@ async def update_entry(rule_id: int, entry_id: str, updated_data: Dict[str, Any]
 async def delete_entry(rule_id: int, entry_id: str) -> bool:
     """删除条目"""
     try:
-        file_path = get_rule_entries_path(rule_id)
-        
-        if not file_path.exists():
-            return False
-        
-        with open(file_path, 'r', encoding='utf-8') as file:
-            entries = json.load(file)
-        
-        original_length = len(entries)
-        entries = [entry for entry in entries if entry.get('id') != entry_id]
-        
-        if len(entries) == original_length:
-            return False  # 没有找到对应ID的条目
-        
-        with open(file_path, 'w', encoding='utf-8') as file:
-            json.dump(entries, file, ensure_ascii=False, indent=2)
-        
-        return True
+        deleted = await run_in_session(_delete_entry, rule_id, entry_id, commit=True)
+        feed_cache.invalidate(rule_id)
+        return deleted
     except Exception as e:
         logger.error(f"删除条目时出错: {str(e)}")
-        return False 
\ No newline at end of file
+        return False
+
+async def delete_rule_entries(rule_id: int) -> int:
+    """删除规则对应的全部条目，返回删除的数量"""
+    try:
+        deleted = await run_in_session(_delete_rule_entries, rule_id, commit=True)
+        feed_cache.invalidate(rule_id)
+        return deleted
+    except Exception as e:
+        logger.error(f"删除规则条目时出错: {str(e)}")
+        return 0
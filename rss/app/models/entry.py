@@ -28,6 +28,9 @@ class Entry(BaseModel):
     created_at: Optional[str] = None  # 添加到系统的时间 
     original_link: Optional[str] = None
     sender_info: Optional[str] = None
+    auto_title: Optional[str] = None  # 写入时按标题模板提取的标题
+    content_html: Optional[str] = None  # 写入时渲染的全部内容HTML
+    auto_content_html: Optional[str] = None  # 写入时渲染的提取标题后剩余内容HTML
 
     
     def __init__(self, **data):
@@ -0,0 +1,245 @@
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+from sqlalchemy import select
+from ai import get_ai_provider
+from models.models import ForwardRule, RSSConfig, RSSPattern
+from models.db_executor import run_in_session
+from ..core.config import settings
+from ..models.entry import Entry
+
+logger = logging.getLogger(__name__)
+
+
+def _get_patterns(session, rss_config_id: int, pattern_type: str) -> List[str]:
+    return session.execute(
+        select(RSSPattern.pattern)
+        .where(RSSPattern.rss_config_id == rss_config_id, RSSPattern.pattern_type == pattern_type)
+        .order_by(RSSPattern.priority)
+    ).scalars().all()
+
+
+def _load_rss_settings(session, rule_id: int) -> Optional[Dict[str, Any]]:
+    """在一个会话中读取处理条目需要的RSS配置、AI模型和正则模式"""
+    rss_config = session.query(RSSConfig).filter(RSSConfig.rule_id == rule_id).first()
+    if rss_config is None:
+        return None
+
+    rss_settings = {
+        'is_ai_extract': rss_config.is_ai_extract,
+        'ai_extract_prompt': rss_config.ai_extract_prompt,
+        'ai_model': None,
+        'enable_custom_title_pattern': rss_config.enable_custom_title_pattern,
+        'enable_custom_content_pattern': rss_config.enable_custom_content_pattern,
+        'title_patterns': [],
+        'content_patterns': [],
+    }
+    if rss_config.is_ai_extract:
+        rss_settings['ai_model'] = session.query(ForwardRule.ai_model).filter(ForwardRule.id == rule_id).scalar()
+    if rss_config.enable_custom_title_pattern:
+        rss_settings['title_patterns'] = _get_patterns(session, rss_config.id, 'title')
+    if rss_config.enable_custom_content_pattern:
+        rss_settings['content_patterns'] = _get_patterns(session, rss_config.id, 'content')
+    return rss_settings
+
+
+async def build_entry(rule_id: int, entry_data: Dict[str, Any]) -> Optional[Entry]:
+    """根据RSS配置处理条目数据，生成待写入的条目
+
+    依次执行AI提取、自定义标题和内容正则、添加发送者和原始链接，
+    HTTP接口和RSS过滤器的直接写入共用这一处理流程。
+    条目数据带有 entry_id 时作为条目ID，重复写入同一条目不会产生多个条目。
+
+    Args:
+        rule_id: 规则ID
+        entry_data: 条目数据
+
+    Returns:
+        Optional[Entry]: 处理后的条目，由调用方写入；规则没有RSS配置时返回None
+    """
+    media_count = len(entry_data.get("media", []))
+    has_context = "context" in entry_data and entry_data["context"] is not None
+    logger.info(f"接收到新条目数据: 规则ID={rule_id}, 标题='{entry_data.get('title', '无标题')}', 媒体数量={media_count}, 包含上下文={has_context}")
+
+    rss_config = await run_in_session(_load_rss_settings, rule_id)
+    if rss_config is None:
+        logger.warning(f"规则 {rule_id} 没有RSS配置，跳过条目")
+        return None
+
+    if media_count > 0:
+        media_filenames = []
+        for m in entry_data.get("media", []):
+            if isinstance(m, dict):
+                media_filenames.append(m.get('filename', '未知'))
+            else:
+                media_filenames.append(getattr(m, 'filename', '未知'))
+        logger.info(f"媒体文件列表: {media_filenames}")
+
+        for media in entry_data.get("media", []):
+            if isinstance(media, dict):
+                filename = media.get("filename", "")
+            else:
+                filename = getattr(media, "filename", "")
+
+            media_path = os.path.join(settings.MEDIA_PATH, filename)
+            if not os.path.exists(media_path):
+                logger.warning(f"媒体文件不存在: {media_path}")
+
+    if has_context:
+        logger.info(f"条目包含原始上下文对象，属性: {', '.join(entry_data['context'].keys()) if hasattr(entry_data['context'], 'keys') else '无法获取属性'}")
+
+    entry_data["rule_id"] = rule_id
+    if not entry_data.get("message_id"):
+        entry_data["message_id"] = entry_data.get("id", "")
+
+    entry = Entry(
+        id=entry_data.get("entry_id"),
+        rule_id=rule_id,
+        message_id=entry_data.get("message_id", entry_data.get("id", "")),
+        title=entry_data.get("title", "新消息"),
+        content=entry_data.get("content", ""),
+        published=entry_data.get("published"),
+        author=entry_data.get("author", ""),
+        link=entry_data.get("link", ""),
+        media=entry_data.get("media", []),
+        original_link=entry_data.get("original_link"),
+        sender_info=entry_data.get("sender_info")
+    )
+
+    if rss_config['is_ai_extract']:
+        try:
+            provider = await get_ai_provider(rss_config['ai_model'])
+            json_text = await provider.process_message(
+                message=entry.content or "",
+                prompt=rss_config['ai_extract_prompt'],
+                model=rss_config['ai_model']
+            )
+            logger.info(f"AI提取内容: {json_text}")
+
+            if "```" in json_text:
+                json_text = re.sub(r'```(\w+)?\n', '', json_text)  # 开始标记（带可选的语言标识）
+                json_text = re.sub(r'\n```', '', json_text)  # 结束标记
+                json_text = json_text.strip()
+                logger.info(f"去除代码块标记后的内容: {json_text}")
+
+            try:
+                json_data = json.loads(json_text)
+                logger.info(f"解析后的JSON数据: {json_data}")
+
+                title = json_data.get("title", "")
+                content = json_data.get("content", "")
+                entry.title = title
+                entry.content = content
+            except json.JSONDecodeError as e:
+                logger.error(f"JSON解析错误: {str(e)}, 原始文本: {json_text}")
+                try:
+                    json_match = re.search(r'\{.*\}', json_text, re.DOTALL)
+                    if json_match:
+                        clean_json = json_match.group(0)
+                        logger.info(f"尝试提取JSON: {clean_json}")
+                        json_data = json.loads(clean_json)
+
+                        title = json_data.get("title", "")
+                        content = json_data.get("content", "")
+                        entry.title = title
+                        entry.content = content
+                        logger.info(f"成功从文本中提取JSON数据")
+                    else:
+                        logger.error("无法从AI响应中提取有效JSON")
+                except Exception as inner_e:
+                    logger.error(f"尝试二次解析JSON时出错: {str(inner_e)}")
+            except Exception as e:
+                logger.error(f"处理JSON数据时出错: {str(e)}")
+        except Exception as e:
+            logger.error(f"AI提取内容时出错: {str(e)}")
+
+    logger.info(f"启用自定义标题模式: {rss_config['enable_custom_title_pattern']}, 启用自定义内容模式: {rss_config['enable_custom_content_pattern']}")
+    if rss_config['enable_custom_title_pattern'] or rss_config['enable_custom_content_pattern']:
+        try:
+            original_content = entry.content or ""
+            original_title = entry.title
+
+            if rss_config['enable_custom_title_pattern']:
+                title_patterns = rss_config['title_patterns']
+
+                logger.info(f"找到 {len(title_patterns)} 个标题模式")
+
+                processing_content = original_content
+                logger.info(f"标题提取初始文本: {processing_content[:100]}..." if len(processing_content) > 100 else processing_content)
+
+                for pattern in title_patterns:
+                    logger.info(f"开始尝试标题模式: {pattern}")
+                    try:
+                        logger.info(f"对内容应用正则表达式: {pattern}")
+                        match = re.search(pattern, processing_content)
+                        if match:
+                            logger.info(f"找到匹配: {match.groups()}")
+                            if match.groups():
+                                entry.title = match.group(1)
+                                logger.info(f"使用标题模式 '{pattern}' 提取到标题: {entry.title}")
+                            else:
+                                logger.warning(f"模式 '{pattern}' 匹配成功但没有捕获组")
+                        else:
+                            logger.info(f"模式 '{pattern}' 未找到匹配")
+                    except Exception as e:
+                        logger.error(f"应用标题正则表达式 '{pattern}' 时出错: {str(e)}")
+                        logger.exception("详细错误信息:")
+
+            if rss_config['enable_custom_content_pattern']:
+                content_patterns = rss_config['content_patterns']
+
+                logger.info(f"找到 {len(content_patterns)} 个内容模式")
+
+                processing_content = original_content
+                logger.info(f"内容提取初始文本: {processing_content[:100]}..." if len(processing_content) > 100 else processing_content)
+
+                for i, pattern in enumerate(content_patterns):
+                    try:
+                        logger.info(f"[步骤 {i+1}/{len(content_patterns)}] 对内容应用正则表达式: {pattern}")
+                        logger.info(f"处理前的内容长度: {len(processing_content)}, 预览: {processing_content[:150]}..." if len(processing_content) > 150 else processing_content)
+
+                        match = re.search(pattern, processing_content)
+                        if match and match.groups():
+                            extracted_content = match.group(1)
+                            processing_content = extracted_content  # 更新处理内容为提取结果
+                            entry.content = extracted_content
+
+                            logger.info(f"使用内容模式 '{pattern}' 提取到内容，长度: {len(extracted_content)}")
+                            logger.info(f"处理后的内容长度: {len(processing_content)}, 预览: {processing_content[:150]}..." if len(processing_content) > 150 else processing_content)
+                        else:
+                            logger.info(f"模式 '{pattern}' 未找到匹配或没有捕获组，内容保持不变")
+                    except Exception as e:
+                        logger.error(f"应用内容正则表达式 '{pattern}' 时出错: {str(e)}")
+
+
+            if not entry.title and original_title:
+                entry.title = original_title
+                logger.info(f"恢复原标题: {entry.title}")
+
+        except Exception as e:
+            logger.error(f"使用正则表达式提取标题和内容时出错: {str(e)}")
+
+
+    if entry.sender_info:
+        entry.sender_info = entry.sender_info.strip()
+        entry.content = entry.sender_info +":" +"\n\n" + entry.content
+
+    if entry.original_link:
+        clean_link = entry.original_link.replace("原始消息:", "").strip()
+        clean_link = clean_link.replace("\n", "").replace("\r", "")
+        clean_link = re.sub(r'\s+', ' ', clean_link).strip()
+
+        if clean_link.startswith("http"):
+            if entry.author:
+                entry.content += f'\n\n[来源: {entry.author}]({clean_link})'
+            else:
+                entry.content += f'\n\n[来源]({clean_link})'
+            logger.info(f"已添加清理后的链接(Markdown格式): {clean_link}")
+        else:
+            logger.warning(f"链接格式不正确，跳过添加: {clean_link}")
+
+    logger.info(f"处理后的消息: {entry.content}")
+
+    return entry
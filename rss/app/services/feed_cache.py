@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from utils.constants import RSS_FEED_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedFeed:
+    """渲染好的Feed"""
+    body: bytes
+    etag: str
+    last_modified: float
+    state: tuple
+
+    @property
+    def last_modified_header(self) -> str:
+        return formatdate(self.last_modified, usegmt=True)
+
+    def is_not_modified(self, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+        """判断条件请求是否可以返回304，同时带有两个条件时以If-None-Match为准"""
+        if if_none_match:
+            # If-None-Match使用弱比较，忽略W/前缀
+            tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            return '*' in tags or self.etag in tags
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            # HTTP日期只精确到秒
+            return int(self.last_modified) <= since
+        return False
+
+
+class FeedCache:
+    """
+    按 (规则ID, 基础URL) 缓存渲染好的Feed XML
+
+    缓存的Feed带有生成时的状态（RSS配置和条目数量、最新条目ID），状态不变时直接返回，
+    其他进程写入的条目也会使状态改变；本进程写入条目时显式失效。缓存数量超过上限时淘汰最久未使用的。
+    """
+
+    def __init__(self, max_size: int = RSS_FEED_CACHE_SIZE):
+        self._feeds: "OrderedDict[Tuple[int, str], CachedFeed]" = OrderedDict()
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self.hit_count = 0
+        self.render_count = 0
+
+    def get(self, rule_id: int, base_url: str, state: tuple) -> Optional[CachedFeed]:
+        """获取状态一致的缓存Feed，没有或已过期时返回None"""
+        key = (rule_id, base_url)
+        with self._lock:
+            cached = self._feeds.get(key)
+            if cached is None or cached.state != state:
+                return None
+            self._feeds.move_to_end(key)
+            self.hit_count += 1
+            return cached
+
+    def put(self, rule_id: int, base_url: str, state: tuple, body: bytes) -> CachedFeed:
+        """保存渲染结果，内容与之前的缓存相同时保留原来的最后修改时间"""
+        key = (rule_id, base_url)
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        with self._lock:
+            previous = self._feeds.get(key)
+            last_modified = previous.last_modified if previous and previous.etag == etag else time.time()
+            cached = CachedFeed(body=body, etag=etag, last_modified=last_modified, state=state)
+            self._feeds[key] = cached
+            self._feeds.move_to_end(key)
+            while len(self._feeds) > self._max_size:
+                self._feeds.popitem(last=False)
+            self.render_count += 1
+        return cached
+
+    def invalidate(self, rule_id: int) -> None:
+        """删除规则在所有基础URL下的缓存"""
+        with self._lock:
+            for key in [key for key in self._feeds if key[0] == rule_id]:
+                del self._feeds[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._feeds.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取缓存统计"""
+        return {
+            "feeds": len(self._feeds),
+            "hits": self.hit_count,
+            "renders": self.render_count,
+        }
+
+
+feed_cache = FeedCache()
@@ -15,6 +15,35 @@ import pytz
 
 logger = logging.getLogger(__name__)
 
+TITLE_TEMPLATE_PATH = Path(__file__).parent.parent / 'configs' / 'title_template.json'
+
+
+class TitlePatterns:
+    """标题模板配置，编译后缓存，配置文件的修改时间变化时重新加载"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._mtime = None
+        self._patterns = ()
+
+    def get(self) -> tuple:
+        """返回 (编译后的正则, 模式字符串, 描述) 元组"""
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                title_config = json.load(f)
+            self._patterns = tuple(
+                (re.compile(pattern_info['pattern'], re.MULTILINE), pattern_info['pattern'], pattern_info['description'])
+                for pattern_info in title_config['patterns']
+            )
+            self._mtime = mtime
+            logger.info(f"已加载标题模板配置文件: {self.path}, 模式数量: {len(self._patterns)}")
+        return self._patterns
+
+
+title_patterns = TitlePatterns(TITLE_TEMPLATE_PATH)
+
+
 class FeedService:
     
     
@@ -33,18 +62,9 @@ class FeedService:
             return "", ""
             
         try:
-            config_path = Path(__file__).parent.parent / 'configs' / 'title_template.json'
-            logger.info(f"正在读取标题模板配置文件: {config_path}")
-            with open(config_path, 'r', encoding='utf-8') as f:
-                title_config = json.load(f)
-                
-            for pattern_info in title_config['patterns']:
-                pattern_str = pattern_info['pattern']
-                pattern_desc = pattern_info['description']
+            for pattern, pattern_str, pattern_desc in title_patterns.get():
                 logger.debug(f"尝试匹配模式: {pattern_desc} ({pattern_str})")
                 
-                pattern = re.compile(pattern_str, re.MULTILINE)
-                
                 match = pattern.match(content)
                 if match:
                     title = FeedService.clean_title(match.group(1))
@@ -70,6 +90,20 @@ class FeedService:
             logger.error(f"提取标题和内容时出错: {str(e)}")
             return "", content
     
+    @staticmethod
+    def prerender_entry(entry: Entry) -> Entry:
+        """生成条目的标题和HTML片段，在写入条目时调用，生成Feed时直接使用
+
+        RSS配置可能在写入后修改，因此同时保存全部内容和提取标题后剩余内容的HTML。
+        """
+        extracted_title, extracted_content = FeedService.extract_telegram_title_and_content(entry.content or "")
+        entry.auto_title = extracted_title
+        entry.content_html = FeedService.convert_markdown_to_html(entry.content or "")
+        if extracted_content == (entry.content or ""):
+            entry.auto_content_html = entry.content_html
+        else:
+            entry.auto_content_html = FeedService.convert_markdown_to_html(extracted_content)
+        return entry
 
     @staticmethod
     def clean_title(title: str) -> str:
@@ -111,6 +145,24 @@ class FeedService:
         
         return content
     
+    @staticmethod
+    def get_entry_datetime(entry: Entry):
+        """获取条目的发布时间，发布时间无效时使用添加到系统的时间，都无效时返回None"""
+        for value in (entry.published, entry.created_at):
+            if not value:
+                continue
+            try:
+                entry_dt = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                continue
+            if entry_dt.tzinfo is None:
+                try:
+                    entry_dt = pytz.timezone(DEFAULT_TIMEZONE).localize(entry_dt)
+                except Exception:
+                    entry_dt = pytz.UTC.localize(entry_dt)
+            return entry_dt
+        return None
+    
     @staticmethod
     async def generate_feed_from_entries(rule_id: int, entries: List[Entry], base_url: str = None) -> FeedGenerator:
         """根据真实条目生成Feed"""
@@ -148,6 +200,11 @@ class FeedService:
         
         fg.link(href=f'{base_url}/rss/feed/{rule_id}')
         
+        # 使用最新条目的时间作为lastBuildDate，条目不变时渲染结果（和ETag）保持不变
+        entry_dts = [entry_dt for entry_dt in map(FeedService.get_entry_datetime, entries) if entry_dt]
+        if entry_dts:
+            fg.lastBuildDate(max(entry_dts))
+        
         for entry in entries:
             try:
                 fe = fg.add_entry()
@@ -161,22 +218,18 @@ class FeedService:
                     fe.title(entry.title)
                     content = entry.content
                 else:
+                    if entry.content_html is None:
+                        # 写入时没有预先生成片段的旧条目
+                        FeedService.prerender_entry(entry)
                     if rss_config.enable_custom_title_pattern:
                         fe.title(entry.title)
-                    if rss_config.enable_custom_content_pattern:
-                        content = entry.content
                     # 自动提取标题和内容
-                    if rss_config.is_auto_title or rss_config.is_auto_content:
-                        extracted_title, extracted_content = FeedService.extract_telegram_title_and_content(entry.content or "")
-                        if rss_config.is_auto_title:
-                            fe.title(extracted_title)
-                        if rss_config.is_auto_content:
-                            content = FeedService.convert_markdown_to_html(extracted_content)
-                        else:
-                            # 如果不自动提取内容，使用原始内容
-                            content = FeedService.convert_markdown_to_html(entry.content or "")
+                    if rss_config.is_auto_title:
+                        fe.title(entry.auto_title)
+                    if rss_config.is_auto_content:
+                        content = entry.auto_content_html
                     else:
-                        content = FeedService.convert_markdown_to_html(entry.content or "")
+                        content = entry.content_html
 
                 all_media_urls = []  # 存储所有媒体URL用于后续检查
                 
@@ -317,10 +370,10 @@ class FeedService:
                 
                 fe.description(content)
                 
-                try:
-                    published_dt = datetime.fromisoformat(entry.published)
+                published_dt = FeedService.get_entry_datetime(entry)
+                if published_dt:
                     fe.published(published_dt)
-                except ValueError:
+                else:
                     try:
                         tz = pytz.timezone(DEFAULT_TIMEZONE)
                         fe.published(datetime.now(tz))
@@ -7,7 +7,9 @@ from dotenv import load_dotenv
 from telethon import TelegramClient
 from models.models import get_session, Chat
 import traceback
-from utils.constants import DEFAULT_TIMEZONE
+from utils.constants import DEFAULT_TIMEZONE, CHAT_CLEANUP_ENABLED
+from utils.common import check_and_clean_chats
+from managers.peer_cache_manager import peer_cache_manager
 logger = logging.getLogger(__name__)
 
 class ChatUpdater:
@@ -54,6 +56,10 @@ class ChatUpdater:
                 wait_seconds = (target_time - now).total_seconds()
                 await asyncio.sleep(wait_seconds)
                 
+                # 先清理不再被规则使用的聊天，不必再更新它们的信息
+                if CHAT_CLEANUP_ENABLED:
+                    await check_and_clean_chats()
+                
                 await self._update_all_chats()
                 
             except asyncio.CancelledError:
@@ -92,6 +98,7 @@ class ChatUpdater:
                             continue
                             
                         entity = await self.user_client.get_entity(chat_id_int)
+                        await peer_cache_manager.remember('user', chat.id, entity)
                         new_name = entity.title if hasattr(entity, 'title') else (
                             f"{entity.first_name} {entity.last_name}" if hasattr(entity, 'last_name') and entity.last_name 
                             else entity.first_name if hasattr(entity, 'first_name') 
@@ -124,6 +131,9 @@ class ChatUpdater:
                 await asyncio.sleep(1)
                 
             logger.info(f"聊天信息更新完成。总计: {total_chats}, 更新: {updated_count}, 跳过: {skipped_count}, 错误: {error_count}")
+
+            # 刷新机器人账号的目标聊天Peer缓存
+            await peer_cache_manager.refresh('bot')
             
         except Exception as e:
             logger.error(f"更新聊天信息时出错: {str(e)}")
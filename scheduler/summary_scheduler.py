@@ -9,6 +9,7 @@ from telethon import TelegramClient, errors
 from ai import get_ai_provider
 import traceback
 from utils.constants import DEFAULT_TIMEZONE,DEFAULT_AI_MODEL,DEFAULT_SUMMARY_PROMPT
+from filters.rate_limiter import global_rate_limiter, HISTORY, SEND, BULK
 
 logger = logging.getLogger(__name__)
 
@@ -150,6 +151,7 @@ class SummaryScheduler:
 
                     while True:
                         batch = []  # 移到循环外部
+                        await global_rate_limiter.get_token(HISTORY, client=self.user_client, priority=BULK)
                         messages_batch = await self.user_client.get_messages(
                             source_chat_id,
                             limit=self.batch_size,
@@ -234,6 +236,7 @@ class SummaryScheduler:
                         while attempt < MAX_SEND_ATTEMPTS:
                             logger.info(f"Retry attempt {attempt + 1}/{MAX_SEND_ATTEMPTS} for sending message to chat ID {target_chat_id}.")
                             try:
+                                await global_rate_limiter.get_token(SEND, client=self.bot_client, chat_id=target_chat_id, priority=BULK)
                                 if use_markdown:
                                     current_message = await self.bot_client.send_message(
                                         target_chat_id,
@@ -260,8 +263,9 @@ class SummaryScheduler:
 
                             except errors.FloodWaitError as fwe:
                                 if attempt < MAX_SEND_ATTEMPTS - 1:
-                                    logger.warning(f"触发Telegram发送频率限制，等待 {fwe.seconds} 秒后重试...")
-                                    await asyncio.sleep(fwe.seconds)
+                                    logger.warning(f"触发Telegram发送频率限制，{fwe.seconds} 秒后重试...")
+                                    # 冻结对应的限速桶，下次获取令牌时等待，不阻塞其他目标的发送
+                                    global_rate_limiter.report_flood_wait(fwe.seconds, SEND, client=self.bot_client, chat_id=target_chat_id)
                                     attempt += 1
                                 else:
                                     logger.error("重试次数已达上限，发送失败。")
@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import models.models as models_module
+from models.models import Base, MessageFingerprint
+from managers.dedup_manager import DedupManager
+
+LONG_TEXT = "the quick brown fox jumps over the lazy dog again"
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'dedup.db'}", connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine, tables=[MessageFingerprint.__table__])
+    monkeypatch.setattr(models_module, "_engine", engine)
+    monkeypatch.setattr(models_module, "_session_factory", sessionmaker(bind=engine))
+    return DedupManager()
+
+
+def photo(photo_id):
+    return SimpleNamespace(photo=SimpleNamespace(id=photo_id), document=None)
+
+
+def text_message():
+    return SimpleNamespace(photo=None, document=None)
+
+
+def test_media_matches_with_its_caption(manager):
+    async def scenario():
+        duplicate, fingerprint = await manager.check(1, photo(10), "caption one")
+        assert not duplicate
+        await manager.record(1, fingerprint)
+
+        # 同一媒体配不同文案不算重复
+        assert not (await manager.check(1, photo(10), "another caption"))[0]
+        assert (await manager.check(1, photo(10), "caption one"))[0]
+
+        # 重新加载后按数据库中的组合指纹判断
+        manager._indexes = manager._load()
+        assert (await manager.check(1, photo(10), "caption one"))[0]
+
+    asyncio.run(scenario())
+
+
+def test_short_text_is_not_deduplicated(manager):
+    async def scenario():
+        for _ in range(2):
+            duplicate, fingerprint = await manager.check(1, text_message(), "ok")
+            assert not duplicate and fingerprint is None
+
+    asyncio.run(scenario())
+
+
+def test_fingerprint_is_only_kept_after_send(manager):
+    async def scenario():
+        duplicate, fingerprint = await manager.check(1, text_message(), LONG_TEXT)
+        assert not duplicate
+        # 预留期间相同的消息被过滤
+        assert (await manager.check(1, text_message(), LONG_TEXT))[0]
+
+        # 没有发送时撤销预留，相同的消息仍可转发
+        manager.release(1, fingerprint)
+        duplicate, fingerprint = await manager.check(1, text_message(), LONG_TEXT)
+        assert not duplicate
+
+        await manager.record(1, fingerprint)
+        manager._indexes = manager._load()
+        assert (await manager.check(1, text_message(), LONG_TEXT))[0]
+
+    asyncio.run(scenario())
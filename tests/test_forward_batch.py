@@ -0,0 +1,65 @@
+import asyncio
+from telethon.errors import FloodWaitError
+import managers.forward_batch_manager as batch_module
+from managers.forward_batch_manager import ForwardBatchManager
+from filters.rate_limiter import HierarchicalRateLimiter, SEND
+
+
+class FakeClient:
+    def __init__(self, flood_waits):
+        self.flood_waits = flood_waits
+        self.forwarded = []
+
+    async def forward_messages(self, target, message_ids, source):
+        if self.flood_waits:
+            self.flood_waits -= 1
+            raise FloodWaitError(request=None, capture=0)
+        self.forwarded.append(list(message_ids))
+
+
+def test_flood_wait_requeues_batch(monkeypatch):
+    monkeypatch.setattr(batch_module, "FORWARD_BATCH_WINDOW_MS", 0)
+    monkeypatch.setattr(batch_module, "global_rate_limiter", HierarchicalRateLimiter(
+        global_limit=(30, 30), client_limit=(20, 20), chat_limit=(20, 20), method_limits={SEND: (20, 20)}
+    ))
+    manager = ForwardBatchManager()
+    client = FakeClient(flood_waits=1)
+    results = []
+
+    async def on_done(sent):
+        results.append(sent)
+
+    async def scenario():
+        manager.add(client, 200, 200, 100, 1, on_done=on_done)
+        manager.add(client, 200, 200, 100, 2, on_done=on_done)
+        await manager.flush_all()
+
+    asyncio.run(scenario())
+    assert client.forwarded == [[1], [2]]
+    assert results == [True, True]
+    assert manager.get_stats()["dropped"] == 0
+    # 批次发送完后不再保留该目标的锁
+    assert not manager._locks and not manager._lock_users
+
+
+def test_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(batch_module, "FORWARD_BATCH_WINDOW_MS", 0)
+    monkeypatch.setattr(batch_module, "FLOOD_RETRY_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(batch_module, "global_rate_limiter", HierarchicalRateLimiter(
+        global_limit=(30, 30), client_limit=(20, 20), chat_limit=(20, 20), method_limits={SEND: (20, 20)}
+    ))
+    manager = ForwardBatchManager()
+    client = FakeClient(flood_waits=10)
+    results = []
+
+    async def on_done(sent):
+        results.append(sent)
+
+    async def scenario():
+        manager.add(client, 200, 200, 100, 1, on_done=on_done)
+        await manager.flush_all()
+
+    asyncio.run(scenario())
+    assert client.forwarded == []
+    assert results == [False]
+    assert manager.get_stats()["dropped"] == 1
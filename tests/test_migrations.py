@@ -0,0 +1,30 @@
+import time
+import pytest
+from sqlalchemy import create_engine, text
+import models.models as models_module
+from models.models import migrate_db, get_schema_version, schema_version_table
+
+
+def test_failed_legacy_step_is_not_recorded(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE forward_rules (id INTEGER PRIMARY KEY, forward_mode VARCHAR)"))
+        # keywords是视图时无法添加is_blacklist列
+        connection.execute(text("CREATE VIEW keywords AS SELECT 1 AS id, 1 AS rule_id, 'a' AS keyword, 0 AS is_regex"))
+
+    with pytest.raises(Exception):
+        migrate_db(engine)
+    assert get_schema_version(engine) == 0
+
+
+def test_version_recorded_by_concurrent_starter(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'concurrent.db'}")
+
+    def migrate(engine):
+        # 模拟另一个进程同时执行完迁移并记录了版本号
+        with engine.begin() as connection:
+            connection.execute(schema_version_table.insert(), {'version': 1, 'description': '', 'applied_at': time.time()})
+
+    monkeypatch.setattr(models_module, "MIGRATIONS", [(1, 'first', migrate), (2, 'second', lambda engine: None)])
+    migrate_db(engine)
+    assert get_schema_version(engine) == 2
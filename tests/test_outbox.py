@@ -0,0 +1,121 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import models.models as models_module
+from models.models import Base, OutboundMessage
+from managers.outbox_manager import OutboxManager
+from utils.constants import OUTBOX_MAX_ATTEMPTS
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'outbox.db'}", connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine, tables=[OutboundMessage.__table__])
+    monkeypatch.setattr(models_module, "_engine", engine)
+    monkeypatch.setattr(models_module, "_session_factory", sessionmaker(bind=engine))
+    return OutboxManager()
+
+
+def make_context(message_id=1):
+    event = SimpleNamespace(chat_id=100, message=SimpleNamespace(id=message_id))
+    return SimpleNamespace(
+        event=event,
+        rule=SimpleNamespace(id=7),
+        is_media_group=False,
+        media_group_messages=[],
+        media_files=[],
+        sender_info="",
+        message_text="hello",
+        time_info="",
+        original_link="",
+        buttons=None,
+    )
+
+
+def get_status(entry_id):
+    session = models_module.get_session()
+    try:
+        return session.get(OutboundMessage, entry_id).status
+    finally:
+        session.close()
+
+
+def test_claimed_entry_is_not_sent_twice(manager):
+    async def scenario():
+        entry_id = await manager.enqueue(make_context(), 200, "hello", None, False)
+        assert entry_id is not None
+        # 正在发送的记录不能被再次认领
+        assert await manager.enqueue(make_context(), 200, "hello", None, False) is None
+        assert not manager._claim_entry(entry_id)
+
+        await manager.mark_failed(entry_id, "error")
+        assert entry_id not in manager._inflight
+        assert get_status(entry_id) == 'pending'
+        assert manager._claim_entry(entry_id)
+        assert not manager._claim_entry(entry_id)
+
+    asyncio.run(scenario())
+
+
+def test_resends_stop_after_max_attempts(manager):
+    async def scenario():
+        entry_id = await manager.enqueue(make_context(), 200, "hello", None, False)
+        for _ in range(OUTBOX_MAX_ATTEMPTS):
+            await manager.mark_failed(entry_id, "error")
+            manager._claim_entry(entry_id)
+        assert get_status(entry_id) == 'failed'
+        assert await manager.enqueue(make_context(), 200, "hello", None, False) is None
+
+    asyncio.run(scenario())
+
+
+def test_permanent_failure_and_stale_claims(manager):
+    async def scenario():
+        failed_id = await manager.enqueue(make_context(1), 200, "hello", None, False)
+        await manager.mark_failed(failed_id, "private", permanent=True)
+        assert get_status(failed_id) == 'failed'
+
+        stale_id = await manager.enqueue(make_context(2), 200, "hello", None, False)
+        manager.forget(stale_id)
+        assert manager._reset_claims() == 1
+        assert get_status(stale_id) == 'pending'
+
+    asyncio.run(scenario())
+
+
+def test_flood_wait_keeps_attempts_and_stops_drain(manager, monkeypatch):
+    from telethon.errors import FloodWaitError
+    import managers.outbox_manager as outbox_module
+    from filters.rate_limiter import HierarchicalRateLimiter, SEND
+    monkeypatch.setattr(outbox_module, "global_rate_limiter", HierarchicalRateLimiter(
+        global_limit=(30, 30), client_limit=(20, 20), chat_limit=(20, 20), method_limits={SEND: (20, 20)}
+    ))
+    delivered = []
+
+    async def deliver(entry):
+        delivered.append(entry.id)
+        raise FloodWaitError(request=None, capture=0)
+
+    monkeypatch.setattr(manager, "_deliver", deliver)
+
+    async def scenario():
+        first_id = await manager.enqueue(make_context(1), 200, "hello", None, False)
+        second_id = await manager.enqueue(make_context(2), 200, "hello", None, False)
+        manager.forget(first_id)
+        manager.forget(second_id)
+        manager._reset_claims()
+
+        assert await manager.drain() == 0
+        # 频率限制后不再尝试发送剩余消息
+        assert delivered == [first_id]
+        assert first_id not in manager._inflight
+        assert get_status(first_id) == 'pending' and get_status(second_id) == 'pending'
+        session = models_module.get_session()
+        try:
+            assert session.get(OutboundMessage, first_id).attempts == 0
+        finally:
+            session.close()
+
+    asyncio.run(scenario())
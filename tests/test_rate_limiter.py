@@ -0,0 +1,54 @@
+import asyncio
+import time
+import pytest
+from filters.rate_limiter import HierarchicalRateLimiter, SEND, parse_limit
+
+
+def make_limiter():
+    return HierarchicalRateLimiter(
+        global_limit=(30, 30),
+        client_limit=(20, 20),
+        chat_limit=(1, 1),
+        method_limits={SEND: (20, 20)},
+    )
+
+
+def test_frozen_chat_does_not_block_other_chats():
+    limiter = make_limiter()
+
+    async def scenario():
+        limiter.report_flood_wait(5, SEND, chat_id=111)
+        blocked = asyncio.create_task(limiter.get_token(SEND, chat_id=111))
+        await asyncio.sleep(0)
+        start = time.monotonic()
+        await asyncio.wait_for(limiter.get_token(SEND, chat_id=222), timeout=1)
+        elapsed = time.monotonic() - start
+        assert not blocked.done()
+        blocked.cancel()
+        return elapsed
+
+    assert asyncio.run(scenario()) < 0.5
+
+
+def test_waiters_on_the_same_chat_keep_their_order():
+    limiter = make_limiter()
+    order = []
+
+    async def acquire(name):
+        await limiter.get_token(SEND, chat_id=111)
+        order.append(name)
+
+    async def scenario():
+        await limiter.get_token(SEND, chat_id=111)
+        tasks = [asyncio.create_task(acquire(name)) for name in ("first", "second")]
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=5)
+
+    asyncio.run(scenario())
+    assert order == ["first", "second"]
+
+
+def test_parse_limit_rejects_invalid_values():
+    assert parse_limit('3,1.5', 'RATE_LIMIT_CHAT') == (3, 1.5)
+    for value in ('3,0', '3,-1', '0.5,1', '3'):
+        with pytest.raises(ValueError, match='RATE_LIMIT_CHAT'):
+            parse_limit(value, 'RATE_LIMIT_CHAT')
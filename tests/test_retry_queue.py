@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+from telethon.errors import FloodWaitError
+from filters.base_filter import BaseFilter
+from filters.filter_chain import FilterChain
+from managers.retry_queue_manager import RetryQueueManager
+import filters.filter_chain as filter_chain_module
+
+
+class FakeSender(BaseFilter):
+    """按顺序发送的过滤器，对指定消息触发一次FloodWait"""
+
+    ordered_delivery = True
+
+    def __init__(self, flood_once):
+        super().__init__()
+        self.flood_once = set(flood_once)
+        self.sent = []
+
+    async def _process(self, context):
+        if context.name in self.flood_once:
+            self.flood_once.discard(context.name)
+            raise FloodWaitError(request=None, capture=0)
+        self.sent.append(context.name)
+        return True
+
+
+def make_context(name, target_chat_id=1):
+    return SimpleNamespace(name=name, rule=SimpleNamespace(target_chat_id=target_chat_id), errors=[], media_files=[])
+
+
+async def drain(manager):
+    while manager.get_stats()["pending"]:
+        await asyncio.sleep(0.01)
+
+
+def test_messages_queued_behind_flood_wait_are_sent_in_order(monkeypatch):
+    manager = RetryQueueManager()
+    monkeypatch.setattr(filter_chain_module, "retry_queue_manager", manager)
+    sender = FakeSender(flood_once={"A"})
+    chain = FilterChain().add_filter(sender)
+
+    async def scenario():
+        for name in ("A", "B", "C"):
+            await chain.run(make_context(name))
+        await asyncio.wait_for(drain(manager), timeout=5)
+
+    asyncio.run(scenario())
+
+    assert sender.sent == ["A", "B", "C"]
+    assert manager.get_stats()["dropped"] == 0
+
+
+def test_ordering_deferral_does_not_count_as_attempt():
+    manager = RetryQueueManager()
+    chain = FilterChain()
+    head, waiting = make_context("A"), make_context("B")
+
+    async def scenario():
+        manager.defer(1, 60, chain, head, 0)
+        manager.defer(1, 0, chain, waiting, 0, is_retry=False)
+        manager.defer(1, 0, chain, waiting, 0, is_retry=False)
+        attempts = [job.attempts for job in manager._queues[1]]
+        manager.stop()
+        return attempts
+
+    assert asyncio.run(scenario()) == [1, 0]
+    assert not manager.has_pending(1, head)
@@ -0,0 +1,67 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models.models import Base, Chat, ForwardRule, RuleSync, Keyword, ReplaceRule
+from models.rule_copy import (
+    copy_rule_parts, _copy_settings, COPY_ALL, COPY_RULE_SYNCS, CopyCount,
+    COPY_KEYWORDS, COPY_REGEX_KEYWORDS, COPY_REPLACE_RULES
+)
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'copy.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    chats = [Chat(telegram_chat_id=str(chat_id)) for chat_id in range(4)]
+    session.add_all(chats)
+    session.flush()
+    for rule_id in (1, 2, 3):
+        session.add(ForwardRule(id=rule_id, source_chat_id=chats[0].id, target_chat_id=chats[rule_id].id, enable_sync=False))
+    session.add(RuleSync(rule_id=1, sync_rule_id=3))
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.mark.parametrize("parts", [(COPY_RULE_SYNCS,), COPY_ALL])
+def test_copied_syncs_enable_sync(session, parts):
+    result = copy_rule_parts(session, 1, [2], parts)
+    session.commit()
+
+    assert result.counts[COPY_RULE_SYNCS].copied == 1
+    assert session.get(ForwardRule, 2).enable_sync is True
+
+
+def test_target_without_syncs_keeps_setting(session):
+    # 同步关系不会指向目标规则自身，规则3没有复制到同步关系
+    copy_rule_parts(session, 1, [3], (COPY_RULE_SYNCS,))
+    session.commit()
+
+    assert session.get(ForwardRule, 3).enable_sync is False
+
+
+def test_copy_settings_without_source(session):
+    assert _copy_settings(session, 99, (2,)) == CopyCount()
+
+
+def test_duplicates_match_keyword_and_pattern_only(session):
+    session.add_all([
+        Keyword(rule_id=1, keyword='a', is_regex=False, is_blacklist=True),
+        Keyword(rule_id=1, keyword='b', is_regex=True, is_blacklist=True),
+        ReplaceRule(rule_id=1, pattern='x', content='new'),
+        # 黑白名单或替换内容不同也视为重复
+        Keyword(rule_id=2, keyword='a', is_regex=False, is_blacklist=False),
+        Keyword(rule_id=2, keyword='b', is_regex=False, is_blacklist=True),
+        ReplaceRule(rule_id=2, pattern='x', content='old'),
+    ])
+    session.commit()
+
+    result = copy_rule_parts(session, 1, [2], (COPY_KEYWORDS, COPY_REGEX_KEYWORDS, COPY_REPLACE_RULES))
+    session.commit()
+
+    assert result.counts[COPY_KEYWORDS] == CopyCount(copied=0, skipped=1)
+    # 普通关键字不影响同名正则关键字的复制
+    assert result.counts[COPY_REGEX_KEYWORDS] == CopyCount(copied=1, skipped=0)
+    assert result.counts[COPY_REPLACE_RULES] == CopyCount(copied=0, skipped=1)
+    assert session.query(ReplaceRule).filter_by(rule_id=2).one().content == 'old'
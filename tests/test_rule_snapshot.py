@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from sqlalchemy import create_engine, delete, text
+from sqlalchemy.orm import sessionmaker
+import models.models as models_module
+from models.models import Base, Chat, ForwardRule, Keyword
+from managers.rule_snapshot_manager import rule_snapshot_manager
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rules.db'}", connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(models_module, "_engine", engine)
+    monkeypatch.setattr(models_module, "_session_factory", sessionmaker(bind=engine))
+
+    session = models_module.get_session()
+    source_a, source_b, target = Chat(telegram_chat_id='1'), Chat(telegram_chat_id='2'), Chat(telegram_chat_id='3')
+    session.add_all([source_a, source_b, target])
+    session.flush()
+    session.add_all([
+        ForwardRule(id=1, source_chat_id=source_a.id, target_chat_id=target.id),
+        ForwardRule(id=2, source_chat_id=source_b.id, target_chat_id=target.id),
+    ])
+    session.commit()
+    rule_snapshot_manager.clear()
+    yield session
+    session.close()
+    rule_snapshot_manager.clear()
+
+
+def cached_sources():
+    return set(rule_snapshot_manager._by_source)
+
+
+def load_all():
+    async def load():
+        await rule_snapshot_manager.get_source_rules('1')
+        await rule_snapshot_manager.get_source_rules('2')
+    asyncio.run(load())
+
+
+def test_write_invalidates_only_its_rule(session):
+    load_all()
+    assert cached_sources() == {'1', '2'}
+
+    session.add(Keyword(rule_id=1, keyword='spam'))
+    session.commit()
+    assert cached_sources() == {'2'}
+
+    load_all()
+    session.execute(delete(Keyword).where(Keyword.rule_id == 2))
+    session.commit()
+    assert cached_sources() == {'1'}
+
+
+def test_new_rule_invalidates_its_source(session):
+    load_all()
+    session.add(ForwardRule(id=3, source_chat_id=session.query(Chat).filter_by(telegram_chat_id='1').one().id,
+                            target_chat_id=session.query(Chat).filter_by(telegram_chat_id='2').one().id))
+    session.commit()
+    assert cached_sources() == {'2'}
+
+
+def test_explicit_and_unknown_writes(session):
+    load_all()
+    rule_snapshot_manager.invalidate(2)
+    assert cached_sources() == {'1'}
+
+    load_all()
+    # 文本SQL无法确定写入了哪些规则
+    session.execute(text("UPDATE keywords SET keyword = 'x'"))
+    session.commit()
+    assert cached_sources() == set()
+
+
+def test_query_bulk_delete_with_in(session):
+    load_all()
+    session.query(Keyword).filter(Keyword.rule_id.in_([1]), Keyword.keyword == 'x').delete(synchronize_session=False)
+    session.commit()
+    assert cached_sources() == {'2'}
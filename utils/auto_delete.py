@@ -3,6 +3,7 @@ import os
 import logging
 from functools import wraps
 from utils.constants import BOT_MESSAGE_DELETE_TIMEOUT, USER_MESSAGE_DELETE_ENABLE
+from filters.rate_limiter import global_rate_limiter, SEND, DELETE, INTERACTIVE
 logger = logging.getLogger(__name__)
 
 
@@ -39,6 +40,7 @@ async def reply_and_delete(event, text, delete_after_seconds=None, **kwargs):
     else:
         deletion_timeout = delete_after_seconds
     
+    await global_rate_limiter.get_token(SEND, client=event.client, chat_id=event.chat_id, priority=INTERACTIVE)
     message = await event.reply(text, **kwargs)
     
     if deletion_timeout != -1:
@@ -61,6 +63,7 @@ async def respond_and_delete(event, text, delete_after_seconds=None, **kwargs):
     else:
         deletion_timeout = delete_after_seconds
     
+    await global_rate_limiter.get_token(SEND, client=event.client, chat_id=event.chat_id, priority=INTERACTIVE)
     message = await event.respond(text, **kwargs)
     
     if deletion_timeout != -1:
@@ -84,6 +87,7 @@ async def send_message_and_delete(client, entity, text, delete_after_seconds=Non
     else:
         deletion_timeout = delete_after_seconds
     
+    await global_rate_limiter.get_token(SEND, client=client, chat_id=entity if isinstance(entity, (int, str)) else None, priority=INTERACTIVE)
     message = await client.send_message(entity, text, **kwargs)
     
     if deletion_timeout != -1:
@@ -110,6 +114,7 @@ async def async_delete_user_message(client, chat_id, message_id, seconds):
         await asyncio.sleep(seconds)
         
     try:
+        await global_rate_limiter.get_token(DELETE, client=client, chat_id=chat_id, priority=INTERACTIVE)
         await client.delete_messages(chat_id, message_id)
     except Exception as e:
         logger.error(f"删除用户消息失败: {e}")
@@ -5,7 +5,10 @@ import logging
 from telethon.tl.types import ChannelParticipantsAdmins
 from ai import get_ai_provider
 from enums.enums import ForwardMode
-from models.models import Chat, ForwardRule
+from sqlalchemy import exists
+from models.models import Chat, ForwardRule, ResolvedPeer
+from models.db_executor import run_in_session
+from managers.peer_cache_manager import peer_cache_manager
 import re
 import telethon
 from utils.auto_delete import respond_and_delete,reply_and_delete,async_delete_user_message
@@ -275,69 +278,72 @@ async def get_sender_info(event, rule_id):
         logger.error(f'获取发送者信息出错: {str(e)}')
         return None
 
-async def check_and_clean_chats(session, rule=None):
+# SQLite单条语句的参数数量有限，批量操作按该大小分批
+SQL_BATCH_SIZE = 500
+
+
+def clean_orphan_chats(session, chat_ids=None) -> list:
     """
-    检查并清理不再与任何规则关联的聊天记录
-    
+    在一个事务中删除不再被任何规则使用的聊天记录，并清除指向它们的current_add_id
+
     Args:
         session: 数据库会话
-        rule: 被删除的规则对象（可选），如果提供则从中获取聊天ID
+        chat_ids: 只检查这些聊天（chats表的ID），为None时检查全部聊天
+
+    Returns:
+        list: 被删除的聊天 (id, telegram_chat_id, name)
+    """
+    query = session.query(Chat.id, Chat.telegram_chat_id, Chat.name).filter(
+        ~exists().where(ForwardRule.source_chat_id == Chat.id),
+        ~exists().where(ForwardRule.target_chat_id == Chat.id)
+    )
+    if chat_ids is not None:
+        if not chat_ids:
+            return []
+        query = query.filter(Chat.id.in_(list(chat_ids)))
+    orphans = query.all()
+    if not orphans:
+        return []
+
+    for start in range(0, len(orphans), SQL_BATCH_SIZE):
+        batch = orphans[start:start + SQL_BATCH_SIZE]
+        ids = [chat.id for chat in batch]
+        session.query(Chat).filter(
+            Chat.current_add_id.in_([chat.telegram_chat_id for chat in batch])
+        ).update({Chat.current_add_id: None}, synchronize_session=False)
+        session.query(ResolvedPeer).filter(ResolvedPeer.chat_id.in_(ids)).delete(synchronize_session=False)
+        session.query(Chat).filter(Chat.id.in_(ids)).delete(synchronize_session=False)
+    session.commit()
+    return orphans
+
+
+async def check_and_clean_chats(rule=None):
+    """
+    检查并清理不再与任何规则关联的聊天记录，在数据库线程中执行
+    
+    Args:
+        rule: 被删除的规则对象（可选），如果提供则只检查该规则的源聊天和目标聊天
         
     Returns:
         int: 删除的聊天记录数量
     """
-    deleted_count = 0
-    
+    chat_ids = None
+    if rule:
+        chat_ids = {chat_id for chat_id in (rule.source_chat_id, rule.target_chat_id) if chat_id}
+
     try:
-        chat_ids_to_check = set()
-        
-        if rule:
-            if rule.source_chat_id:
-                chat_ids_to_check.add(rule.source_chat_id)
-            if rule.target_chat_id:
-                chat_ids_to_check.add(rule.target_chat_id)
-        else:
-            all_chats = session.query(Chat.id).all()
-            chat_ids_to_check = set(chat[0] for chat in all_chats)
-        
-        for chat_id in chat_ids_to_check:
-            as_source = session.query(ForwardRule).filter(
-                ForwardRule.source_chat_id == chat_id
-            ).count()
-            
-            as_target = session.query(ForwardRule).filter(
-                ForwardRule.target_chat_id == chat_id
-            ).count()
-            
-            if as_source == 0 and as_target == 0:
-                chat = session.query(Chat).get(chat_id)
-                if chat:
-                    telegram_chat_id = chat.telegram_chat_id
-                    name = chat.name or "未命名聊天"
-                    
-                    chats_using_this = session.query(Chat).filter(
-                        Chat.current_add_id == telegram_chat_id
-                    ).all()
-                    
-                    for other_chat in chats_using_this:
-                        other_chat.current_add_id = None
-                        logger.info(f'清除聊天 {other_chat.name} 的current_add_id设置')
-                    
-                    session.delete(chat)
-                    logger.info(f'删除未使用的聊天: {name} (ID: {telegram_chat_id})')
-                    deleted_count += 1
-        
-        if deleted_count > 0:
-            session.commit()
-            logger.info(f'共清理了 {deleted_count} 个未使用的聊天记录')
-        
-        return deleted_count
-        
+        orphans = await run_in_session(clean_orphan_chats, chat_ids)
     except Exception as e:
         logger.error(f'检查和清理聊天记录时出错: {str(e)}')
-        session.rollback()
         return 0
 
+    if orphans:
+        peer_cache_manager.forget_chats(chat.id for chat in orphans)
+        for chat in orphans:
+            logger.info(f'删除未使用的聊天: {chat.name or "未命名聊天"} (ID: {chat.telegram_chat_id})')
+        logger.info(f'共清理了 {len(orphans)} 个未使用的聊天记录')
+    return len(orphans)
+
 def get_admin_list():
     """获取管理员ID列表，如果ADMINS为空则使用USER_ID"""
     admin_str = os.getenv('ADMINS', '')
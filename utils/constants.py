@@ -16,6 +16,15 @@ RSS_MEDIA_BASE_URL = os.getenv('RSS_MEDIA_BASE_URL', '')
 
 RSS_ENABLED = os.getenv('RSS_ENABLED', 'false')
 
+# 渲染好的Feed缓存数量，按规则和基础URL缓存
+RSS_FEED_CACHE_SIZE = int(os.getenv('RSS_FEED_CACHE_SIZE', 256))
+
+# RSS条目写入方式：direct 直接写入共用的条目存储，http 通过RSS服务的HTTP接口写入
+RSS_INGEST_MODE = os.getenv('RSS_INGEST_MODE', 'direct').lower()
+# RSS条目写入失败时的重试次数和首次重试间隔（秒），之后每次间隔翻倍
+RSS_INGEST_RETRIES = int(os.getenv('RSS_INGEST_RETRIES', 3))
+RSS_INGEST_RETRY_DELAY = float(os.getenv('RSS_INGEST_RETRY_DELAY', 1))
+
 RULES_PER_PAGE = int(os.getenv('RULES_PER_PAGE', 20))
 
 PUSH_CHANNEL_PER_PAGE = int(os.getenv('PUSH_CHANNEL_PER_PAGE', 10))
@@ -37,6 +46,12 @@ DEFAULT_AI_MODEL = os.getenv('DEFAULT_AI_MODEL', 'gpt-4o')
 DEFAULT_SUMMARY_PROMPT = os.getenv('DEFAULT_SUMMARY_PROMPT', '请总结以下频道/群组24小时内的消息。')
 DEFAULT_AI_PROMPT = os.getenv('DEFAULT_AI_PROMPT', '请尊重原意，保持原有格式不变，用简体中文重写下面的内容：')
 
+# AI上传图片预处理：最长边像素（0表示不缩放）、JPEG质量、进程数、缓存数量
+AI_IMAGE_MAX_EDGE = int(os.getenv('AI_IMAGE_MAX_EDGE', 1568))
+AI_IMAGE_QUALITY = int(os.getenv('AI_IMAGE_QUALITY', 85))
+AI_IMAGE_WORKERS = int(os.getenv('AI_IMAGE_WORKERS', 2))
+AI_IMAGE_CACHE_SIZE = int(os.getenv('AI_IMAGE_CACHE_SIZE', 128))
+
 MODELS_PER_PAGE = int(os.getenv('AI_MODELS_PER_PAGE', 10))
 KEYWORDS_PER_PAGE = int(os.getenv('KEYWORDS_PER_PAGE', 50))
 
@@ -55,6 +70,69 @@ MEDIA_EXTENSIONS_COLS = int(os.getenv('MEDIA_EXTENSIONS_COLS', 6))
 LOG_MAX_SIZE_MB = 10
 LOG_BACKUP_COUNT = 3
 
+# 小于该大小（KB）的媒体文件直接下载到内存，0表示全部下载到磁盘
+MEDIA_MEMORY_THRESHOLD_KB = int(os.getenv('MEDIA_MEMORY_THRESHOLD_KB', 1024))
+
+# 临时文件定时清理间隔（秒），0表示只在启动时清理
+TEMP_SWEEP_INTERVAL = int(os.getenv('TEMP_SWEEP_INTERVAL', 600))
+# 未被引用的临时文件超过该时间（秒）后会被清理
+TEMP_FILE_MAX_AGE = int(os.getenv('TEMP_FILE_MAX_AGE', 3600))
+
+# 跨来源重复消息过滤：时间窗口（小时）、每个目标内存中保留的指纹数量、SimHash汉明距离阈值、近似比较的最小文本长度
+DEDUP_WINDOW_HOURS = float(os.getenv('DEDUP_WINDOW_HOURS', 24))
+DEDUP_MAX_ENTRIES = int(os.getenv('DEDUP_MAX_ENTRIES', 2000))
+DEDUP_HAMMING_DISTANCE = int(os.getenv('DEDUP_HAMMING_DISTANCE', 3))
+DEDUP_MIN_TEXT_LENGTH = int(os.getenv('DEDUP_MIN_TEXT_LENGTH', 20))
+
+# Telegram API速率限制，格式为 "突发容量,每秒令牌数"
+# 全局、每个客户端、每个客户端对每个目标聊天
+RATE_LIMIT_GLOBAL = os.getenv('RATE_LIMIT_GLOBAL', '30,20')
+RATE_LIMIT_CLIENT = os.getenv('RATE_LIMIT_CLIENT', '20,10')
+RATE_LIMIT_CHAT = os.getenv('RATE_LIMIT_CHAT', '3,1')
+# 每个客户端的方法类别：发送、下载、读取历史消息、编辑、删除
+RATE_LIMIT_SEND = os.getenv('RATE_LIMIT_SEND', '20,10')
+RATE_LIMIT_DOWNLOAD = os.getenv('RATE_LIMIT_DOWNLOAD', '10,5')
+RATE_LIMIT_HISTORY = os.getenv('RATE_LIMIT_HISTORY', '5,3')
+RATE_LIMIT_EDIT = os.getenv('RATE_LIMIT_EDIT', '10,5')
+RATE_LIMIT_DELETE = os.getenv('RATE_LIMIT_DELETE', '10,5')
+
+# 发送触发FloodWait后消息的最大重试次数
+FLOOD_RETRY_MAX_ATTEMPTS = int(os.getenv('FLOOD_RETRY_MAX_ATTEMPTS', 5))
+
+# 已发送的消息在发送队列中保留的时间（小时），期间同一条源消息不会被重复发送
+OUTBOX_RETENTION_HOURS = int(os.getenv('OUTBOX_RETENTION_HOURS', 48))
+# 发送队列中的消息发送失败的最大次数
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+
+# 用户模式合并转发的时间窗口（毫秒），窗口内同一源聊天发往同一目标的消息通过一次调用转发，0为不合并
+FORWARD_BATCH_WINDOW_MS = int(os.getenv('FORWARD_BATCH_WINDOW_MS', 300))
+# 单次合并转发的最大消息数量，达到后立即转发（不超过100）
+FORWARD_BATCH_MAX_SIZE = int(os.getenv('FORWARD_BATCH_MAX_SIZE', 100))
+
+# 启动时是否输出导入耗时分析（类似 python -X importtime），以及输出的模块数量
+IMPORT_PROFILE_ENABLED = os.getenv('IMPORT_PROFILE_ENABLED', 'true').lower() == 'true'
+IMPORT_PROFILE_TOP = int(os.getenv('IMPORT_PROFILE_TOP', 20))
+
+# 数据库连接地址，默认使用SQLite，也可以使用PostgreSQL等服务端数据库（需要安装对应的驱动）
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///./db/forward.db')
+# 服务端数据库的连接池大小和允许额外创建的连接数
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+# 服务端数据库连接的最长复用时间（秒），避免使用被服务器关闭的空闲连接
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+
+# 数据库线程池的线程数，同步的数据库查询在这些线程中执行，不阻塞事件循环
+DB_THREADS = int(os.getenv('DB_THREADS', 4))
+
+# 规则快照的最长缓存时间（秒），本进程内的修改立即生效，其他进程（如RSS服务）的修改在该时间后生效
+RULE_SNAPSHOT_TTL = int(os.getenv('RULE_SNAPSHOT_TTL', 300))
+
+# 每天更新聊天信息前是否清理不再被任何规则使用的聊天记录
+CHAT_CLEANUP_ENABLED = os.getenv('CHAT_CLEANUP_ENABLED', 'true').lower() == 'true'
+
+# /status 命令最多显示的令牌桶数量
+STATUS_MAX_BUCKETS = 20
+
 BOT_MESSAGE_DELETE_TIMEOUT = int(os.getenv("BOT_MESSAGE_DELETE_TIMEOUT", 300))
 
 USER_MESSAGE_DELETE_ENABLE = os.getenv("USER_MESSAGE_DELETE_ENABLE", "false")
@@ -0,0 +1,134 @@
+import asyncio
+import base64
+import io
+import logging
+import mimetypes
+from concurrent.futures import ProcessPoolExecutor
+from cachetools import LRUCache
+from utils.constants import AI_IMAGE_MAX_EDGE, AI_IMAGE_QUALITY, AI_IMAGE_WORKERS, AI_IMAGE_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def _prepare_image(source, mime_type, max_edge, quality):
+    """在子进程中解码、缩放、去除元数据并重新编码图片
+
+    Args:
+        source: 图片字节或文件路径
+        mime_type: 原始MIME类型，无法解码时原样使用
+        max_edge: 最长边像素，0表示不缩放
+        quality: JPEG质量
+
+    Returns:
+        dict: 包含base64编码数据和mime_type的字典
+    """
+    try:
+        from PIL import Image, ImageOps
+
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as image:
+            image = ImageOps.exif_transpose(image)
+            if max_edge > 0:
+                image.thumbnail((max_edge, max_edge))
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            output = io.BytesIO()
+            # 重新编码时不写入EXIF等元数据
+            image.save(output, format='JPEG', quality=quality, optimize=True)
+            data = output.getvalue()
+            mime_type = 'image/jpeg'
+    except Exception:
+        if isinstance(source, bytes):
+            data = source
+        else:
+            with open(source, 'rb') as f:
+                data = f.read()
+
+    return {
+        "data": base64.b64encode(data).decode('utf-8'),
+        "mime_type": mime_type
+    }
+
+
+def get_media_id(message):
+    """获取消息中媒体的唯一ID，用于缓存处理结果"""
+    if not message:
+        return None
+    photo = getattr(message, 'photo', None)
+    if photo:
+        return f"photo:{photo.id}"
+    document = getattr(message, 'document', None)
+    if document:
+        return f"document:{document.id}"
+    return None
+
+
+class ImageProcessor:
+    """
+    AI上传图片预处理器，在进程池中处理图片并按媒体ID缓存结果
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._cache = LRUCache(maxsize=max(AI_IMAGE_CACHE_SIZE, 1))
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=max(AI_IMAGE_WORKERS, 1))
+            logger.info(f"图片预处理进程池已创建，进程数: {max(AI_IMAGE_WORKERS, 1)}")
+        return self._executor
+
+    def get_cached(self, media_id):
+        """获取缓存的处理结果"""
+        if media_id is None or AI_IMAGE_CACHE_SIZE <= 0:
+            return None
+        return self._cache.get(media_id)
+
+    async def prepare(self, source, mime_type=None, name=None, media_id=None):
+        """预处理一张图片
+
+        Args:
+            source: 图片字节或文件路径
+            mime_type: 原始MIME类型
+            name: 文件名，用于推断MIME类型
+            media_id: 媒体ID，用于缓存
+
+        Returns:
+            dict: 包含base64编码数据和mime_type的字典
+        """
+        cached = self.get_cached(media_id)
+        if cached:
+            logger.info(f"使用缓存的图片处理结果: {media_id}")
+            return cached
+
+        if not mime_type:
+            mime_type = mimetypes.guess_type(name or (source if isinstance(source, str) else ''))[0] or "image/jpeg"
+
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self._get_executor(),
+            _prepare_image,
+            source,
+            mime_type,
+            AI_IMAGE_MAX_EDGE,
+            AI_IMAGE_QUALITY
+        )
+
+        if media_id is not None and AI_IMAGE_CACHE_SIZE > 0:
+            self._cache[media_id] = result
+        return result
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("图片预处理进程池已关闭")
+
+
+image_processor = ImageProcessor()
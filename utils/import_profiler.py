@@ -0,0 +1,98 @@
+import importlib.abc
+import logging
+import sys
+import time
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _ProfiledLoader(importlib.abc.Loader):
+    """记录模块执行耗时的加载器代理，执行完成后还原为原加载器"""
+
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        spec = module.__spec__
+        self._profiler._enter()
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(spec.name, time.perf_counter() - start)
+            spec.loader = self._loader
+            module.__loader__ = self._loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """
+    导入耗时分析器，效果类似 python -X importtime
+
+    安装后记录之后导入的每个模块的累计耗时（包括其导入的子模块）和自身耗时，
+    启动完成后输出最慢的模块，用于排查冷启动时间。只用于启动阶段的单线程导入。
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, Tuple[float, float]] = {}
+        self._child_time: List[float] = []
+        self._finding = False
+        self.total = 0.0
+
+    def find_spec(self, fullname, path, target=None):
+        if self._finding:
+            return None
+        self._finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                        spec.loader = _ProfiledLoader(spec.loader, self)
+                    return spec
+            return None
+        finally:
+            self._finding = False
+
+    def _enter(self) -> None:
+        self._child_time.append(0.0)
+
+    def _exit(self, name: str, elapsed: float) -> None:
+        children = self._child_time.pop()
+        self.timings[name] = (elapsed, elapsed - children)
+        if self._child_time:
+            self._child_time[-1] += elapsed
+        else:
+            self.total += elapsed
+
+    def install(self) -> None:
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def report(self, top: int = 20) -> None:
+        """输出累计耗时最长的模块，并停止记录"""
+        self.uninstall()
+        if not self.timings:
+            return
+        lines = [f"导入耗时分析: 共导入 {len(self.timings)} 个模块，耗时 {self.total * 1000:.0f} ms"]
+        lines.append(f"{'累计(ms)':>10} {'自身(ms)':>10}  模块")
+        slowest = sorted(self.timings.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        for name, (cumulative, own) in slowest:
+            lines.append(f"{cumulative * 1000:>10.1f} {own * 1000:>10.1f}  {name}")
+        logger.info('\n'.join(lines))
+
+
+import_profiler = ImportProfiler()
@@ -1,5 +1,7 @@
+import io
 import logging
 import os
+from utils.constants import TEMP_DIR, MEDIA_MEMORY_THRESHOLD_KB
 
 logger = logging.getLogger(__name__)
 
@@ -30,4 +32,63 @@ async def get_max_media_size():
     if not max_media_size_str:
         logger.error('未设置 MAX_MEDIA_SIZE 环境变量')
         raise ValueError('必须在 .env 文件中设置 MAX_MEDIA_SIZE')
-    return float(max_media_size_str) * 1024 * 1024  # 转换为字节，支持小数
\ No newline at end of file
+    return float(max_media_size_str) * 1024 * 1024  # 转换为字节，支持小数
+
+def is_memory_file(file):
+    """判断媒体文件是否为内存缓冲区"""
+    return isinstance(file, io.BytesIO)
+
+def get_media_file_name(file):
+    """获取媒体文件名（磁盘路径或内存缓冲区）"""
+    if is_memory_file(file):
+        return getattr(file, 'name', '') or ''
+    return os.path.basename(str(file))
+
+def rewind_media_file(file):
+    """将内存缓冲区的读取位置重置到开头，磁盘文件原样返回"""
+    if is_memory_file(file):
+        file.seek(0)
+    return file
+
+def media_file_exists(file):
+    """判断媒体文件是否仍然可用"""
+    if is_memory_file(file):
+        return not file.closed
+    return os.path.exists(str(file))
+
+def _get_memory_file_name(message):
+    """为下载到内存的媒体生成文件名，便于发送时推断媒体类型"""
+    file = getattr(message, 'file', None)
+    name = getattr(file, 'name', None) if file else None
+    if name:
+        return name
+    ext = (getattr(file, 'ext', None) if file else None) or ''
+    prefix = 'photo' if getattr(message, 'photo', None) else 'media'
+    return f'{prefix}_{message.id}{ext}'
+
+async def download_media_file(message, directory=None):
+    """下载媒体文件，小于阈值的文件下载到内存，其余下载到磁盘
+
+    Args:
+        message: 消息对象
+        directory: 磁盘下载目录，默认为临时目录
+
+    Returns:
+        str | io.BytesIO | None: 文件路径或带有name属性的内存缓冲区
+    """
+    if not message or not message.media:
+        return None
+
+    threshold = MEDIA_MEMORY_THRESHOLD_KB * 1024
+    size = await get_media_size(message.media)
+    if threshold > 0 and 0 < size <= threshold:
+        buffer = io.BytesIO()
+        result = await message.download_media(file=buffer)
+        if result is None:
+            return None
+        buffer.name = _get_memory_file_name(message)
+        buffer.seek(0)
+        logger.info(f'媒体文件已下载到内存: {buffer.name}, 大小: {size // 1024} KB')
+        return buffer
+
+    return await message.download_media(directory or TEMP_DIR)